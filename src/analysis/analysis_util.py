@@ -6,7 +6,7 @@ from collections import defaultdict, Counter
 from scipy.stats import chi2_contingency
 from sklearn.linear_model import LogisticRegression
 
-from helpers import io
+from helpers import io, validation
 from . import analysis_constants
 from . import visualization_util
 
@@ -404,41 +404,16 @@ def check_datasummary_in_constants(rows, all_constants):
 
     If not, it will print out the missing values, and which data collections they came from.
     """
-    CREATOR_TO_COUNTRY = {v: k for k, vs in all_constants["CREATOR_COUNTRY_GROUPS"].items() for v in vs}
-    CREATOR_TO_GROUP = {v: k for k, vs in all_constants["CREATOR_GROUPS"].items() for v in vs}
-    TASK_TO_GROUP = {v: k for k, vs in all_constants["TASK_GROUPS"].items() for v in vs}
-    LANG_TO_GROUP = {v: k for k, vs in all_constants["LANGUAGE_GROUPS"].items() for v in vs}
-    SOURCE_TO_GROUP = {v: k for k, vs in all_constants["DOMAIN_GROUPS"].items() for v in vs}
-    LICENSE_CLASSES = list(all_constants["LICENSE_CLASSES"].keys()) + list(all_constants["CUSTOM_LICENSE_CLASSES"].keys())
-
-    def check_entities(collection_id, vals, const_map, miss_dict):
-        for v in vals:
-            if v not in const_map:
-                miss_dict[v].add(collection_id)
-                
+    missing = validation.find_missing_values(rows, all_constants)
     # Category --> missing entry --> list of Collection IDs where this comes from.
-    missing_metadata = defaultdict(lambda: defaultdict(set))
-    for row in rows:
-
-        row_licenses = [lic["License URL"] if lic["License"] == "Custom" else lic["License"] for lic in row["Licenses"]]
-        check_entities(row["Collection"], row_licenses, 
-                       LICENSE_CLASSES, missing_metadata["License Classes"])
-
-        check_entities(row["Collection"], row.get("Creators", []), 
-                       CREATOR_TO_GROUP, missing_metadata["Creator Groups"])
-
-        check_entities(row["Collection"], row.get("Creators", []), 
-                       CREATOR_TO_COUNTRY, missing_metadata["Creator Countries"])
-
-        check_entities(row["Collection"], row.get("Task Categories", []), 
-                       TASK_TO_GROUP, missing_metadata["Task Categories"])
-
-        check_entities(row["Collection"], row.get("Text Sources", []), 
-                       SOURCE_TO_GROUP, missing_metadata["Text Sources"])
-
-        check_entities(row["Collection"], row.get("Languages", []), 
-                       LANG_TO_GROUP, missing_metadata["Languages"])
-        
+    missing_metadata = {
+        "License Classes": {**missing["Licenses"], **missing["Custom Licenses"]},
+        "Creator Groups": missing["Creators"],
+        "Creator Countries": missing["Creator Countries"],
+        "Task Categories": missing["Task Categories"],
+        "Text Sources": missing["Text Sources"],
+        "Languages": missing["Languages"],
+    }
     for category, missing_info in missing_metadata.items():
         if len(missing_info) == 0:
             print(f"No missing info for {category}!")
@@ -461,11 +436,11 @@ def extract_info(rows, all_constants):
 
         The value can be a list (e.g. tasks/sources/creators), float (e.g. num exs), or string (license class)
     """
-    CREATOR_TO_COUNTRY = {v: k for k, vs in all_constants["CREATOR_COUNTRY_GROUPS"].items() for v in vs}
-    CREATOR_TO_GROUP = {v: k for k, vs in all_constants["CREATOR_GROUPS"].items() for v in vs}
-    TASK_TO_GROUP = {v: k for k, vs in all_constants["TASK_GROUPS"].items() for v in vs}
-    LANG_TO_GROUP = {v: k for k, vs in all_constants["LANGUAGE_GROUPS"].items() for v in vs}
-    SOURCE_TO_GROUP = {v: k for k, vs in all_constants["DOMAIN_GROUPS"].items() for v in vs}
+    CREATOR_TO_COUNTRY = io.invert_constants(all_constants, "CREATOR_COUNTRY_GROUPS")
+    CREATOR_TO_GROUP = io.invert_constants(all_constants, "CREATOR_GROUPS")
+    TASK_TO_GROUP = io.invert_constants(all_constants, "TASK_GROUPS")
+    LANG_TO_GROUP = io.invert_constants(all_constants, "LANGUAGE_GROUPS")
+    SOURCE_TO_GROUP = io.invert_constants(all_constants, "DOMAIN_GROUPS")
 
     # {dataset_uid --> {attribute --> value}}
     dataset_infos = {}
@@ -69,17 +69,13 @@ def classify_and_resolve_licenses(
     license_infos: typing.List[typing.Tuple[str, str]],
     all_constants: typing.Dict[str, typing.Dict[str, typing.List[str]]]
 ) -> typing.List[str]:
-    """Function taken from `text_ft_plots.ipynb`"""
-    classified_licenses = []
-    for (license_name, license_url) in license_infos:
-        # Classify an individual license
-        classifications = filters.classify_license(
-            license_name, license_url, all_constants)
-        classified_licenses.append(classifications)
+    """Function taken from `text_ft_plots.ipynb`
 
-    # By default, multiple licenses yield to the most restrictive one
-    resolved_criteria = filters.resolve_multiple_licenses(classified_licenses)
-    return resolved_criteria
+    Classifies each license, then yields to the most restrictive one (by default).
+    Uses the same license cache as `filters.map_license_criteria`, so license
+    combinations already resolved for the text datasets are not resolved again.
+    """
+    return filters.get_license_resolver(all_constants).resolve(license_infos)
 
 
 def add_license_classes_to_summaries(
@@ -375,14 +371,12 @@ def prep_summaries_for_visualization(
         "commercial": "Commercial"
     }
 ):
-    license_paraphrases = invert_dict_of_lists(
-        all_constants["LICENSE_PARAPHRASES"])
-    creator_groupmap = invert_dict_of_lists(all_constants["CREATOR_GROUPS"])
-    creator_countrymap = invert_dict_of_lists(
-        all_constants["CREATOR_COUNTRY_GROUPS"])
-    domain_groupmap = invert_dict_of_lists(all_constants["DOMAIN_GROUPS"])
-    domain_typemap = invert_dict_of_lists(all_constants["DOMAIN_TYPES"])
-    lang_typmap = invert_dict_of_lists(all_constants["LANGUAGE_GROUPS"])
+    license_paraphrases = io.invert_constants(all_constants, "LICENSE_PARAPHRASES")
+    creator_groupmap = io.invert_constants(all_constants, "CREATOR_GROUPS")
+    creator_countrymap = io.invert_constants(all_constants, "CREATOR_COUNTRY_GROUPS")
+    domain_groupmap = io.invert_constants(all_constants, "DOMAIN_GROUPS")
+    domain_typemap = io.invert_constants(all_constants, "DOMAIN_TYPES")
+    lang_typmap = io.invert_constants(all_constants, "LANGUAGE_GROUPS")
 
     text_summaries = filters.map_license_criteria(
         remap_licenses_with_paraphrases(
@@ -2621,7 +2615,7 @@ def prepare_speech_for_gini(df):
 
 
 def prep_text_for_lang_gini(df, all_constants):
-    LANG_GROUP_MAPPER = invert_dict_of_lists(all_constants["LANGUAGE_GROUPS"])
+    LANG_GROUP_MAPPER = io.invert_constants(all_constants, "LANGUAGE_GROUPS")
     # [["Year Released", "Total Tokens", "Languages", "Language Families"]]
     df_text = df[df["Modality"] == "Text"]
 
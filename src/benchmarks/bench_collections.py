@@ -0,0 +1,384 @@
+"""
+# usage (within repo root):
+python src/benchmarks/bench_collections.py record --synthetic
+python src/benchmarks/bench_collections.py run --results collections.json
+python src/benchmarks/bench_collections.py run --baseline collections.json --max-slowdown 1.2
+
+Measures each collection's pipeline in `collection_mapper.COLLECTION_FN_MAPPER` offline, over a small fixture per collection:
+    record: samples `--fixture-rows` rows of each collection's data into `--fixture-dir`, with every filter ID of
+        the collection accepted. Where the collection's `download_function` loads its data with `load_dataset`,
+        a sample of each dataset it loads is saved (as Arrow, with its features), so the replay still runs
+        the `download_function` and its filtering. Otherwise, a sample of what the `download_function` returns
+        is saved (as Arrow, or jsonlines). Recording downloads each collection in full.
+        With `--synthetic`, nothing is downloaded: collections with a `prepare_spec` get rows generated from
+        their spec instead, with texts of the mean lengths in the collection's `Text Metrics`.
+    run: replays each fixture through `Downloader.run_and_save` (downloader-side filtering, preparer, parent
+        normalization, reformatting and writer), in a separate process per collection, with downloads offline.
+        Reports rows/sec (fixture rows, fastest of `--repeats`), the peak RSS of the collection's process
+        (not of its worker pool) and the bytes written, and saves them as json with `--results`.
+        With `--baseline` (a previous `--results` file), exits with an error if any collection's rows/sec
+        dropped by more than the `--max-slowdown` factor.
+"""
+
+import argparse
+import itertools as it
+import json
+import multiprocessing
+import os
+import random
+import re
+import resource
+import sys
+import tempfile
+import time
+import traceback
+from unittest import mock
+
+sys.path.append("src/")
+import pyarrow as pa
+from datasets import Dataset, DatasetDict
+
+import downloaders
+from collection_mapper import COLLECTION_FN_MAPPER
+from downloader import Downloader, output_path
+from download_and_filter import get_collection_to_uid_and_filter_ids
+from helpers import io, download_cache
+
+
+# `load_dataset` arguments that do not change the data loaded, left out of the fixture keys.
+IGNORED_LOAD_ARGS = {"num_proc", "token", "trust_remote_code"}
+# Other ways `downloaders` fetches data. Collections that use any of them have their `download_function` output recorded instead.
+OTHER_SOURCES = [
+    (download_cache, "request"),
+    (download_cache, "hf_hub_download"),
+    (downloaders, "HfFileSystem"),
+    (downloaders.pd, "read_csv"),
+]
+# Words of the synthetic texts, and their mean length with a space.
+WORDS = ["the", "a", "of", "to", "and", "in", "is", "model", "data", "answer", "question", "because", "which", "example"]
+MEAN_WORD_LENGTH = sum(len(word) + 1 for word in WORDS) / len(WORDS)
+
+
+def slugify(name):
+    return re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-")
+
+
+def load_call_key(args, kwargs):
+    """Identifies a `load_dataset` call by the arguments that select its data."""
+    kwargs = {key: value for key, value in sorted(kwargs.items()) if key not in IGNORED_LOAD_ARGS}
+    return json.dumps([list(args), kwargs], default=str)
+
+
+def save_dataset(dset, path):
+    """Saves a Hugging Face Dataset as an Arrow stream file, with its features, for `Dataset.from_file`."""
+    table = dset.flatten_indices(keep_in_memory=True).data.table
+    with pa.OSFile(path, "wb") as sink, pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+
+
+def sample_rows(dset, num_rows, rng, contiguous):
+    """Samples `num_rows` rows uniformly, or the first ones if `contiguous` (so e.g. dialog trees stay whole)."""
+    if not contiguous:
+        return Downloader("fixture", None, None, {})._sample_rows(dset, num_rows, rng)
+    if isinstance(dset, Dataset):
+        return dset.select(range(min(num_rows, len(dset))))
+    return list(it.islice(dset, num_rows))
+
+
+def get_text_lengths(catalog):
+    """{collection --> (mean inputs length, mean targets length)} in characters, weighted by each dataset's dialogs."""
+    totals = {}
+    for collection, metrics in zip(catalog["Collection"], catalog["Text Metrics"]):
+        metrics = metrics if isinstance(metrics, dict) else {}
+        num_dialogs = metrics.get("Num Dialogs") or 0
+        total = totals.setdefault(collection, [0, 0.0, 0.0])
+        total[0] += num_dialogs
+        total[1] += num_dialogs * (metrics.get("Mean Inputs Length") or 0)
+        total[2] += num_dialogs * (metrics.get("Mean Targets Length") or 0)
+    return {collection: (inputs / n, targets / n) for collection, (n, inputs, targets) in totals.items() if n}
+
+
+def random_text(rng, mean_length):
+    """Random words, of between half and one and a half times `mean_length` characters on average."""
+    num_words = int(rng.uniform(0.5, 1.5) * mean_length / MEAN_WORD_LENGTH)
+    return " ".join(rng.choices(WORDS, k=max(num_words, 1)))
+
+
+def set_path(row, path, value):
+    """Sets `row[path[0]][path[1]]... = value`, creating the lists and dicts on the way."""
+    for key, next_key in zip(path, path[1:]):
+        default = [] if isinstance(next_key, int) else {}
+        if isinstance(key, int):
+            while len(row) <= key:
+                row.append(type(default)())
+            row = row[key]
+        else:
+            row = row.setdefault(key, default)
+    row[path[-1]] = value
+
+
+def synthetic_rows(spec, filter_ids, text_lengths, num_rows, rng):
+    """Rows with every field the `prepare_spec` reads: texts of about the collection's mean lengths,
+    and parents from the collection's filter IDs."""
+    text_paths = []
+    for text_spec, mean_length in zip([spec.inputs, spec.targets], text_lengths):
+        paths = [path for part in text_spec.parts for _, path in part if path]
+        text_paths.extend((path, mean_length / len(paths)) for path in paths)
+    parent_paths = [path for _, path in spec.parent if path]
+    rows = []
+    for _ in range(num_rows):
+        row = {}
+        for path, mean_length in text_paths:
+            set_path(row, path, random_text(rng, mean_length))
+        for path in parent_paths:
+            set_path(row, path, rng.choice(filter_ids))
+        rows.append(row)
+    return rows
+
+
+def save_output_fixture(rows, fixture_dir):
+    """Saves a `download_function` output sample, returning its file name."""
+    if isinstance(rows, Dataset):
+        save_dataset(rows, os.path.join(fixture_dir, "output.arrow"))
+        return "output.arrow"
+    io.write_jsonl(rows, os.path.join(fixture_dir, "output.jsonl"))
+    return "output.jsonl"
+
+
+def record_collection(collection, uid_task_keys, fixture_dir, args, rng):
+    """Downloads a collection, saving a fixture of a sample of its data, see the usage above."""
+    fns = COLLECTION_FN_MAPPER[collection]
+    contiguous = fns.get("custom_prepare", False)
+    flat_task_keys = [tk for tks in uid_task_keys.values() for tk in tks]
+    loads, other_sources = {}, []
+    real_load_dataset = downloaders.load_dataset
+
+    def recording_load_dataset(*load_args, **load_kwargs):
+        dset = real_load_dataset(*load_args, **load_kwargs)
+        splits = dset if isinstance(dset, DatasetDict) else {None: dset}
+        sampled = {split: sample_rows(split_dset, args.fixture_rows, rng, contiguous) for split, split_dset in splits.items()}
+        files = {}
+        for split, split_dset in sampled.items():
+            files[split or ""] = f"load-{len(loads)}-{slugify(split or 'dataset')}.arrow"
+            save_dataset(split_dset, os.path.join(fixture_dir, files[split or ""]))
+        loads[load_call_key(load_args, load_kwargs)] = {"files": files, "rows": sum(map(len, sampled.values()))}
+        return DatasetDict(sampled) if isinstance(dset, DatasetDict) else sampled[None]
+
+    def recording_source(source, name):
+        fn = getattr(source, name)
+
+        def wrapper(*fn_args, **fn_kwargs):
+            other_sources.append(name)
+            return fn(*fn_args, **fn_kwargs)
+        return mock.patch.object(source, name, wrapper)
+
+    os.makedirs(fixture_dir, exist_ok=True)
+    patches = [mock.patch.object(downloaders, "load_dataset", recording_load_dataset)]
+    patches += [recording_source(source, name) for source, name in OTHER_SOURCES]
+    for patch in patches:
+        patch.start()
+    try:
+        # Generators download as they are consumed, so sample the output while recording.
+        output = sample_rows(fns["download_function"](flat_task_keys), args.fixture_rows, rng, contiguous)
+    finally:
+        for patch in patches:
+            patch.stop()
+
+    fixture = {"collection": collection, "uid_task_keys": uid_task_keys}
+    if loads and not other_sources:
+        fixture.update({"source": "load_dataset", "loads": loads, "rows": sum(load["rows"] for load in loads.values())})
+    else:
+        fixture.update({"source": "output", "output": save_output_fixture(output, fixture_dir), "rows": len(output)})
+    io.write_json(fixture, os.path.join(fixture_dir, "fixture.json"))
+    return fixture
+
+
+def record_synthetic(collection, uid_task_keys, fixture_dir, text_lengths, args, rng):
+    """Saves a fixture of rows generated from the collection's `prepare_spec`."""
+    spec = COLLECTION_FN_MAPPER[collection]["prepare_spec"]
+    flat_task_keys = [tk for tks in uid_task_keys.values() for tk in tks]
+    rows = synthetic_rows(spec, flat_task_keys, text_lengths, args.fixture_rows, rng)
+    os.makedirs(fixture_dir, exist_ok=True)
+    fixture = {
+        "collection": collection, "uid_task_keys": uid_task_keys, "source": "synthetic",
+        "output": save_output_fixture(rows, fixture_dir), "rows": len(rows),
+    }
+    io.write_json(fixture, os.path.join(fixture_dir, "fixture.json"))
+    return fixture
+
+
+def record(args):
+    catalog = io.load_catalog("data_summaries/", "constants/")
+    collection_to_keys = get_collection_to_uid_and_filter_ids(catalog)
+    text_lengths = get_text_lengths(catalog)
+    rng = random.Random(args.seed)
+    for collection in select_collections(args, collection_to_keys):
+        fixture_dir = os.path.join(args.fixture_dir, slugify(collection))
+        if args.synthetic:
+            if COLLECTION_FN_MAPPER[collection].get("prepare_spec") is None:
+                continue
+            lengths = text_lengths.get(collection, (args.text_length, args.text_length))
+            fixture = record_synthetic(collection, collection_to_keys[collection], fixture_dir, lengths, args, rng)
+        else:
+            try:
+                fixture = record_collection(collection, collection_to_keys[collection], fixture_dir, args, rng)
+            except Exception:
+                print(f"{collection} -- Failed to record:\n{traceback.format_exc()}")
+                continue
+        print(f"{collection} -- Recorded {fixture['rows']} rows ({fixture['source']}) to {fixture_dir}")
+
+
+def select_collections(args, collection_to_keys):
+    """The collections in both the catalog and `COLLECTION_FN_MAPPER`, or those in `--collections`."""
+    collections = [collection for collection in collection_to_keys if collection in COLLECTION_FN_MAPPER]
+    if args.collections:
+        missing = set(args.collections) - set(collections)
+        assert not missing, f"Unknown collections: {sorted(missing)}"
+        collections = [collection for collection in collections if collection in args.collections]
+    return collections
+
+
+def load_fixture_file(path):
+    return Dataset.from_file(path) if path.endswith(".arrow") else io.read_jsonl(path)
+
+
+def fixture_download_function(fixture, fixture_dir):
+    """Returns a `download_function` serving the fixture: the collection's own, with `load_dataset`
+    serving the recorded datasets, or one returning the recorded (or synthetic) rows."""
+    if fixture["source"] != "load_dataset":
+        rows = load_fixture_file(os.path.join(fixture_dir, fixture["output"]))
+        return lambda accepted_filter_ids: rows
+
+    datasets_by_call = {}
+    for key, load in fixture["loads"].items():
+        splits = {split: load_fixture_file(os.path.join(fixture_dir, fp)) for split, fp in load["files"].items()}
+        datasets_by_call[key] = splits[""] if "" in splits else DatasetDict(splits)
+
+    def replay_load_dataset(*load_args, **load_kwargs):
+        key = load_call_key(load_args, load_kwargs)
+        if key not in datasets_by_call:
+            raise KeyError(f"The fixture has no dataset for `load_dataset` with {key}, record it again.")
+        return datasets_by_call[key]
+
+    download_fn = COLLECTION_FN_MAPPER[fixture["collection"]]["download_function"]
+
+    def replay(accepted_filter_ids):
+        with mock.patch.object(downloaders, "load_dataset", replay_load_dataset):
+            # Consumed here, as generators load their data as they are iterated.
+            dset = download_fn(accepted_filter_ids)
+            return dset if isinstance(dset, (list, Dataset)) else list(dset)
+    return replay
+
+
+def replay_collection(fixture, fixture_dir, args, conn):
+    """Runs a collection's fixture through `Downloader.run_and_save`, sending its results on `conn`."""
+    collection = fixture["collection"]
+    result = {"Collection": collection, "Source": fixture["source"], "Status": "ok", "Rows": fixture["rows"]}
+    try:
+        download_cache.set_offline(True)
+        flat_task_keys = [tk for tks in fixture["uid_task_keys"].values() for tk in tks]
+        times = []
+        with tempfile.TemporaryDirectory() as savedir:
+            for _ in range(args.repeats):
+                # Loaded again for each run (untimed), as some download and prepare functions modify the rows.
+                downloader_args = dict(COLLECTION_FN_MAPPER[collection], uid_key_mapper=fixture["uid_task_keys"])
+                downloader_args["download_function"] = fixture_download_function(fixture, fixture_dir)
+                downloader = Downloader(name=collection, **downloader_args)
+                start = time.perf_counter()
+                num_rows = downloader.run_and_save(
+                    flat_task_keys, savedir, reformat=args.output_format, debug=args.debug, chunk_size=args.chunk_size)
+                times.append(time.perf_counter() - start)
+            num_bytes = os.path.getsize(output_path(savedir, collection, args.output_format))
+        result.update({
+            "Rows Written": num_rows,
+            "Time (s)": round(min(times), 4),
+            "Rows/s": round(fixture["rows"] / min(times), 1),
+            # Kilobytes on Linux.
+            "Peak RSS (MB)": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "Bytes": num_bytes,
+        })
+    except Exception:
+        result.update({"Status": "failed", "Error": traceback.format_exc(limit=-3)})
+    conn.send(result)
+
+
+def run_in_process(fixture, fixture_dir, args):
+    """Replays a fixture in a new process, so each collection's peak RSS is its own."""
+    context = multiprocessing.get_context("fork")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=replay_collection, args=(fixture, fixture_dir, args, sender))
+    process.start()
+    if receiver.poll(args.timeout):
+        result = receiver.recv()
+    else:
+        process.terminate()
+        result = {"Collection": fixture["collection"], "Source": fixture["source"], "Status": "timeout", "Rows": fixture["rows"]}
+    process.join()
+    return result
+
+
+def print_results(results):
+    print(f"{'Collection':<45}{'Source':<14}{'Status':<9}{'Rows':>8}{'Rows/s':>12}{'Peak RSS (MB)':>15}{'Bytes':>12}{'Slowdown':>10}")
+    for result in results:
+        slowdown = f"{result['Slowdown']:.2f}x" if "Slowdown" in result else ""
+        if result["Status"] != "ok":
+            print(f"{result['Collection'][:44]:<45}{result['Source']:<14}{result['Status']:<9}{result['Rows']:>8}")
+            continue
+        print(
+            f"{result['Collection'][:44]:<45}{result['Source']:<14}{result['Status']:<9}{result['Rows']:>8}"
+            f"{result['Rows/s']:>12,.0f}{result['Peak RSS (MB)']:>15,.1f}{result['Bytes']:>12,}{slowdown:>10}")
+
+
+def run(args):
+    fixtures = []
+    for name in sorted(os.listdir(args.fixture_dir)):
+        fixture_fp = os.path.join(args.fixture_dir, name, "fixture.json")
+        if os.path.exists(fixture_fp):
+            fixture = io.read_json(fixture_fp)
+            if not args.collections or fixture["collection"] in args.collections:
+                fixtures.append((fixture, os.path.dirname(fixture_fp)))
+    assert fixtures, f"No fixtures in {args.fixture_dir}, see `record`."
+
+    results = [run_in_process(fixture, fixture_dir, args) for fixture, fixture_dir in fixtures]
+    regressions = []
+    if args.baseline:
+        baseline = {result["Collection"]: result for result in io.read_json(args.baseline)}
+        for result in results:
+            previous = baseline.get(result["Collection"], {})
+            if result["Status"] == "ok" and previous.get("Status") == "ok":
+                result["Slowdown"] = previous["Rows/s"] / result["Rows/s"]
+                if result["Slowdown"] > args.max_slowdown:
+                    regressions.append(result["Collection"])
+    print_results(results)
+    for result in results:
+        if "Error" in result:
+            print(f"{result['Collection']} -- Failed:\n{result['Error']}")
+    if args.results:
+        io.write_json(results, args.results)
+        print(f"Saved the results to {args.results}")
+    if regressions:
+        sys.exit(f"Slower than the baseline by more than {args.max_slowdown}x: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark each collection's pipeline offline, over recorded fixtures.")
+    parser.add_argument("command", choices=["record", "run"])
+    parser.add_argument("--fixture-dir", default="src/benchmarks/fixtures", help="Directory of the fixtures, one per collection.")
+    parser.add_argument("--collections", nargs="+", default=None, help="Only these collections (default: all).")
+    parser.add_argument("--fixture-rows", default=2000, type=int, help="record: Rows sampled from each dataset loaded.")
+    parser.add_argument("--synthetic", action="store_true", help="record: Generate rows for collections with a `prepare_spec`, without downloading.")
+    parser.add_argument("--text-length", default=500, type=int, help="record: Mean text length of synthetic rows, for collections without `Text Metrics`.")
+    parser.add_argument("--seed", default=0, type=int, help="record: Random seed for the samples and synthetic rows.")
+    parser.add_argument("--output-format", default="messages", help="run: The `--output-format` to save in.")
+    parser.add_argument("--chunk-size", default=None, type=int, help="run: The `--chunk-size` to stream with.")
+    parser.add_argument("--debug", action="store_true", help="run: Prepare rows in-process, rather than on the worker pool.")
+    parser.add_argument("--repeats", default=3, type=int, help="run: Timings per collection; the fastest is reported.")
+    parser.add_argument("--timeout", default=600, type=float, help="run: Seconds before a collection is stopped.")
+    parser.add_argument("--results", default=None, help="run: Json file to save the results table to.")
+    parser.add_argument("--baseline", default=None, help="run: A previous `--results` file to compare rows/sec against.")
+    parser.add_argument("--max-slowdown", default=1.2, type=float, help="run: With `--baseline`, fail if a collection's rows/sec drops by this factor.")
+    args = parser.parse_args()
+    if args.command == "record":
+        record(args)
+    else:
+        run(args)
@@ -0,0 +1,105 @@
+"""
+# usage (within repo root):
+python src/benchmarks/bench_output_formats.py --num-dialogs 100000
+
+Compares the gzipped jsonlines output (`--output-format messages` / `supervised`) against the Parquet output
+(`messages-parquet` / `supervised-parquet`) on synthetic dialogs from 20 datasets, in chunks as with `--chunk-size`:
+    write: serializing and saving every chunk (`io.write_jsonl_chunks` vs. `io.write_parquet_chunks`),
+    read: loading every row back as Python objects (`io.read_jsonl` vs. `io.read_parquet` + `io.parquet_to_rows`),
+    read table: loading the Parquet file as an Arrow table, as columnar jobs would,
+    one dataset: the rows of a single dataset UID (filtering every row vs. skipping row groups),
+    one column: only the `dataset` column (all of it parsed vs. column projection).
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append("src/")
+from helpers import io
+from downloader import reformat_supervised_dialog
+
+
+WORDS = [f"w{i}" for i in range(5000)]
+
+
+def text(rng, num_words):
+    return " ".join(rng.choices(WORDS, k=num_words))
+
+
+def dialogs_for_dataset(rng, dataset, num_dialogs):
+    """Multi-turn chats, some with a second, scored response to the first prompt."""
+    dialogs = []
+    for _ in range(num_dialogs):
+        num_turns = rng.choice([2, 2, 4, 6])
+        dialog = [{"from": "user", "text": text(rng, rng.randint(10, 80)), "parent": dataset}]
+        for i in range(1, num_turns):
+            dialog.append({"from": "assistant" if i % 2 else "user", "text": text(rng, rng.randint(20, 200)), "parent": i - 1})
+        if rng.random() < 0.2:
+            dialog.append({"from": "assistant", "text": text(rng, 50), "parent": 0, "score": rng.choice([0.0, 1.0])})
+        dialogs.append(dialog)
+    return dialogs
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def report(name, elapsed, num_rows, num_bytes=None):
+    size = f"{num_bytes / 1e6:>10.1f} MB" if num_bytes is not None else ""
+    print(f"  {name:<28}{elapsed:>8.2f}s{num_rows / elapsed:>14,.0f} rows/s{size}")
+
+
+def chunked(rows, chunk_size):
+    return (rows[i:i + chunk_size] for i in range(0, len(rows), chunk_size))
+
+
+def main(args):
+    rng = random.Random(0)
+    datasets = [f"dataset-{i}" for i in range(20)]
+    # Collections are mostly prepared dataset by dataset, so consecutive rows share their dataset.
+    dialogs = [d for dataset in datasets for d in dialogs_for_dataset(rng, dataset, args.num_dialogs // len(datasets))]
+    pairs = [pair for dialog in dialogs for pair in reformat_supervised_dialog(dialog)]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for row_format, rows in [("messages", dialogs), ("supervised", pairs)]:
+            print(f"{row_format}: {len(rows):,} rows")
+            jsonl_fp = os.path.join(tmpdir, f"{row_format}.jsonl.gz")
+            parquet_fp = os.path.join(tmpdir, f"{row_format}.parquet")
+
+            _, elapsed = timed(lambda: io.write_jsonl_chunks(chunked(rows, args.chunk_size), jsonl_fp, compress=True))
+            report("write jsonl.gz", elapsed, len(rows), os.path.getsize(jsonl_fp))
+            _, elapsed = timed(lambda: io.write_parquet_chunks(chunked(rows, args.chunk_size), parquet_fp, row_format=row_format))
+            report("write parquet", elapsed, len(rows), os.path.getsize(parquet_fp))
+
+            jsonl_rows, elapsed = timed(lambda: io.read_jsonl(jsonl_fp))
+            report("read jsonl.gz", elapsed, len(rows))
+            parquet_rows, elapsed = timed(lambda: io.parquet_to_rows(io.read_parquet(parquet_fp)))
+            report("read parquet", elapsed, len(rows))
+            assert jsonl_rows == parquet_rows == rows, "Outputs differ"
+            table, elapsed = timed(lambda: io.read_parquet(parquet_fp))
+            report("read parquet table", elapsed, len(rows))
+
+            uid_fn = (lambda pair: pair["dataset"]) if row_format == "supervised" else (lambda dialog: dialog[0]["parent"])
+            expected, elapsed = timed(lambda: [row for row in io.read_jsonl(jsonl_fp) if uid_fn(row) == datasets[0]])
+            report("one dataset, jsonl.gz", elapsed, len(rows))
+            actual, elapsed = timed(lambda: io.parquet_to_rows(io.read_parquet(parquet_fp, datasets=[datasets[0]])))
+            report("one dataset, parquet", elapsed, len(rows))
+            assert expected == actual, "Dataset rows differ"
+
+            _, elapsed = timed(lambda: [uid_fn(row) for row in io.read_jsonl(jsonl_fp)])
+            report("one column, jsonl.gz", elapsed, len(rows))
+            _, elapsed = timed(lambda: io.read_parquet(parquet_fp, columns=["dataset"]).column("dataset").to_pylist())
+            report("one column, parquet", elapsed, len(rows))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the jsonlines and Parquet output formats.")
+    parser.add_argument("--num-dialogs", default=100000, type=int, help="Synthetic dialogs, across 20 datasets.")
+    parser.add_argument("--chunk-size", default=10000, type=int, help="Rows per chunk written.")
+    main(parser.parse_args())
@@ -0,0 +1,159 @@
+"""
+# usage (within repo root):
+python src/benchmarks/bench_preparers.py --num-rows 20000 --max-slowdown 1.1
+
+Micro-benchmarks the preparers that clean text with `helpers.text_normalization`, against their
+previous versions (copied below), over synthetic rows: Dolly 15k (citations removed by regex),
+Indic-Instruct (its Dolly rows), OIG (turns split on markers) and CommitPackFT (normalized language
+names).
+
+Each preparer's output must match its previous version. With `--max-slowdown`, exits with an error if any
+preparer is slower than its previous version by more than that factor, so hot path regressions are caught.
+"""
+
+import argparse
+import random
+import re
+import sys
+import time
+
+sys.path.append("src/")
+import preparers
+
+
+def baseline_prepare_dolly_15k(row):
+    input_text = re.sub(
+        r"\s*\[.*?\]\s*", "", "\n".join([row["context"], row["instruction"]]).strip()
+    )
+    target_text = re.sub(r"\s*\[.*?\]\s*", "", row["response"])
+    return preparers.convert_inputs_targets_to_messages(input_text, target_text, row["category"])
+
+
+def baseline_prepare_indic_instruct_dolly(row):
+    input_text = re.sub(
+        r"\s*\[.*?\]\s*",
+        "",
+        "\n".join([row["context"], row["instruction"]]).strip(),
+    )
+    target_text = re.sub(r"\s*\[.*?\]\s*", "", row["response"])
+    return preparers.convert_inputs_targets_to_messages(input_text, target_text, row["dataset"])
+
+
+def baseline_prepare_laion_oig(row):
+    turn_markers = ["<human>:", "<bot>:", "Rosey:"]
+    turns = row["text"].strip()
+    parent = row["_source"]
+    if turns.startswith("Background:"):
+        turns = turns.replace("<human>: ", "\n", 1)
+        turns = "<human>: " + turns
+    SEPARATOR = "<*>"
+    for tm in turn_markers:
+        turns = turns.replace(tm, f"{SEPARATOR}{tm}")
+    turns = turns.split(SEPARATOR)
+    messages = []
+    for i, turn in enumerate(turns):
+        if turn.strip():
+            speaker = "user" if turn.startswith("<human>") else "assistant"
+            for tm in turn_markers:
+                turn = turn.replace(tm, "")
+            messages.append({"from": speaker, "text": turn.strip(), "parent": parent})
+            parent = i
+    return messages
+
+
+def baseline_prepare_commitpackft(row):
+    lang_normalized = (
+        row["lang"]
+        .replace("'", "")
+        .replace("(", "")
+        .replace(")", "")
+        .replace(" ", "-")
+        .lower()
+    )
+    return preparers.convert_inputs_targets_to_messages(
+        row["old_contents"] + "\n\n" + row["subject"],
+        row["new_contents"],
+        lang_normalized,
+    )
+
+
+WORDS = ["the", "model", "data", "set", "of", "a", "with", "Rosey", "<b", ":", "\n"]
+LANGUAGES = ["Python", "C++", "Objective-C++", "Ren'Py", "Visual Basic", "Common Lisp (Emacs)", "Go", "Jupyter Notebook"]
+
+
+def text(rng, num_words, citation_rate=0.0):
+    words = rng.choices(WORDS, k=num_words)
+    if rng.random() < citation_rate:
+        words.insert(rng.randrange(len(words) + 1), f"[{rng.randint(1, 20)}]")
+    return " ".join(words)
+
+
+def dolly_row(rng):
+    # Wikipedia contexts often have citations, instructions and responses rarely do.
+    return {
+        "context": text(rng, rng.randint(0, 150), citation_rate=0.3),
+        "instruction": text(rng, rng.randint(5, 30)),
+        "response": text(rng, rng.randint(10, 100), citation_rate=0.05),
+        "category": "open_qa",
+        "dataset": "dolly",
+    }
+
+
+def oig_row(rng):
+    turns = [f"{rng.choice(['<human>:', '<bot>:', 'Rosey:'])} {text(rng, rng.randint(5, 60))}" for _ in range(rng.randint(2, 8))]
+    background = "Background: " + text(rng, 30) + " " if rng.random() < 0.1 else ""
+    return {"text": background + " ".join(turns), "_source": "unified_chip2"}
+
+
+def commitpackft_row(rng):
+    return {
+        "old_contents": text(rng, 200), "subject": text(rng, 10), "new_contents": text(rng, 200),
+        "lang": rng.choice(LANGUAGES),
+    }
+
+
+def best_time(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main(args):
+    rng = random.Random(0)
+    n = args.num_rows
+    row_wise = lambda prepare_fn: lambda rows: [prepare_fn(row) for row in rows]
+    cases = [
+        ("Dolly 15k", [dolly_row(rng) for _ in range(n)],
+         row_wise(baseline_prepare_dolly_15k), row_wise(preparers.prepare_dolly_15k)),
+        ("Indic-Instruct (Dolly)", [dolly_row(rng) for _ in range(n)],
+         row_wise(baseline_prepare_indic_instruct_dolly), row_wise(preparers.prepare_indic_instruct)),
+        ("OIG", [oig_row(rng) for _ in range(n)],
+         row_wise(baseline_prepare_laion_oig), row_wise(preparers.prepare_laion_oig)),
+        ("CommitPackFT", [commitpackft_row(rng) for _ in range(n)],
+         row_wise(baseline_prepare_commitpackft), row_wise(preparers.prepare_commitpackft)),
+    ]
+
+    print(f"{'Preparer':<26}{'before (rows/s)':>18}{'after (rows/s)':>18}{'speedup':>10}")
+    regressions = []
+    for name, rows, before_fn, after_fn in cases:
+        before_time, before = best_time(lambda: before_fn(rows), args.repeats)
+        after_time, after = best_time(lambda: after_fn(rows), args.repeats)
+        assert before == after, f"{name}: outputs differ"
+        print(f"{name:<26}{len(rows) / before_time:>18,.0f}{len(rows) / after_time:>18,.0f}{before_time / after_time:>9.2f}x")
+        if args.max_slowdown and after_time > before_time * args.max_slowdown:
+            regressions.append(name)
+
+    if regressions:
+        sys.exit(f"Slower than before by more than {args.max_slowdown}x: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmark the text cleaning preparers.")
+    parser.add_argument("--num-rows", default=20000, type=int, help="Synthetic rows per preparer.")
+    parser.add_argument("--repeats", default=5, type=int, help="Timings per preparer; the fastest is reported.")
+    parser.add_argument("--max-slowdown", default=None, type=float,
+                        help="Fail if a preparer's time exceeds its previous version's by this factor, e.g. 1.1.")
+    main(parser.parse_args())
@@ -0,0 +1,137 @@
+"""
+# usage (within repo root):
+python src/benchmarks/bench_supervised_reformat.py --num-dialogs 20000
+
+Compares `--output-format supervised` reformatting the old way (a recursive DFS over each dialog tree)
+against `downloader.reformat_supervised_dialog` (a single-thread fast path and an iterative tree walk),
+over synthetic dialog trees:
+    chat: single-thread multi-turn dialogs, as most collections have,
+    wide: ranking-style trees, where each prompt has many scored responses (e.g. Nectar, UltraFeedback),
+    deep: Open Assistant-style trees, with long branching threads.
+
+It also times the streaming pipeline (`--chunk-size`) for each, preparing on the worker pool and then
+reformatting in the main process, against reformatting in the workers (`downloader.prepare_supervised`).
+"""
+
+import argparse
+import gc
+import random
+import sys
+import time
+from functools import partial
+from collections import defaultdict
+
+sys.path.append("src/")
+from downloader import Downloader, get_worker_pool, reformat_supervised_dialog
+
+
+def baseline_reformat_supervised_dialog(dialog):
+    """`Downloader._reformat_supervised_dialog` before the iterative walk."""
+    dset_name = dialog[0]["parent"]
+    pairs = []
+    adjacency_list = defaultdict(list)
+    for i, msg in enumerate(dialog):
+        adjacency_list[msg['parent']].append(i)
+
+    def dfs(node_id, parent_msg):
+        if node_id not in adjacency_list:
+            return
+        for child_id in adjacency_list[node_id]:
+            child_msg = dialog[child_id]
+            if child_msg['from'] == 'assistant' and parent_msg['from'] == 'user':
+                if 'score' not in child_msg or child_msg['score'] >= 1:
+                    pairs.append({'inputs': parent_msg['text'], 'targets': child_msg['text'], "dataset": dset_name})
+            dfs(child_id, child_msg)
+
+    for root_id in adjacency_list[dset_name]:
+        dfs(root_id, dialog[root_id])
+    return pairs
+
+
+# Trees by name, inherited by the forked worker processes, so rows only need to send their index.
+# (Only the dialogs the workers prepare are sent back to the main process, as in a real collection.)
+TREES = {}
+
+
+def prepare_row(i, tree):
+    return [dict(msg) for msg in TREES[tree][i]]
+
+
+def message(i, parent, rng):
+    msg = {"from": "user" if rng.random() < 0.5 else "assistant", "text": f"message {i} " * 10, "parent": parent}
+    if rng.random() < 0.3:
+        msg["score"] = rng.randint(0, 3)
+    return msg
+
+
+def chat_dialog(rng, num_turns=8):
+    dialog = [{"from": "user", "text": "hello " * 10, "parent": "dataset"}]
+    for i in range(1, num_turns):
+        dialog.append({"from": "assistant" if i % 2 else "user", "text": f"message {i} " * 10, "parent": i - 1})
+    return dialog
+
+
+def wide_dialog(rng, num_responses=50):
+    dialog = [{"from": "user", "text": "prompt " * 10, "parent": "dataset"}]
+    dialog += [{"from": "assistant", "text": f"response {i} " * 10, "parent": 0, "score": rng.randint(0, 3)} for i in range(num_responses)]
+    return dialog
+
+
+def deep_dialog(rng, num_messages=60, depth=None):
+    """A random tree; with `depth`, a single thread of that depth with random side branches."""
+    dialog = [{"from": "user", "text": "prompt " * 10, "parent": "dataset"}]
+    for i in range(1, num_messages if depth is None else depth):
+        parent = i - 1 if depth is not None or rng.random() < 0.6 else rng.randrange(i)
+        dialog.append(message(i, parent, rng))
+    return dialog
+
+
+def run(name, fn, dialogs):
+    # As in `timeit`, garbage collection is off while timing, as its cost grows with every result kept alive.
+    gc.collect()
+    gc.disable()
+    start = time.perf_counter()
+    try:
+        pairs = fn(dialogs)
+    except RecursionError:
+        print(f"  {name:<28}{'RecursionError':>12}")
+        return None
+    finally:
+        gc.enable()
+    elapsed = time.perf_counter() - start
+    print(f"  {name:<28}{elapsed:>10.3f}s{len(dialogs) / elapsed:>14,.0f} dialogs/s")
+    return pairs
+
+
+def main(args):
+    rng = random.Random(0)
+    TREES.update({
+        "chat": [chat_dialog(rng) for _ in range(args.num_dialogs)],
+        "wide": [wide_dialog(rng) for _ in range(args.num_dialogs)],
+        "deep": [deep_dialog(rng) for _ in range(args.num_dialogs)],
+        "very deep (depth 5000)": [deep_dialog(rng, depth=5000) for _ in range(max(args.num_dialogs // 1000, 1))],
+    })
+    get_worker_pool()  # Start the pool once the trees exist, outside of the timings.
+    for tree, dialogs in TREES.items():
+        print(f"{tree}: {len(dialogs):,} dialogs")
+        before = run("before (recursive)", lambda ds: [p for d in ds for p in baseline_reformat_supervised_dialog(d)], dialogs)
+        after = run("after (iterative)", lambda ds: [p for d in ds for p in reformat_supervised_dialog(d)], dialogs)
+        # Each row is prepared into one of the dialogs.
+        downloader = Downloader(
+            "synthetic", lambda _: range(len(dialogs)), partial(prepare_row, tree=tree), {"dataset": ["dataset"]})
+        chunks = lambda **kwargs: downloader.iter_prepared_chunks([], args.chunk_size, **kwargs)
+        separate = run("stream, reformat after", lambda ds: [
+            p for chunk in chunks() for p in downloader._reformat_supervised(chunk)
+        ], dialogs)
+        fused = run("stream, reformat in workers", lambda ds: [
+            p for chunk in chunks(supervised=True) for _, pairs in chunk for p in pairs
+        ], dialogs)
+        assert before is None or before == after, "Outputs differ"
+        assert after == separate == fused, "Streaming outputs differ"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the supervised reformatting of dialog trees.")
+    parser.add_argument("--num-dialogs", default=20000, type=int, help="Dialogs per kind of tree.")
+    parser.add_argument("--chunk-size", default=10000, type=int, help="Dialogs per chunk in the streaming pipeline.")
+    main(parser.parse_args())
@@ -0,0 +1,106 @@
+"""
+# usage (within repo root):
+python src/benchmarks/bench_zipped_json.py --num-members 20000
+
+Reads a synthetic zip of Camel-AI style conversations, one `.json` member each (as `download_camel_science` does),
+with the previous `downloaders.process_zipped_file` (copied below) and the current one, each with an empty and a warm cache:
+    before: reads and parses every member in turn on one thread, then caches the records as one JSON file
+        (`download_cache.cached_json`), which later runs parse again.
+    after: yields each record as it is read, decompressing batches of members ahead on threads
+        (`downloaders.iter_zipped_json`), and caches the members as jsonlines (`download_cache.cached_lines`),
+        which later runs read one line at a time.
+Reports records/sec, and the peak memory allocated by Python (`tracemalloc`) while reading the records one at a time.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+
+sys.path.append("src/")
+import downloaders
+from helpers import io, download_cache
+
+
+def baseline_process_zipped_file(zip_file, cache_dir):
+    def extract():
+        dset = []
+        with zipfile.ZipFile(zip_file, 'r') as z:
+            for json_file in z.namelist():
+                if json_file.endswith(".json"):
+                    data = json.load(z.open(json_file))
+                    dset.append(data)
+        return dset
+
+    # Cache the extracted JSON files by the zip's contents, rather than reading every member again.
+    return download_cache.cached_json(f"zip:{io.hash_file(zip_file)}", extract, cache_dir=cache_dir)
+
+
+WORDS = ["the", "a", "of", "to", "and", "in", "is", "role", "task", "assistant", "user", "solution", "next", "request"]
+
+
+def text(rng, num_words):
+    return " ".join(rng.choices(WORDS, k=num_words))
+
+
+def conversation(rng, i):
+    """An `ai_society_translated` style record, with 2-20 messages."""
+    num_messages = rng.randint(2, 20)
+    record = {
+        "role_1": "AI Assistant", "role_2": "User", "id": f"{i:06d}",
+        "original_task": text(rng, 20), "specified_task": text(rng, 40),
+        "termination_reason": "<CAMEL_TASK_DONE>", "num_messages": num_messages,
+    }
+    for m in range(1, num_messages + 1):
+        record[f"message_{m}"] = {
+            "role_type": "USER" if m % 2 else "ASSISTANT", "role_name": "User" if m % 2 else "AI Assistant",
+            "content": text(rng, rng.randint(20, 200)),
+        }
+    return record
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main(args):
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        zip_fp = os.path.join(tmpdir, "ai_society_chat.zip")
+        records = [conversation(rng, i) for i in range(args.num_members)]
+        with zipfile.ZipFile(zip_fp, "w", zipfile.ZIP_DEFLATED) as z:
+            for i, record in enumerate(records):
+                z.writestr(f"ai_society_chat/{i:06d}.json", json.dumps(record))
+        print(f"{args.num_members:,} members, {os.path.getsize(zip_fp) / 1e6:.1f} MB zipped")
+        print(f"{'':<10}{'empty cache':>14}{'warm cache':>14}{'cache size':>14}{'peak memory':>14}")
+
+        for name, read_fn in [
+            ("before", lambda cache_dir: baseline_process_zipped_file(zip_fp, cache_dir)),
+            ("after", lambda cache_dir: downloaders.process_zipped_file(zip_fp, cache_dir=cache_dir)),
+        ]:
+            cache_dir = os.path.join(tmpdir, f"cache-{name}")
+            first, cold = timed(lambda: list(read_fn(cache_dir)))
+            second, warm = timed(lambda: list(read_fn(cache_dir)))
+            assert first == second == records, f"{name}: the records differ"
+            del first, second
+            cache_bytes = sum(entry["size"] for entry in download_cache.get_download_cache(cache_dir).entries.values())
+            tracemalloc.start()
+            for _ in read_fn(cache_dir):
+                pass
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{name:<10}{args.num_members / cold:>10,.0f} r/s{args.num_members / warm:>10,.0f} r/s"
+                  f"{cache_bytes / 1e6:>11.1f} MB{peak / 1e6:>11.1f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark reading the records of a zip of JSON files.")
+    parser.add_argument("--num-members", default=20000, type=int, help="JSON files in the synthetic zip.")
+    main(parser.parse_args())
@@ -6,30 +6,37 @@ COLLECTION_FN_MAPPER = {
     "Open-Platypus": {
         "download_function": downloaders.download_open_platypus,
         "prepare_function": preparers.prepare_open_platypus,
+        "prepare_spec": preparers.OPEN_PLATYPUS_SPEC,
     },
     "Flan Collection (Super-NaturalInstructions)": {
         "download_function": downloaders.download_flan_collection_sni,
         "prepare_function": preparers.prepare_flan_collection,
+        "prepare_spec": preparers.FLAN_COLLECTION_SPEC,
     },
     "Flan Collection (Chain-of-Thought)": {
         "download_function": downloaders.download_flan_collection_cot,
         "prepare_function": preparers.prepare_flan_collection,
+        "prepare_spec": preparers.FLAN_COLLECTION_SPEC,
     },
     "Flan Collection (Dialog)": {
         "download_function": downloaders.download_flan_collection_dialog,
         "prepare_function": preparers.prepare_flan_collection,
+        "prepare_spec": preparers.FLAN_COLLECTION_SPEC,
     },
     "Flan Collection (Flan 2021)": {
         "download_function": downloaders.download_flan_collection_flan2021,
         "prepare_function": preparers.prepare_flan_collection,
+        "prepare_spec": preparers.FLAN_COLLECTION_SPEC,
     },
     "Flan Collection (P3)": {
         "download_function": downloaders.download_flan_collection_p3,
         "prepare_function": preparers.prepare_flan_collection,
+        "prepare_spec": preparers.FLAN_COLLECTION_SPEC,
     },
     "Dolly 15k": {
         "download_function": downloaders.download_dolly_15k,
         "prepare_function": preparers.prepare_dolly_15k,
+        "prepare_spec": preparers.DOLLY_15K_SPEC,
     },
     "xP3x": {
         "download_function": downloaders.download_xp3x,
@@ -46,6 +53,7 @@ COLLECTION_FN_MAPPER = {
     "Self-Instruct": {
         "download_function": downloaders.download_self_instruct,
         "prepare_function": preparers.prepare_self_instuct,
+        "prepare_spec": preparers.SELF_INSTRUCT_SPEC,
     },
     "Capybara": {
         "download_function": downloaders.download_capybara,
@@ -59,11 +67,13 @@ COLLECTION_FN_MAPPER = {
         "download_function": downloaders.download_open_assistant,
         "prepare_function": preparers.prepare_open_assistant,
         "custom_prepare": True,
+        "partition_key": "message_tree_id",
     },
     "Open Assistant v2": {
         "download_function": downloaders.download_open_assistant_v2,
         "prepare_function": preparers.prepare_open_assistant,
         "custom_prepare": True,
+        "partition_key": "message_tree_id",
     },
     "Open Assistant OctoPack": {
         "download_function": downloaders.download_open_assistant_octopack,
@@ -84,26 +94,32 @@ COLLECTION_FN_MAPPER = {
     "Longform": {
         "download_function": downloaders.download_longform,
         "prepare_function": preparers.prepare_longform,
+        "prepare_spec": preparers.LONGFORM_SPEC,
     },
     "GPTeacher": {
         "download_function": downloaders.download_gpteacher,
         "prepare_function": preparers.prepare_gpteacher,
+        "prepare_spec": preparers.GPTEACHER_SPEC,
     },
     "Alpaca": {
         "download_function": downloaders.download_alpaca,
         "prepare_function": preparers.prepare_alpaca,
+        "prepare_spec": preparers.ALPACA_SPEC,
     },
     "Glaive Code Assistant": {
         "download_function": downloaders.download_glaive_code_assistant,
         "prepare_function": preparers.prepare_glaive_code_assistant,
+        "prepare_spec": preparers.GLAIVE_CODE_ASSISTANT_SPEC,
     },
     "Glaive Code Assistant v2": {
         "download_function": downloaders.download_glaive_code_assistant_v2,
         "prepare_function": preparers.prepare_glaive_code_assistant_v2,
+        "prepare_spec": preparers.GLAIVE_CODE_ASSISTANT_V2_SPEC,
     },
     "Glaive Code Assistant v3": {
         "download_function": downloaders.download_glaive_code_assistant_v3,
         "prepare_function": preparers.prepare_glaive_code_assistant_v3,
+        "prepare_spec": preparers.GLAIVE_CODE_ASSISTANT_V3_SPEC,
     },
     "Nectar": {
         "download_function": downloaders.download_nectar,
@@ -112,6 +128,7 @@ COLLECTION_FN_MAPPER = {
     "MetaMathQA": {
         "download_function": downloaders.download_metamathqa,
         "prepare_function": preparers.prepare_metamathqa,
+        "prepare_spec": preparers.METAMATHQA_SPEC,
     },
     "RiddleSense": {
         "download_function": downloaders.download_riddle_sense,
@@ -120,10 +137,12 @@ COLLECTION_FN_MAPPER = {
     "EverythingLM": {
         "download_function": downloaders.download_everything_lm,
         "prepare_function": preparers.prepare_everything_lm,
+        "prepare_spec": preparers.EVERYTHING_LM_SPEC,
     },
     "GPT-4-Alpaca": {
         "download_function": downloaders.download_gpt4_alpaca,
         "prepare_function": preparers.prepare_gpt4_alpaca,
+        "prepare_spec": preparers.GPT4_ALPACA_SPEC,
     },
     "lmsys_chat_1m": {
         "download_function": downloaders.download_lmsys_chat_1m,
@@ -132,10 +151,12 @@ COLLECTION_FN_MAPPER = {
     "WizardLM Evol-Instruct": {
         "download_function": downloaders.download_evol_instruct,
         "prepare_function": preparers.prepare_evol_instruct,
+        "prepare_spec": preparers.EVOL_INSTRUCT_SPEC,
     },
     "WizardLM Evol-Instruct V2": {
         "download_function": downloaders.download_evol_instruct_v2,
         "prepare_function": preparers.prepare_evol_instruct_v2,
+        "prepare_spec": preparers.EVOL_INSTRUCT_V2_SPEC,
     },
     "Pure-Dove": {
         "download_function": downloaders.download_pure_dove,
@@ -144,10 +165,12 @@ COLLECTION_FN_MAPPER = {
     "Feedback Collection": {
         "download_function": downloaders.download_feedback_collection,
         "prepare_function": preparers.prepare_feedback_collection,
+        "prepare_spec": preparers.FEEDBACK_COLLECTION_SPEC,
     },
     "Preference Collection": {
         "download_function": downloaders.download_preference_collection,
         "prepare_function": preparers.prepare_preference_collection,
+        "prepare_spec": preparers.PREFERENCE_COLLECTION_SPEC,
     },
     "MagPie-Pro": {
         "download_function": downloaders.download_magpie,
@@ -156,10 +179,12 @@ COLLECTION_FN_MAPPER = {
     "Synthetic-GSM8K-Reflection": {
         "download_function": downloaders.download_synthetic_gsm8k_reflection,
         "prepare_function": preparers.prepare_synthetic_gsm8k_reflection,
+        "prepare_spec": preparers.SYNTHETIC_GSM8K_REFLECTION_SPEC,
     },
     "Llama2-MedTuned-Instructions": {
         "download_function": downloaders.download_llama2_med_tuned_instructions,
         "prepare_function": preparers.prepare_llama2_med_tuned_instructions,
+        "prepare_spec": preparers.LLAMA2_MED_TUNED_INSTRUCTIONS_SPEC,
     },
     "OIG": {
         "download_function": downloaders.download_laion_oig,
@@ -168,10 +193,12 @@ COLLECTION_FN_MAPPER = {
     "Thai Gen AI (Alpaca)": {
         "download_function": downloaders.download_thai_gen_ai_alpaca,
         "prepare_function": preparers.prepare_thai_gen_ai_alpaca,
+        "prepare_spec": preparers.THAI_GEN_AI_ALPACA_SPEC,
     },
     "SEACrowd": {
         "download_function": downloaders.download_seacrowd,
         "prepare_function": preparers.prepare_seacrowd,
+        "prepare_spec": preparers.SEACROWD_SPEC,
     },
     "ShareGPT Vicuna": {
         "download_function": downloaders.download_sharegpt_vicuna,
@@ -180,6 +207,7 @@ COLLECTION_FN_MAPPER = {
     "Code Alpaca": {
         "download_function": downloaders.download_code_alpaca,
         "prepare_function": preparers.prepare_code_alpaca,
+        "prepare_spec": preparers.CODE_ALPACA_SPEC,
     },
     "HC3 (English)": {
         "download_function": downloaders.download_hc3_en,
@@ -196,6 +224,7 @@ COLLECTION_FN_MAPPER = {
     "CoT Collection": {
         "download_function": downloaders.download_cot_collection,
         "prepare_function": preparers.prepare_cot_collection,
+        "prepare_spec": preparers.COT_COLLECTION_SPEC,
     },
     "NomicAI GPT4AllJ": {
         "download_function": downloaders.download_gpt4all,
@@ -208,39 +237,48 @@ COLLECTION_FN_MAPPER = {
     "StarCoder Self-Instruct": {
         "download_function": downloaders.download_starcoder_self_instruct,
         "prepare_function": preparers.prepare_starcoder_self_instruct,
+        "prepare_spec": preparers.STARCODER_SELF_INSTRUCT_SPEC,
     },
     "Thai Gen AI (GPTeacher)": {
         "download_function": downloaders.download_thai_gen_ai_gpteacher,
         "prepare_function": preparers.prepare_thai_gen_ai_gpteacher,
+        "prepare_spec": preparers.THAI_GEN_AI_GPTEACHER_SPEC,
     },
     "Tiny Stories": {
         "download_function": downloaders.download_tiny_stories,
         "prepare_function": preparers.prepare_tiny_stories,
         "custom_prepare": True,
+        "partition_key": preparers.tiny_stories_partitions,
     },
     "Thai Gen AI (Dolly)": {
         "download_function": downloaders.download_thai_gen_ai_dolly,
         "prepare_function": preparers.prepare_thai_gen_ai_dolly,
+        "prepare_spec": preparers.THAI_GEN_AI_DOLLY_SPEC,
     },
     "Tasksource Instruct": {
         "download_function": downloaders.download_tasksource_instruct,
         "prepare_function": preparers.prepare_tasksource_instruct,
+        "prepare_spec": preparers.TASKSOURCE_INSTRUCT_SPEC,
     },
     "Tasksource Symbol-Tuning": {
         "download_function": downloaders.download_tasksource_symbol_tuning,
         "prepare_function": preparers.prepare_tasksource_instruct,
+        "prepare_spec": preparers.TASKSOURCE_INSTRUCT_SPEC,
     },
     "Stack Exchange Instruction": {
         "download_function": downloaders.download_stack_exchange_instruction,
         "prepare_function": preparers.prepare_stack_exchange_instruction,
+        "prepare_spec": preparers.STACK_EXCHANGE_INSTRUCTION_SPEC,
     },
     "Joke Explanation": {
         "download_function": downloaders.download_joke_explanation,
         "prepare_function": preparers.prepare_joke_explanation,
+        "prepare_spec": preparers.JOKE_EXPLANATION_SPEC,
     },
     "Book Summaries": {
         "download_function": downloaders.download_book_summaries,
         "prepare_function": preparers.prepare_book_summaries,
+        "prepare_spec": preparers.BOOK_SUMMARIES_SPEC,
     },
     "UltraChat": {
         "download_function": downloaders.download_ultrachat,
@@ -261,14 +299,17 @@ COLLECTION_FN_MAPPER = {
     "MathInstruct": {
         "download_function": downloaders.download_mathinstruct,
         "prepare_function": preparers.prepare_mathinstruct,
+        "prepare_spec": preparers.MATHINSTRUCT_SPEC,
     },
     "Tool-Llama": {
         "download_function": downloaders.download_tool_llama,
         "prepare_function": preparers.prepare_tool_llama,
+        "prepare_spec": preparers.TOOL_LLAMA_SPEC,
     },
     "Gorilla": {
         "download_function": downloaders.download_gorilla,
         "prepare_function": preparers.prepare_gorilla,
+        "prepare_spec": preparers.GORILLA_SPEC,
     },
     "Baize Chat Data": {
         "download_function": downloaders.download_baize_data,
@@ -277,14 +318,17 @@ COLLECTION_FN_MAPPER = {
     "PMC-LLaMA Instructions": {
         "download_function": downloaders.download_pmc_llama,
         "prepare_function": preparers.prepare_pmc_llama,
+        "prepare_spec": preparers.PMC_LLAMA_SPEC,
     },
     "Medical Meadow": {
         "download_function": downloaders.download_medical_meadow,
         "prepare_function": preparers.prepare_medical_meadow,
+        "prepare_spec": preparers.MEDICAL_MEADOW_SPEC,
     },
     "MedInstruct": {
         "download_function": downloaders.download_medinstruct,
         "prepare_function": preparers.prepare_medinstruct,
+        "prepare_spec": preparers.MEDINSTRUCT_SPEC,
     },
     "Open Orca": {
         "download_function": downloaders.download_open_orca,
@@ -321,6 +365,7 @@ COLLECTION_FN_MAPPER = {
     "ChatDoctor": {
         "download_function": downloaders.download_chatdoctor,
         "prepare_function": preparers.prepare_chatdoctor,
+        "prepare_spec": preparers.CHATDOCTOR_SPEC,
     },
     "AgentInstruct": {
         "download_function": downloaders.download_agentinstruct,
@@ -329,18 +374,22 @@ COLLECTION_FN_MAPPER = {
     "Cidar": {
         "download_function": downloaders.download_cidar,
         "prepare_function": preparers.prepare_cidar,
+        "prepare_spec": preparers.CIDAR_SPEC,
     },
     "PII-Masking-200k": {
         "download_function": downloaders.download_pii_masking_200k,
         "prepare_function": preparers.prepare_pii_masking_200k,
+        "prepare_spec": preparers.PII_MASKING_200K_SPEC,
     },
     "No Robots": {
         "download_function": downloaders.download_no_robots,
         "prepare_function": preparers.prepare_no_robots,
+        "prepare_spec": preparers.NO_ROBOTS_SPEC,
     },
     "HelpSteer": {
         "download_function": downloaders.download_help_steer,
         "prepare_function": preparers.prepare_help_steer,
+        "prepare_spec": preparers.HELP_STEER_SPEC,
     },
     "Bactrian-X": {
         "download_function": downloaders.download_bactrianx,
@@ -369,6 +418,7 @@ COLLECTION_FN_MAPPER = {
     "Orca-Math": {
         "download_function": downloaders.download_orca_math,
         "prepare_function": preparers.prepare_orca_math,
+        "prepare_spec": preparers.ORCA_MATH_SPEC,
     },
     "Cobra Frames": {
         "download_function": downloaders.download_cobra_frames,
@@ -385,22 +435,27 @@ COLLECTION_FN_MAPPER = {
     "Aya Dataset": {
         "download_function": downloaders.download_aya_dataset,
         "prepare_function": preparers.prepare_aya_dataset,
+        "prepare_spec": preparers.AYA_DATASET_SPEC,
     },
     "MegaWika": {
         "download_function": downloaders.download_megawika,
         "prepare_function": preparers.prepare_megawika,
+        "prepare_spec": preparers.MEGAWIKA_SPEC,
     },
     "Gretel Text-to-SQL": {
         "download_function": downloaders.download_gretel_text_to_sql,
         "prepare_function": preparers.prepare_gretel_text_to_sql,
+        "prepare_spec": preparers.GRETEL_TEXT_TO_SQL_SPEC,
     },
     "ExpertQA": {
         "download_function": downloaders.download_expertqa,
         "prepare_function": preparers.prepare_expertqa,
+        "prepare_spec": preparers.EXPERTQA_SPEC,
     },
     "OpenMathInstruct-1": {
         "download_function": downloaders.download_openmath_instruct,
         "prepare_function": preparers.prepare_openmath_instruct,
+        "prepare_spec": preparers.OPENMATH_INSTRUCT_SPEC,
     },
     "OpenGPT Healthcare": {
         "download_function": downloaders.download_opengpt_healthcare,
@@ -413,6 +468,7 @@ COLLECTION_FN_MAPPER = {
     "Reasoning": {
         "download_function": downloaders.download_reasoning,
         "prepare_function": preparers.prepare_reasoning,
+        "prepare_spec": preparers.REASONING_SPEC,
     },
     "DialogStudio": {
         "download_function": downloaders.download_dialogstudio,
@@ -421,6 +477,7 @@ COLLECTION_FN_MAPPER = {
     "UltraFeedback Argilla": {
         "download_function": downloaders.download_ultraFeedback_argilla,
         "prepare_function": preparers.prepare_ultraFeedback_argilla,
+        "prepare_spec": preparers.ULTRAFEEDBACK_ARGILLA_SPEC,
     },
     "LongAlign-10k": {
         "download_function": downloaders.download_longalign_10k,
@@ -441,5 +498,6 @@ COLLECTION_FN_MAPPER = {
     "InstAr": {
         "download_function": downloaders.download_inst_ar,
         "prepare_function": preparers.prepare_inst_ar,
+        "prepare_spec": preparers.INST_AR_SPEC,
     }
 }
\ No newline at end of file
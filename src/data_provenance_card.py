@@ -12,7 +12,38 @@ def generate_datacard(
     selected_task_categories,
     savedir,
 ):
+    """Writes the data card (`data_card.txt`) and attribution table (`data_attribution.csv`) to `savedir`.
+
+    See `create_datacard` for the contents of the data card.
     """
+    data_card = create_datacard(
+        data_summary,
+        selected_licenses,
+        selected_languages,
+        selected_task_categories,
+    )
+    io.write_txt(os.path.join(savedir, "data_card.txt"), data_card)
+
+    # Full CSV with links for attribution to sources and licenses
+    # keep_cols = [
+    #     "Unique Dataset Identifier", "Dataset Name", "Dataset URL", "HuggingFace URL", 
+    #     "Collection", "Collection URL", "Languages", "Text Source",
+    #     "Task Categories", "Licenses", "License Notes",
+    #     "Num Instances",
+    # ]
+    keep_cols = list(data_summary.columns)
+    data_summary[keep_cols].to_csv(os.path.join(savedir, "data_attribution.csv"), index=False)
+
+
+def create_datacard(
+    data_summary,
+    selected_licenses,
+    selected_languages,
+    selected_task_categories,
+):
+    """Returns the data card text, summarizing the composition of `data_summary`.
+
+
     HuggingFace Dataset Cards: https://huggingface.co/docs/hub/datasets-cards
         - Composition of languages, task categories, sources (num exs)
 
@@ -43,21 +74,22 @@ def generate_datacard(
 
     def summarize_column(df, col):
         col_to_exs = defaultdict(lambda: [0, 0])
-        for i, row in data_summary.iterrows():
+        text_metrics = df["Text Metrics"] if "Text Metrics" in df else [{}] * len(df)
+        for values, metrics in zip(df[col[0] if isinstance(col, list) else col], text_metrics):
             if isinstance(col, list):
-                items = [in_row[col[1]] for in_row in row[col[0]]]
+                items = [in_row[col[1]] for in_row in values]
             else:
-                items = row[col]
+                items = values
 
             if isinstance(items, list):
                 for item in items:
                     col_to_exs[item][0] += 1
-                    if row.get("Text Metrics", {}):
-                        col_to_exs[item][1] += int(row.get("Text Metrics", {}).get("Num Dialogs", 1) / len(items))
+                    if metrics:
+                        col_to_exs[item][1] += int(metrics.get("Num Dialogs", 1) / len(items))
             else:
                 col_to_exs[items][0] += 1
-                if row.get("Text Metrics", {}):
-                    col_to_exs[items][1] += row.get("Text Metrics", {}).get("Num Dialogs", 1)
+                if metrics:
+                    col_to_exs[items][1] += metrics.get("Num Dialogs", 1)
                 
         # dictionary: item --> (num datasets, num exs)
         return sorted(col_to_exs.items(), key=lambda x: x[1][0], reverse=True)
@@ -109,15 +141,4 @@ def generate_datacard(
     limitations_txt = """NB: Num examples and percentages are approximated."""
     data_card.append(limitations_txt)
     
-    data_card = "\n\n\n\n".join(data_card)
-    io.write_txt(os.path.join(savedir, "data_card.txt"), data_card)
-
-    # Full CSV with links for attribution to sources and licenses
-    # keep_cols = [
-    #     "Unique Dataset Identifier", "Dataset Name", "Dataset URL", "HuggingFace URL", 
-    #     "Collection", "Collection URL", "Languages", "Text Source",
-    #     "Task Categories", "Licenses", "License Notes",
-    #     "Num Instances",
-    # ]
-    keep_cols = list(data_summary.columns)
-    data_summary[keep_cols].to_csv(os.path.join(savedir, "data_attribution.csv"), index=False)
\ No newline at end of file
+    return "\n\n\n\n".join(data_card)
@@ -1,4 +1,7 @@
 import os
+import threading
+import time
+import traceback
 import configargparse
 from collections import Counter, defaultdict
 from datetime import datetime
@@ -7,13 +10,15 @@ import pandas as pd
 # from helpers import io
 # from helpers import filters
 # from helpers import constants
-from helpers import io, filters, constants
+from helpers import io, filters, constants, download_cache
+from helpers.run_manifest import RunManifest
 from collection_mapper import COLLECTION_FN_MAPPER
 import data_provenance_card as data_provenance_card
-from downloader import Downloader
+from downloader import Downloader, OUTPUT_FORMATS, get_worker_pool, output_path
 import data_bibtex as data_bibtex
 from dotenv import load_dotenv
 from huggingface_hub import HfApi, utils
+import datasets
 from datasets.exceptions import DatasetNotFoundError
 
 load_dotenv()
@@ -51,40 +56,62 @@ def check_args(args):
 
 
 def get_collection_to_uid_and_filter_ids(data_summary):
-    filter_df_info = data_summary[[
-        "Collection", "Unique Dataset Identifier", "Dataset Filter IDs"]]
-    def extract_uids_and_filter_ids(group):
-        return [(row["Unique Dataset Identifier"], row["Dataset Filter IDs"]) for _, row in group.iterrows()]
-    collection_to_keys = dict(filter_df_info.groupby("Collection").apply(extract_uids_and_filter_ids))
-    return {k: dict(v) for k, v in collection_to_keys.items()}
+    """Returns {collection --> {dataset uid --> dataset filter ids}}, ordered by collection name."""
+    collection_to_keys = defaultdict(dict)
+    for collection, uid, filter_ids in zip(
+        data_summary["Collection"], data_summary["Unique Dataset Identifier"], data_summary["Dataset Filter IDs"]
+    ):
+        collection_to_keys[collection][uid] = filter_ids
+    return dict(sorted(collection_to_keys.items()))
+
+
+def get_filter_kwargs(args):
+    """Maps the parsed command line arguments onto the keyword arguments of `filters.apply_filters`."""
+    return {
+        "selected_collection": args.collection,
+        "selected_datasets": io.read_txt(args.dataset_names) if args.dataset_names else None,
+        "selected_licenses": args.licenses,
+        "selected_license_use": args.license_use,
+        "openai_license_override": int(args.openai_license_override),
+        "selected_license_attribution": args.license_attribution,
+        "selected_license_sharealike": args.license_sharealike,
+        "selected_languages": args.languages,
+        "selected_task_categories": args.tasks,
+        "selected_domains": args.domains,
+        "no_synthetic_data": False if int(args.model_generated) else True,
+        "text_source_allow_list": args.text_sources,
+        "selected_start_time": args.start_time,
+        "selected_end_time": args.end_time,
+        "selected_license_sources": args.license_sources,
+        "dpi_undefined_license_override": int(args.dpi_undefined_license_override),
+    }
+
+
+def print_filter_explanation(explanation):
+    """Prints the per-predicate counts of `filters.explain_filters` as a table."""
+    print(f"{'Filter':<22}{'Passing':>10}{'Remaining':>12}{'Removed':>10}{'Time (ms)':>12}")
+    print(f"{'(all datasets)':<22}{'':>10}{explanation['num_datasets_before']:>12}")
+    for stage in explanation["stages"]:
+        print(f"{stage['predicate']:<22}{stage['passing']:>10}{stage['remaining']:>12}{stage['removed']:>10}{stage['elapsed_ms']:>12.3f}")
 
 
 def main(args):
-    data_summary = io.read_data_summary_json("data_summaries/")
-
-    data_summary = filters.map_license_criteria(
-        data_summary, ALL_CONSTANTS)
-
-    data_summary_df = pd.DataFrame(data_summary).fillna("")
+    download_cache.set_offline(args.offline)
+    if args.offline:
+        # `load_dataset` has its own cache, which it can also be told to use offline.
+        datasets.config.HF_DATASETS_OFFLINE = True
+    data_summary_df = io.load_catalog("data_summaries/", "constants/", verbose=True)
+    filter_kwargs = get_filter_kwargs(args)
+    if args.explain:
+        explanation = filters.explain_filters(data_summary_df, ALL_CONSTANTS, **filter_kwargs)
+        print_filter_explanation(explanation)
+        explanation_fp = os.path.join(args.savedir, "filter_explanation.json")
+        io.write_json(explanation, explanation_fp)
+        print(f"Saved which filter removed each dataset to {explanation_fp}")
     filtered_data_summary = filters.apply_filters(
         data_summary_df,
         ALL_CONSTANTS,
-        args.collection,
-        io.read_txt(args.dataset_names) if args.dataset_names else None,
-        args.licenses,
-        args.license_use,
-        int(args.openai_license_override),
-        args.license_attribution,
-        args.license_sharealike,
-        args.languages,
-        args.tasks,
-        args.domains,
-        False if int(args.model_generated) else True,
-        args.text_sources,
-        args.start_time,
-        args.end_time,
-        args.license_sources,
-        int(args.dpi_undefined_license_override)
+        **filter_kwargs,
     )
     n_collections = set(filtered_data_summary["Collection"])
     n_datasets = len(filtered_data_summary)
@@ -154,48 +181,198 @@ def main(args):
     data_bibtex.generate_bibtex(filtered_data_summary, save_to_file=True, output_dir=args.savedir)
 
     collection_to_keys = get_collection_to_uid_and_filter_ids(filtered_data_summary)
-    for collection_key, uid_task_keys in collection_to_keys.items():
-        if args.collection and collection_key != args.collection:
-            continue
-        flat_task_keys = [tk for tks in uid_task_keys.values() for tk in tks]
-        print(f"\n=====================\n{collection_key}")
-        print(f"Found {len(flat_task_keys)} tasks...")
-        downloader_args = COLLECTION_FN_MAPPER[collection_key]
-        # dataset unique identifier --> dataset_filter_ids
-        downloader_args.update({"uid_key_mapper": uid_task_keys})
-        collection_filter_maps = {}
-        downloader = Downloader(name=collection_key, **downloader_args)
-        try:
-            downloader.run_and_save(
+    if args.collection:
+        collection_to_keys = {k: v for k, v in collection_to_keys.items() if k == args.collection}
+    collection_bytes = estimate_collection_bytes(filtered_data_summary)
+    run_manifest = RunManifest(args.savedir)
+    # Fork the worker pool before `schedule_collections` starts its threads: forking while another
+    # thread holds a lock (e.g. of logging or the download cache) can deadlock the workers.
+    get_worker_pool()
+    start = time.perf_counter()
+    results = schedule_collections(
+        [(collection_key, collection_bytes.get(collection_key, 0)) for collection_key in collection_to_keys],
+        lambda collection_key: download_collection(collection_key, collection_to_keys[collection_key], args, run_manifest),
+        num_workers=args.num_workers,
+        memory_budget=int(args.memory_budget * 1e9) if args.memory_budget else None,
+    )
+    print_download_summary(results)
+    print(f"Finished {len(results)} collections in {time.perf_counter() - start:.1f}s, with {args.num_workers} workers.")
+
+
+def estimate_collection_bytes(data_summary):
+    """Estimates the text size of each collection, {collection --> bytes}, from the
+    `Num Dialogs` and mean input and target lengths in each dataset's `Text Metrics`."""
+    estimates = Counter()
+    for collection, metrics in zip(data_summary["Collection"], data_summary["Text Metrics"]):
+        metrics = metrics if isinstance(metrics, dict) else {}
+        mean_length = (metrics.get("Mean Inputs Length") or 0) + (metrics.get("Mean Targets Length") or 0)
+        estimates[collection] += int((metrics.get("Num Dialogs") or 0) * mean_length)
+    return dict(estimates)
+
+
+def get_shard_kwargs(args):
+    """The `io.write_jsonl_shards` options for `Downloader.run_and_save`, or None to write single files."""
+    if not (args.shard_rows or args.shard_size or args.compression != "gzip"):
+        return None
+    return {
+        "max_rows": args.shard_rows or None,
+        "max_bytes": int(args.shard_size * 1e6) or None,
+        "compression": args.compression,
+        "num_workers": args.compression_workers or None,
+    }
+
+
+def get_output_bytes(savepath, shards):
+    """The bytes written for a collection, i.e. its file, or its shards (from their index)."""
+    return io.read_json(savepath)["bytes"] if shards else os.path.getsize(savepath)
+
+
+def collection_run_config(flat_task_keys, args):
+    """The inputs and options a collection's output depends on, recorded in the `RunManifest`."""
+    return {
+        "filter_ids": sorted(flat_task_keys, key=str),
+        "data_limit": args.data_limit,
+        "output_format": args.output_format,
+        "seed": args.seed,
+        "stratify": args.stratify,
+        "shards": get_shard_kwargs(args),
+    }
+
+
+def download_collection(collection_key, uid_task_keys, args, run_manifest):
+    """Downloads, prepares and saves one collection, isolating any failure to it.
+
+    Collections completed by a previous run with the same configuration (see `RunManifest`) are skipped.
+    With `--chunk-size`, interrupted collections resume from their last saved chunk, as long as
+    their sample is reproducible (no `--data-limit`, or a `--seed`).
+
+    Returns:
+        Dict: The collection's row in the `print_download_summary` table.
+    """
+    flat_task_keys = [tk for tks in uid_task_keys.values() for tk in tks]
+    shards = get_shard_kwargs(args)
+    if shards:
+        savepath = io.shard_index_path(args.savedir, collection_key)
+    else:
+        savepath = output_path(args.savedir, collection_key, args.output_format)
+    config = collection_run_config(flat_task_keys, args)
+    if not args.restart and run_manifest.is_complete(collection_key, config, savepath):
+        print(f"{collection_key} -- Already complete, skipping.")
+        num_rows = run_manifest.collections[collection_key]["rows"]
+        return {"Collection": collection_key, "Status": "skipped", "Wall Time (s)": 0.0, "Rows": num_rows, "Bytes": get_output_bytes(savepath, shards)}
+    resume = None
+    resumable = not shards and OUTPUT_FORMATS[args.output_format][1] == "jsonl"
+    if not args.restart and args.chunk_size and resumable and (not args.data_limit or args.seed is not None):
+        resume = run_manifest.resume_point(collection_key, config, savepath)
+    if resume:
+        print(f"{collection_key} -- Resuming after {resume['dialogs']} saved dialogs, found {len(flat_task_keys)} tasks...")
+    else:
+        print(f"{collection_key} -- Starting, found {len(flat_task_keys)} tasks...")
+    run_manifest.start(collection_key, config, resume)
+
+    # dataset unique identifier --> dataset_filter_ids
+    downloader_args = dict(COLLECTION_FN_MAPPER[collection_key], uid_key_mapper=uid_task_keys)
+    downloader = Downloader(name=collection_key, **downloader_args)
+    status, num_rows = "ok", 0
+    start = time.perf_counter()
+    try:
+        with download_cache.for_collection(collection_key):
+            num_rows = downloader.run_and_save(
                 flat_task_keys,
                 limit=args.data_limit,
                 reformat=args.output_format,
                 savedir=args.savedir,
-                debug=args.debug
+                debug=args.debug,
+                chunk_size=args.chunk_size,
+                seed=args.seed,
+                stratify=args.stratify,
+                resume=resume,
+                on_checkpoint=lambda checkpoint: run_manifest.checkpoint(collection_key, checkpoint),
+                shards=shards,
             )
-        except utils.GatedRepoError:
-            print(f"You are not authorized to download Collection: {collection_key}. Please go to their HF Page and accept the dataset terms and conditions.")
-        except DatasetNotFoundError as e:
-            print(f"Dataset {collection_key} can not be found, Exception Message: {e}")
-
-
-if __name__ == "__main__":
-    """
-    Example commands:
-
-    python src/download_and_filter.py -c src/configs/default.yaml
-
-    OR
-
-    python src/download_and_filter.py --collection "<Name of collection in data_summary>"
-
-    Process:
-        1. Load summaries of all the datasets (a mapping from their ID to metadata)
-        2. Filter the dataset summaries by their properties, according to your passed in filters
-        3. Iteratively load each data collection remaining, normalize and save them.
+    except utils.GatedRepoError:
+        print(f"You are not authorized to download Collection: {collection_key}. Please go to their HF Page and accept the dataset terms and conditions.")
+        status = "gated"
+    except DatasetNotFoundError as e:
+        print(f"Dataset {collection_key} can not be found, Exception Message: {e}")
+        status = "not found"
+    except download_cache.CacheMissError as e:
+        print(f"{collection_key} -- {e}")
+        status = "not cached"
+    except Exception:
+        print(f"{collection_key} -- Failed:\n{traceback.format_exc()}")
+        status = "failed"
+    wall_time = time.perf_counter() - start
+    if status == "ok":
+        run_manifest.complete(collection_key, num_rows, savepath)
+    else:
+        run_manifest.fail(collection_key, status)
+    num_bytes = get_output_bytes(savepath, shards) if status == "ok" and os.path.exists(savepath) else 0
+    print(f"{collection_key} -- Finished ({status}) in {wall_time:.1f}s.")
+    return {"Collection": collection_key, "Status": status, "Wall Time (s)": wall_time, "Rows": num_rows, "Bytes": num_bytes}
+
+
+def schedule_collections(jobs, run_fn, num_workers=1, memory_budget=None):
+    """Runs `run_fn(collection_key)` for each of `jobs`, a list of (collection key, estimated bytes),
+    on `num_workers` threads, as most of each collection's time is spent on network and decompression.
+
+    The biggest collections start first. A collection only starts while the estimated bytes of the
+    running collections, plus its own, fit in `memory_budget` (if set); otherwise a smaller
+    collection that fits may start in the meantime. A collection bigger than the whole budget
+    runs once nothing else is running.
+
+    Returns:
+        List: The `run_fn` results, in order of `jobs`.
     """
-    ALL_CONSTANTS = io.read_all_constants("constants/")
-
+    order = {collection_key: i for i, (collection_key, _) in enumerate(jobs)}
+    queue = sorted(jobs, key=lambda job: -job[1])
+    results = [None] * len(jobs)
+    running = {"count": 0, "bytes": 0}
+    condition = threading.Condition()
+
+    def next_job():
+        with condition:
+            while queue:
+                for i, (collection_key, num_bytes) in enumerate(queue):
+                    if not memory_budget or not running["count"] or running["bytes"] + num_bytes <= memory_budget:
+                        running["count"] += 1
+                        running["bytes"] += num_bytes
+                        return queue.pop(i)
+                condition.wait()
+            return None
+
+    def worker():
+        while (job := next_job()) is not None:
+            collection_key, num_bytes = job
+            try:
+                results[order[collection_key]] = run_fn(collection_key)
+            finally:
+                with condition:
+                    running["count"] -= 1
+                    running["bytes"] -= num_bytes
+                    condition.notify_all()
+
+    threads = [threading.Thread(target=worker) for _ in range(max(min(num_workers, len(jobs)), 1))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def print_download_summary(results):
+    """Prints the wall time, rows and bytes written for each collection, and the totals."""
+    summary = pd.DataFrame(results, columns=["Collection", "Status", "Wall Time (s)", "Rows", "Bytes"])
+    if summary.empty:
+        return
+    summary.loc[len(summary)] = [
+        "(total)", f"{(summary['Status'] == 'ok').sum()}/{len(summary)} ok",
+        summary["Wall Time (s)"].sum(), summary["Rows"].sum(), summary["Bytes"].sum()]
+    print("\n=====================\nDownload Summary")
+    print(summary.to_string(index=False, float_format=lambda x: f"{x:.1f}"))
+
+def get_parser(all_constants):
+    """The command line arguments, also reused by `filter_server.py` to validate queries."""
     parser = configargparse.ArgumentParser(
         description='download_and_filter.py',
         default_config_files=["src/configs/default.yaml"],
@@ -254,19 +431,19 @@ if __name__ == "__main__":
     parser.add(
         "-g", "--languages", required=False,
         nargs='*', default=[],
-        choices=list(ALL_CONSTANTS["LANGUAGE_GROUPS"].keys()),
+        choices=list(all_constants["LANGUAGE_GROUPS"].keys()),
         help=f"A list of language categories we would confine our datasets to.")
     # Specify task categories
     parser.add(
         "-t", "--tasks", required=False,
         nargs='*', default=[],
-        choices=list(ALL_CONSTANTS["TASK_GROUPS"].keys()),
+        choices=list(all_constants["TASK_GROUPS"].keys()),
         help=f"A list of tasks categories we would confine our datasets to.")
     # Specify source domains
     parser.add(
         "-dd", "--domains", required=False,
         nargs='*', default=[],
-        choices=list(ALL_CONSTANTS["DOMAIN_GROUPS"].keys()),
+        choices=list(all_constants["DOMAIN_GROUPS"].keys()),
         help=f"A list of source domains we would confine our datasets to.")
     # Whether to exclude any synthetic (model-generated) data
     parser.add(
@@ -294,23 +471,95 @@ if __name__ == "__main__":
         "-dl", "--data-limit", required=False,
         default=0, type=int,
         help=f"How many rows to randomly sample from each collection.")
+    # Specify data limit sampling
+    parser.add(
+        "--seed", required=False,
+        default=None, type=int,
+        help=f"Random seed for the `--data-limit` sample, to make it reproducible.")
+    parser.add(
+        "--stratify", default=False, action='store_true',
+        help="Allocate the `--data-limit` sample across each collection's datasets in proportion to their size.")
+    # Specify chunk size
+    parser.add(
+        "-cs", "--chunk-size", required=False,
+        default=0, type=int,
+        help=f"If set, stream each collection through download, prepare and save this many dialogs at a time, to bound memory use. 0 loads each collection whole.")
+    # Specify collection scheduling
+    parser.add(
+        "-nw", "--num-workers", required=False,
+        default=1, type=int,
+        help=f"How many collections to download and prepare concurrently.")
+    parser.add(
+        "-mb", "--memory-budget", required=False,
+        default=0, type=float,
+        help=f"Only start another collection while the estimated text size (in GB) of the running collections fits this budget. 0 for no budget.")
     # Specify Data output format type
     parser.add(
         "-of", "--output-format", required=False,
         default="messages", type=str,
-        choices=["messages", "supervised"],
-        help="The output format to save the data. By default it mimcs the format described in `preparers.py`. `supervised` means it saves as input-target pairs.")
+        choices=list(OUTPUT_FORMATS),
+        help="The output format to save the data. By default it mimcs the format described in `preparers.py`. `supervised` means it saves as input-target pairs. The `-parquet` formats save the same rows as Parquet.")
     # Specify savedir
     parser.add(
         "-s", "--savedir", required=False,
         default="data", type=str,
         help=f"The directory to save your downloaded data to.")
+    # Specify sharded output
+    parser.add(
+        "--shard-rows", required=False,
+        default=0, type=int,
+        help=f"If set, save each collection as shards of at most this many rows, with an index file `<collection>.index.json`.")
+    parser.add(
+        "--shard-size", required=False,
+        default=0, type=float,
+        help=f"If set, save each collection as shards of about this many MB (uncompressed), with an index file.")
+    parser.add(
+        "--compression", required=False,
+        default="gzip", type=str,
+        choices=["gzip", "zstd"],
+        help="How to compress saved data. `zstd` (which requires `pip install zstandard`) always saves shards.")
+    parser.add(
+        "--compression-workers", required=False,
+        default=0, type=int,
+        help=f"How many shards to compress in parallel. Defaults to the number of CPUs.")
+    # Specify explain
+    parser.add(
+        "--explain", default=False, action='store_true',
+        help="Report how many datasets each filter removes, and save which filter removed each dataset to `<savedir>/filter_explanation.json`.")
+    # Specify restart
+    parser.add(
+        "--restart", default=False, action='store_true',
+        help=f"Download every collection again, rather than skipping those completed, or resuming those interrupted, in a previous run into `--savedir` (see `{constants.RUN_MANIFEST_FP}`).")
+    # Specify offline
+    parser.add(
+        "--offline", default=False, action='store_true',
+        help=f"Only use files already in the download cache (`{constants.DOWNLOAD_CACHE_DIR}`), failing collections that need anything else.")
     # Specify debug
     parser.add(
         "-d", "--debug", default=False, dest='debug', action='store_true',
         help=f"Debug mode does not run preparer in parallel. Defaults to False.")
     parser.set_defaults(debug=False)
+    return parser
+
+
+if __name__ == "__main__":
+    """
+    Example commands:
+
+    python src/download_and_filter.py -c src/configs/default.yaml
+
+    OR
+
+    python src/download_and_filter.py --collection "<Name of collection in data_summary>"
+
+    Process:
+        1. Load summaries of all the datasets (a mapping from their ID to metadata)
+        2. Filter the dataset summaries by their properties, according to your passed in filters
+        3. Iteratively load each data collection remaining, normalize and save them.
+    """
+    ALL_CONSTANTS = io.read_all_constants("constants/")
 
+    parser = get_parser(ALL_CONSTANTS)
     args = parser.parse_args()
     if args.debug:
         print("Debug Mode activated.")
@@ -1,12 +1,69 @@
 import os
 # import pandas as pd
 # from functools import partial
-from collections import defaultdict  # Counter,
-# from datasets import load_dataset, list_datasets
+from collections import Counter, defaultdict
+from datasets import Dataset
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
 from helpers import io
+import itertools as it
+from functools import partial
 import random
 
 import multiprocessing
+import threading
+import atexit
+
+
+# The worker pool shared by every `Downloader` in this process, see `get_worker_pool`.
+_WORKER_POOL = None
+_WORKER_POOL_LOCK = threading.Lock()
+
+# `imap` chunksizes: rows are sent to workers in chunks of up to `MAX_CHUNKSIZE`, about 4 per worker
+# for small collections. Larger chunks no longer reduce the pickling overhead, but delay results.
+MAX_CHUNKSIZE = 1024
+UNSIZED_CHUNKSIZE = 256
+# Rows per Arrow batch prepared with a `prepare_spec`, when not streaming.
+PREPARE_SPEC_BATCH_SIZE = 10000
+
+# `--output-format` --> (the rows saved, i.e. `messages` dialogs or `supervised` pairs, and how they are saved).
+OUTPUT_FORMATS = {
+    "messages": ("messages", "jsonl"),
+    "supervised": ("supervised", "jsonl"),
+    "messages-parquet": ("messages", "parquet"),
+    "supervised-parquet": ("supervised", "parquet"),
+}
+
+
+def output_path(savedir, name, output_format):
+    """The file `Downloader.run_and_save` saves a collection to, unless it is sharded."""
+    extension = ".parquet" if OUTPUT_FORMATS[output_format][1] == "parquet" else ".jsonl.gz"
+    return os.path.join(savedir, f"{name}{extension}")
+
+
+def get_worker_pool():
+    """Returns the `multiprocessing.Pool` shared across collections, started on first use,
+    so worker processes are not started again for each collection.
+
+    The workers are forked, so call this from the main thread before starting any other threads
+    (as `download_and_filter.main` does before scheduling collections): a fork copies the locks
+    other threads hold, and workers that need one of them would wait forever.
+    """
+    global _WORKER_POOL
+    with _WORKER_POOL_LOCK:
+        if _WORKER_POOL is None:
+            _WORKER_POOL = multiprocessing.Pool()
+            atexit.register(_WORKER_POOL.terminate)
+        return _WORKER_POOL
+
+
+def imap_chunksize(exs, num_workers=None):
+    """A chunksize for `Pool.imap` over `exs`, which (unlike `Pool.map`) defaults to 1 row per task."""
+    if not hasattr(exs, "__len__"):
+        return UNSIZED_CHUNKSIZE
+    num_workers = num_workers or multiprocessing.cpu_count()
+    return max(1, min(len(exs) // (4 * num_workers), MAX_CHUNKSIZE))
 
 
 class Downloader:
@@ -19,6 +76,8 @@ class Downloader:
         prepare_function,
         uid_key_mapper,
         custom_prepare=False,
+        prepare_spec=None,
+        partition_key=None,
     ):
         """
         name: Name of the Collection.
@@ -29,11 +88,20 @@ class Downloader:
         custom_prepare: Whether the `prepare_fn` takes in the dataset or a single row.
             If True the `prepare_function` takes in the whole dataset from `download_function`.
             If False the `prepare_function` takes in one row at a time from `download_function`, so we can run in parallel.
+        prepare_spec: An optional `preparers.InputsTargetsSpec` equivalent to the `prepare_function`, which
+            prepares batches of rows at once as Arrow tables. Batches it cannot prepare exactly
+            (e.g. with unexpected types) fall back to the `prepare_function`.
+        partition_key: For `custom_prepare`, splits the dataset into partitions the `prepare_function` can prepare
+            independently (e.g. the message trees of Open Assistant), so they are prepared in parallel.
+            Either a column name, or a function of the dataset returning the partition ID of each row.
+            Each partition's rows keep their order, and partitions are ordered by their first row.
         """
         self.name = name
         self.download_fn = download_function
         self.prepare_fn = prepare_function
         self.custom_prepare = custom_prepare
+        self.prepare_spec = None if custom_prepare else prepare_spec
+        self.partition_key = partition_key if custom_prepare else None
 
         # Allows us to map from keys back to Dataset UID so we can
         # track which dataset they came from:
@@ -44,36 +112,217 @@ class Downloader:
         accepted_filter_ids,
         limit=None,
         debug=False,
+        seed=None,
+        stratify=False,
+    ):
+        rng = random.Random(seed)
+        dset = self.download_fn(accepted_filter_ids)
+        # If specified, randomly sample 'limit' rows before preparing them, where possible.
+        presample = self._can_presample(limit, stratify)
+        if presample:
+            dset = self._sample_rows(dset, limit, rng)
+
+        if self.prepare_spec is not None:
+            # Prepared in batches, with normalized parents.
+            prepared_dset = [
+                dialog for batch in self._spec_batches(dset, PREPARE_SPEC_BATCH_SIZE)
+                for dialog in self._prepare_batch(batch, debug=debug)
+            ]
+        else:
+            if self.custom_prepare:
+                # In some cases we need to preprocess the whole dataset (or its partitions) together
+                prepared_dset = self._custom_prepare(dset, debug=debug)
+            elif debug:
+                # Easier to debug when not in parallel.
+                prepared_dset = [self.prepare_fn(ex) for ex in dset]
+            else:
+                # Run in parallel by default once working.
+                prepared_dset = self._pool_process(self.prepare_fn, dset)
+            prepared_dset = self._normalize_parents(prepared_dset)
+
+        # Otherwise, randomly sample 'limit' of the prepared dialogs.
+        if limit and not presample:
+            prepared_dset = self._sample_dialogs(prepared_dset, limit, rng, stratify=stratify)
+        return prepared_dset
+
+    def _normalize_parents(self, prepared_dset):
+        return normalize_parents(prepared_dset, self.keys_to_uid)
+
+    def iter_prepared_chunks(
+        self,
+        accepted_filter_ids,
+        chunk_size,
+        debug=False,
+        limit=None,
+        rng=None,
+        skip=0,
+        supervised=False,
     ):
+        """Streaming version of `download_and_prepare`, which yields the prepared dialogs
+        in chunks of up to `chunk_size`, without holding the whole prepared dataset in memory.
+
+        Rows are consumed from the `download_function` output as they are needed, so downloaders
+        that return an iterator or a (memory-mapped) Hugging Face Dataset are never fully materialized.
+        Collections with `custom_prepare` still prepare the whole dataset at once (or, with a `partition_key`,
+        as many partitions at a time as the worker pool is given), but are then normalized and yielded in chunks.
+
+        If `limit` is set, only a random sample of `limit` downloaded rows is prepared, using `rng`.
+        Callers should check `_can_presample` first, and otherwise sample the prepared dialogs.
+        The first `skip` dialogs (e.g. those already saved by an interrupted run) are not prepared.
+
+        If `supervised`, and rows are prepared on the worker pool (not with `custom_prepare` or `debug`),
+        each row is also reformatted in its worker task, and chunks hold a (number of messages,
+        (inputs, targets) pairs) tuple per dialog instead, see `prepare_supervised`.
+        Collections with a `prepare_spec` prepare each chunk as one Arrow batch, in this process.
+        """
         dset = self.download_fn(accepted_filter_ids)
+        if limit:
+            dset = self._sample_rows(dset, limit, rng or random.Random())
         if self.custom_prepare:
-            # In some cases we need to preprocess the whole dataset together
-            prepared_dset = self.prepare_fn(dset)
-        elif debug:
-            # Easier to debug when not in parallel.
-            prepared_dset = [self.prepare_fn(ex) for ex in dset]
+            dset = self._custom_prepare(dset, debug=debug)
+        if skip:
+            dset = self._skip_rows(dset, skip)
+        if self.prepare_spec is not None:
+            for batch in self._spec_batches(dset, chunk_size):
+                dialogs = self._prepare_batch(batch, debug=debug)
+                yield [(len(dialog), reformat_supervised_dialog(dialog)) for dialog in dialogs] if supervised else dialogs
+            return
+        for chunk in self._chunks(dset, chunk_size):
+            if self.custom_prepare:
+                prepared_chunk = chunk
+            elif debug:
+                prepared_chunk = [self.prepare_fn(ex) for ex in chunk]
+            elif supervised:
+                yield self._pool_process(
+                    partial(prepare_supervised, prepare_fn=self.prepare_fn, keys_to_uid=self.keys_to_uid), chunk)
+                continue
+            else:
+                prepared_chunk = self._pool_process(self.prepare_fn, chunk)
+            yield self._normalize_parents(prepared_chunk)
+
+    def _custom_prepare(self, dset, debug=False):
+        """Prepares the whole dataset with the `prepare_fn`, or else each partition, on the worker pool unless `debug`."""
+        if self.partition_key is None:
+            return self.prepare_fn(dset)
+        if callable(self.partition_key):
+            partition_ids = self.partition_key(dset)
+        elif isinstance(dset, Dataset):
+            partition_ids = dset.with_format("arrow")[self.partition_key]
         else:
-            # Run in parallel by default once working.
-            prepared_dset = self._pool_process(self.prepare_fn, dset)
+            partition_ids = [row[self.partition_key] for row in dset]
+        order, sizes = partition_order(partition_ids)
+        partitions = iter_partitions(dset, order, sizes)
+        if debug:
+            prepared = map(self.prepare_fn, partitions)
+        else:
+            # `imap` returns the partitions' dialogs in order.
+            prepared = get_worker_pool().imap(self.prepare_fn, partitions, chunksize=imap_chunksize(sizes))
+        return it.chain.from_iterable(prepared)
+
+    def _spec_batches(self, rows, batch_size):
+        """Yields batches of up to `batch_size` consecutive rows, for the `prepare_spec`.
+        Hugging Face Datasets are read as Arrow tables directly, without converting rows to Python."""
+        if isinstance(rows, Dataset):
+            yield from rows.with_format("arrow").iter(batch_size=batch_size)
+        else:
+            yield from self._chunks(rows, batch_size)
+
+    def _prepare_batch(self, batch, debug=False):
+        """Prepares a batch of rows (an Arrow table or a list) with the `prepare_spec`, or else the `prepare_fn`,
+        and returns the dialogs with normalized parents."""
+        try:
+            table = batch if isinstance(batch, pa.Table) else pa.Table.from_pylist(batch)
+            return self.prepare_spec.prepare_batch(table, keys_to_uid=self.keys_to_uid)
+        except (pa.ArrowException, KeyError, TypeError, ValueError):
+            # e.g. missing columns, other types or None values, which the Python preparer may
+            # handle differently (or fail on, with a more useful error).
+            rows = batch.to_pylist() if isinstance(batch, pa.Table) else batch
+            if debug:
+                return self._normalize_parents([self.prepare_fn(ex) for ex in rows])
+            return self._normalize_parents(self._pool_process(self.prepare_fn, rows))
+
+    def _chunks(self, rows, chunk_size):
+        """Yields lists of up to `chunk_size` consecutive rows from any iterable."""
+        rows = iter(rows)
+        while True:
+            chunk = list(it.islice(rows, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def _skip_rows(self, dset, skip):
+        """Drops the first `skip` rows, without reading them where the dataset allows it."""
+        if isinstance(dset, Dataset):
+            return dset.select(range(min(skip, len(dset)), len(dset)))
+        if isinstance(dset, list):
+            return dset[skip:]
+        return it.islice(dset, skip, None)
+
+    def _can_presample(self, limit, stratify):
+        """Whether 'limit' rows can be sampled before preparing, rather than after.
+
+        Only when each downloaded row becomes exactly one dialog, i.e. not for `custom_prepare`,
+        and when the sample need not be stratified by dataset UID, which is only known once prepared.
+        """
+        return bool(limit) and not (self.custom_prepare or stratify)
+
+    def _sample_rows(self, dset, limit, rng):
+        """Uniformly samples `limit` downloaded rows, in their original order.
 
-        # If specified, randomly sample 'limit' dialogs.
-        if limit and limit < len(prepared_dset):
-            prepared_dset = random.sample(prepared_dset, limit)
+        Random access datasets (lists and Hugging Face Datasets) sample row indices, so only the
+        sampled rows are ever read. Any other iterable is reservoir sampled in one pass.
+        """
+        if not isinstance(dset, (list, Dataset)):
+            return self._reservoir_sample(dset, limit, rng)
+        if len(dset) <= limit:
+            return dset
+        indices = sorted(rng.sample(range(len(dset)), limit))
+        return dset.select(indices) if isinstance(dset, Dataset) else [dset[i] for i in indices]
+
+    def _sample_dialogs(self, dialogs, limit, rng, stratify=False):
+        """Uniformly samples `limit` prepared dialogs, optionally stratified by dataset UID."""
+        if stratify:
+            return self._stratified_sample(dialogs, limit, rng)
+        return self._reservoir_sample(dialogs, limit, rng)
+
+    def _reservoir_sample(self, rows, limit, rng):
+        """Uniformly samples `limit` rows from an iterable, holding at most `limit` rows in memory."""
+        sample = []
+        for num_seen, row in enumerate(rows):
+            if len(sample) < limit:
+                sample.append(row)
+            else:
+                j = rng.randrange(num_seen + 1)
+                if j < limit:
+                    sample[j] = row
+        return sample
 
-        # Map the "parent" field back to the UIDs of the originating dataset
-        normalized_dset = []
-        for row in prepared_dset:
-            new_row = []
-            for message in row:
-                assert isinstance(message["parent"], int) or message["parent"] in self.keys_to_uid, \
-                    f"The `parent` field of the first message in a dialog must be from one of the `Dataset Filter Ids`, specified in the json. It is currently {message['parent']} when the options are {self.keys_to_uid.keys()}"
-                if message["parent"] in self.keys_to_uid:
-                    message["parent"] = self.keys_to_uid[message["parent"]]
+    def _stratified_sample(self, dialogs, limit, rng):
+        """Samples `limit` dialogs, allocated across dataset UIDs in proportion to their number of dialogs.
 
-                new_row.append(message)
-            normalized_dset.append(new_row)
+        Keeps one reservoir per dataset UID, so memory is bounded by `limit` times the number of UIDs.
+        """
+        reservoirs = defaultdict(list)
+        counts = Counter()
+        for dialog in dialogs:
+            uid = dialog[0]["parent"]
+            counts[uid] += 1
+            if len(reservoirs[uid]) < limit:
+                reservoirs[uid].append(dialog)
+            else:
+                j = rng.randrange(counts[uid])
+                if j < limit:
+                    reservoirs[uid][j] = dialog
 
-        return normalized_dset
+        # Largest remainder allocation of the `limit` across dataset UIDs.
+        total = sum(counts.values())
+        if total <= limit:
+            return [dialog for reservoir in reservoirs.values() for dialog in reservoir]
+        quotas = {uid: limit * count // total for uid, count in counts.items()}
+        by_remainder = sorted(counts, key=lambda uid: (limit * counts[uid]) % total, reverse=True)
+        for uid in by_remainder[:limit - sum(quotas.values())]:
+            quotas[uid] += 1
+        return [dialog for uid, reservoir in reservoirs.items() for dialog in rng.sample(reservoir, quotas[uid])]
 
     def run_and_save(
         self,
@@ -82,6 +331,12 @@ class Downloader:
         limit=None,
         reformat="messages",
         debug=False,
+        chunk_size=None,
+        seed=None,
+        stratify=False,
+        resume=None,
+        on_checkpoint=None,
+        shards=None,
     ):
         """Runs the data pipeline for this collection:
 
@@ -92,67 +347,229 @@ class Downloader:
             of data from the downloaded dataset.
         savedir: What directory to save the collection in.
         limit: Samples `limit` random samples from this collection. Takes all data if `None`.
-        reformat: What format for the output data. Options are [`messages`, `supervised`].
-            Default (`messages`) reformat is described here: TODO.
+            Rows are sampled before they are prepared, unless the collection uses `custom_prepare`
+            or `stratify` is set.
+        reformat: What format for the output data. Options are the `OUTPUT_FORMATS`: [`messages`, `supervised`],
+            saved as gzipped jsonlines, and [`messages-parquet`, `supervised-parquet`], saved as Parquet
+            (see `io.write_parquet_chunks`). Default (`messages`) reformat is described here: TODO.
         debug: Turns of data parallelism so errors are easier to debug.
+        chunk_size: If set, streams the collection through the pipeline `chunk_size` dialogs at
+            a time (see `iter_prepared_chunks`), writing each chunk as soon as it is prepared,
+            so memory is bounded by the chunk size (or `limit`) rather than the collection size.
+        seed: Random seed for the `limit` sample, so it is reproducible.
+        stratify: Whether to allocate the `limit` sample across the collection's datasets
+            in proportion to their size, rather than sampling the collection as a whole.
+        resume: With `chunk_size`, a checkpoint from `on_checkpoint` to resume an interrupted run from:
+            the dialogs already saved are skipped, and the output file is appended to from the
+            checkpoint's `offset`. The pipeline must be deterministic (e.g. `limit` needs a `seed`).
+            Parquet output cannot be resumed.
+        on_checkpoint: With `chunk_size`, called after each chunk is saved with the checkpoint
+            {"dialogs", "messages", "rows", "offset"} so far.
+        shards: If set, `io.write_jsonl_shards` options (`max_rows`, `max_bytes`, `compression`,
+            `num_workers`), to save the collection as compressed shards with an index file,
+            rather than a single gzipped file. Checkpoints are not supported for shards, nor are Parquet outputs.
 
-        Saves the data as a gzipped jsonlines file according to `format` argument.
+        Saves the data to `output_path` according to `format` argument, and returns the number of rows written.
         """
-        prepared_dset = self.download_and_prepare(accepted_filter_ids, limit=limit, debug=debug)
+        row_format, file_format = OUTPUT_FORMATS[reformat]
+        assert not (shards and file_format == "parquet"), "Parquet output cannot be sharded."
+        if chunk_size:
+            return self._stream_and_save(
+                accepted_filter_ids, savedir, chunk_size,
+                limit=limit, reformat=reformat, debug=debug, seed=seed, stratify=stratify,
+                resume=resume, on_checkpoint=on_checkpoint, shards=shards)
+
+        prepared_dset = self.download_and_prepare(
+            accepted_filter_ids, limit=limit, debug=debug, seed=seed, stratify=stratify)
 
         num_messages = sum([len(dialog) for dialog in prepared_dset])
         print(f"{self.name} -- Downloaded {len(prepared_dset)} dialogs, totaling {num_messages} messages.")
 
         # If specified, reformat dataset for supervised learning, multi-turn dialogs, or reward modeling.
-        if reformat == "supervised":
+        if row_format == "supervised":
             prepared_dset = self._reformat_supervised(prepared_dset)
 
         # save.
-        savepath = os.path.join(savedir, f"{self.name}.jsonl.gz")
-        io.write_jsonl(prepared_dset, savepath, compress=True)
+        if shards:
+            io.write_jsonl_shards([prepared_dset], savedir, self.name, uid_fn=self._uid_fn(row_format), **shards)
+        elif file_format == "parquet":
+            io.write_parquet_chunks([prepared_dset], output_path(savedir, self.name, reformat), row_format=row_format)
+        else:
+            io.write_jsonl(prepared_dset, output_path(savedir, self.name, reformat), compress=True)
+        return len(prepared_dset)
+
+    def _uid_fn(self, row_format):
+        """Returns the dataset UID of an output row, for the shard index."""
+        if row_format == "supervised":
+            return lambda pair: pair["dataset"]
+        return lambda dialog: dialog[0]["parent"]
+
+    def _stream_and_save(
+        self, accepted_filter_ids, savedir, chunk_size,
+        limit=None, reformat="messages", debug=False, seed=None, stratify=False,
+        resume=None, on_checkpoint=None, shards=None,
+    ):
+        """The streaming `run_and_save` pipeline, for a given `chunk_size`."""
+        row_format, file_format = OUTPUT_FORMATS[reformat]
+        assert not ((shards or file_format == "parquet") and resume), "Only single jsonlines files can be resumed."
+        resume = resume or {"dialogs": 0, "messages": 0, "rows": 0, "offset": 0}
+        counts = {"dialogs": resume["dialogs"], "messages": resume["messages"], "rows": resume["rows"]}
+
+        def count(chunks):
+            for chunk in chunks:
+                counts["dialogs"] += len(chunk)
+                counts["messages"] += sum([len(dialog) for dialog in chunk])
+                yield chunk
+
+        def checkpoint(num_rows, offset):
+            counts["rows"] += num_rows
+            if on_checkpoint is not None:
+                on_checkpoint({**counts, "offset": offset})
+
+        def count_pairs(chunks):
+            for chunk in chunks:
+                counts["dialogs"] += len(chunk)
+                counts["messages"] += sum([num_messages for num_messages, _ in chunk])
+                yield [pair for _, pairs in chunk for pair in pairs]
+
+        rng = random.Random(seed)
+        # If specified, randomly sample 'limit' rows before preparing them, where possible.
+        presample = self._can_presample(limit, stratify)
+        # Reformat each dialog in the worker that prepared it, unless the dialogs are needed here first.
+        supervised = row_format == "supervised" and not (self.custom_prepare or debug or (limit and not presample))
+        if limit and not presample:
+            # Otherwise, randomly sample 'limit' of the prepared dialogs.
+            chunks = self.iter_prepared_chunks(accepted_filter_ids, chunk_size, debug=debug)
+            dialogs = self._sample_dialogs(it.chain.from_iterable(chunks), limit, rng, stratify=stratify)
+            chunks = self._chunks(dialogs[resume["dialogs"]:], chunk_size)
+        else:
+            chunks = self.iter_prepared_chunks(
+                accepted_filter_ids, chunk_size, debug=debug, limit=limit, rng=rng, skip=resume["dialogs"],
+                supervised=supervised)
+        if supervised:
+            chunks = count_pairs(chunks)
+        else:
+            chunks = count(chunks)
+            # If specified, reformat dataset for supervised learning, multi-turn dialogs, or reward modeling.
+            if row_format == "supervised":
+                chunks = (self._reformat_supervised(chunk) for chunk in chunks)
+        savepath = output_path(savedir, self.name, reformat)
+        if shards:
+            counts["rows"] = io.write_jsonl_shards(
+                chunks, savedir, self.name, uid_fn=self._uid_fn(row_format), **shards)["num_rows"]
+        elif file_format == "parquet":
+            counts["rows"] = io.write_parquet_chunks(chunks, savepath, row_format=row_format)
+        else:
+            io.write_jsonl_chunks(chunks, savepath, compress=True, offset=resume["offset"], on_chunk=checkpoint)
+        print(f"{self.name} -- Downloaded {counts['dialogs']} dialogs, totaling {counts['messages']} messages.")
+        return counts["rows"]
 
     def _pool_process(self, func, exs):
         """Applies a function (func) in parallel to every item in a list (exs).
         We use this to apply the `prepare_fn` to every row (example/dialog) in a dataset.
         """
-        with multiprocessing.Pool() as pool:
-            return [proc_ex for proc_ex in pool.map(func, exs)]
+        return list(get_worker_pool().imap(func, exs, chunksize=imap_chunksize(exs)))
 
     def _reformat_supervised(self, dialogs):
-        # TODO: Parallelize
-        reformatted = []
-        for dialog in dialogs:
-            pairs = self._reformat_supervised_dialog(dialog)
-            reformatted.extend(pairs)
-        return reformatted
-
-    def _reformat_supervised_dialog(self, dialog):
-        dset_name = dialog[0]["parent"]
-        pairs = []
-
-        # Create an adjacency list based on 'parent' key
-        adjacency_list = defaultdict(list)
-        for i, msg in enumerate(dialog):
-            adjacency_list[msg['parent']].append(i)
-
-        # Recursive function to do a DFS and create pairs
-        def dfs(node_id, parent_msg):
-            if node_id not in adjacency_list:
-                return
-            for child_id in adjacency_list[node_id]:
+        """Reformats dialogs into (inputs, targets) pairs, see `reformat_supervised_dialog`."""
+        return [pair for dialog in dialogs for pair in reformat_supervised_dialog(dialog)]
+
+
+def partition_order(partition_ids):
+    """Groups rows by their partition ID, keeping their order within each partition, and ordering partitions by their first row.
+
+    Returns:
+        Tuple: The row indices in grouped order (or None if the rows are already grouped), and the number of rows in each partition.
+    """
+    if isinstance(partition_ids, pa.ChunkedArray):
+        partition_ids = partition_ids.combine_chunks()
+    elif not isinstance(partition_ids, pa.Array):
+        partition_ids = pa.array(partition_ids)
+    # Dictionary indices number the distinct IDs in order of their first row.
+    codes = pc.dictionary_encode(partition_ids, null_encoding="encode").indices.to_numpy()
+    sizes = np.bincount(codes)
+    if np.all(codes[1:] >= codes[:-1]):
+        return None, sizes
+    return np.argsort(codes, kind="stable"), sizes
+
+
+def iter_partitions(dset, order, sizes):
+    """Yields the rows of each partition, as a list, from a `partition_order`."""
+    if order is not None:
+        dset = dset.select(order) if isinstance(dset, Dataset) else [dset[i] for i in order]
+    rows = iter(dset)
+    for size in sizes:
+        yield list(it.islice(rows, size))
+
+
+def normalize_parents(prepared_dset, keys_to_uid):
+    """Maps the "parent" field back to the UIDs of the originating dataset."""
+    normalized_dset = []
+    for row in prepared_dset:
+        new_row = []
+        for message in row:
+            assert isinstance(message["parent"], int) or message["parent"] in keys_to_uid, \
+                f"The `parent` field of the first message in a dialog must be from one of the `Dataset Filter Ids`, specified in the json. It is currently {message['parent']} when the options are {keys_to_uid.keys()}"
+            if message["parent"] in keys_to_uid:
+                message["parent"] = keys_to_uid[message["parent"]]
+
+            new_row.append(message)
+        normalized_dset.append(new_row)
+
+    return normalized_dset
+
+
+def prepare_supervised(row, prepare_fn, keys_to_uid):
+    """Prepares a row, and reformats it into (inputs, targets) pairs, in a single worker task,
+    so the dialog is not sent back to the main process only to be reformatted there.
+
+    Returns:
+        Tuple: The number of messages in the prepared dialog, and its pairs.
+    """
+    dialog = normalize_parents([prepare_fn(row)], keys_to_uid)[0]
+    return len(dialog), reformat_supervised_dialog(dialog)
+
+
+def reformat_supervised_dialog(dialog):
+    """Returns an (inputs, targets) pair for every assistant message that replies to a user message,
+    in depth first order of the dialog tree. Messages with a `score` below 1 are skipped."""
+    dset_name = dialog[0]["parent"]
+
+    # Most dialogs are a single thread, where each message replies to the one before it.
+    if all(msg["parent"] == i - 1 for i, msg in enumerate(dialog) if i):
+        return [
+            {"inputs": parent_msg["text"], "targets": child_msg["text"], "dataset": dset_name}
+            for parent_msg, child_msg in zip(dialog, dialog[1:])
+            if child_msg["from"] == "assistant" and parent_msg["from"] == "user"
+            # If there is a score field, it must be >= 1 to use this entry.
+            and ("score" not in child_msg or child_msg["score"] >= 1)
+        ]
+
+    # Otherwise, walk the tree. Children are listed by their 'parent' key.
+    children = {}
+    for i, msg in enumerate(dialog):
+        children.setdefault(msg["parent"], []).append(i)
+
+    pairs = []
+    # Start from each root (the messages whose parent is the name of the dataset). Rather than
+    # recursing, which deep trees can take past the recursion limit, keep a stack of
+    # (message, iterator over its children), descending into each child's children before its siblings.
+    for root_id in children.get(dset_name, []):
+        stack = [(dialog[root_id], iter(children.get(root_id, ())))]
+        while stack:
+            parent_msg, child_ids = stack[-1]
+            for child_id in child_ids:
                 child_msg = dialog[child_id]
                 # If current node ('child') is an assistant's message and parent node is a user's message
-                if child_msg['from'] == 'assistant' and parent_msg['from'] == 'user':
+                if child_msg["from"] == "assistant" and parent_msg["from"] == "user":
                     # If there is a score field, it must be >= 1 to use this entry.
-                    if 'score' not in child_msg or child_msg['score'] >= 1:
+                    if "score" not in child_msg or child_msg["score"] >= 1:
                         pairs.append({
-                            'inputs': parent_msg['text'], 'targets': child_msg['text'], "dataset": dset_name,
+                            "inputs": parent_msg["text"], "targets": child_msg["text"], "dataset": dset_name,
                         })
-                # Call dfs for the child
-                dfs(child_id, child_msg)
-
-        # Start dfs for each root (the nodes whose parent is the name of the dataset)
-        for root_id in adjacency_list[dset_name]:
-            dfs(root_id, dialog[root_id])
-
-        return pairs
+                if child_id in children:
+                    stack.append((child_msg, iter(children[child_id])))
+                    break
+            else:
+                stack.pop()
+    return pairs
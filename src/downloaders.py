@@ -1,3 +1,4 @@
+import codecs
 import itertools as it
 import json
 import multiprocessing
@@ -5,61 +6,60 @@ import os
 import random
 import re
 import zipfile
-from collections import Counter
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 from io import BytesIO
 
 import chardet
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 import requests
 from datasets import Dataset, list_datasets, load_dataset
-from helpers import io
+from helpers import io, download_cache, constants
 
 # `HfFileSystem` requires the latest version of `huggingface_hub`
-from huggingface_hub import HfFileSystem, hf_hub_download, hf_hub_url, login
+from huggingface_hub import HfFileSystem, hf_hub_url, login
 
 
-def filter_dataset_on_task_name(ex, task_key, accepted_filter_ids):
-    """Filters a dataset based on the task name.
-
-    Args:
-        ex (dict): A single example from the dataset.
-        task_key (str): The key in the example dict that contains the task name.
-        acceptable_tasks (list): A list of acceptable task names.
-
-    Returns:
-        bool: True if the example's task name is in the acceptable tasks list, False otherwise.
-    """
-    return ex[task_key] in accepted_filter_ids
+# `.json` members read by each thread task in `iter_zipped_json`.
+ZIP_MEMBERS_PER_TASK = 256
 
 
 def pool_filter(candidates, task_key, accepted_filter_ids):
-    """Filters a list of candidates using multiprocessing.
+    """Filters a list of candidates on their task name.
+
+    Despite the name, this runs in-process: the membership check is much cheaper than
+    pickling each candidate to a worker process and back. Hugging Face Datasets are
+    filtered on their Arrow table, without converting any rows to Python.
 
     Args:
-        candidates (list): A list of candidates to filter.
+        candidates (list or Dataset): The candidates to filter.
         task_key (str): The key in the example dict that contains the task name.
         acceptable_tasks (list): A list of acceptable task names.
 
     Returns:
-        list: A list of candidates that passed the filter.
+        list or Dataset: The candidates that passed the filter.
     """
-    with multiprocessing.Pool() as pool:
-        return [
-            c
-            for c, keep in zip(
-                candidates,
-                pool.map(
-                    partial(
-                        filter_dataset_on_task_name,
-                        task_key=task_key,
-                        accepted_filter_ids=accepted_filter_ids,
-                    ),
-                    candidates,
-                ),
-            )
-            if keep
-        ]
+    if isinstance(candidates, Dataset):
+        column = candidates.with_format("arrow")[task_key]
+        # The value set has the column's type, so e.g. "1" never matches 1, as with `in`:
+        # values that can't have that type can't equal any of the column's values, and are dropped.
+        accepted_values = []
+        for value in accepted_filter_ids:
+            try:
+                pa.scalar(value, type=column.type)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                continue
+            accepted_values.append(value)
+        if not accepted_values:
+            return candidates.select([])
+        keep = pc.is_in(column, value_set=pa.array(accepted_values, type=column.type))
+        return candidates.select(np.flatnonzero(keep.to_numpy(zero_copy_only=False)))
+    accepted_filter_ids = set(accepted_filter_ids)
+    return [c for c in candidates if c[task_key] in accepted_filter_ids]
 
 
 def annotate_source(dset, source):
@@ -71,15 +71,15 @@ def annotate_source(dset, source):
 
 
 def direct_data_request(url):
-    response = requests.get(url)
-    # The response content is in bytes, we need to convert it to string
-    content = response.content.decode("utf-8")
-    # Now we can parse the JSON content into a Python list/dictionary
-    return json.loads(content)
+    # Fetched through the download cache, so repeat runs do not download it again.
+    with open(download_cache.request(url), "r", encoding="utf-8") as f:
+        # Now we can parse the JSON content into a Python list/dictionary
+        return json.load(f)
 
 
 def huggingface_download(
-    data_address, name=None, data_dir=None, data_files=None, split=None
+    data_address, name=None, data_dir=None, data_files=None, split=None, as_list=True,
+    filter_column=None, accepted_values=None,
 ):
     """Download a dataset from the Hugging Face Hub.
 
@@ -92,6 +92,12 @@ def huggingface_download(
         data_dir (str, optional): Path to the directory containing the dataset files. Defaults to None.
         data_files (str or list, optional): Path(s) to specific dataset files. Defaults to None.
         split (str, optional): Name of the split to take (usually "train"). Defaults to None.
+        as_list (bool, optional): Whether to convert the dataset to a list. If False, the memory-mapped
+            Hugging Face Dataset is returned, so rows are only read as they are iterated. Defaults to True.
+        filter_column (str, optional): Column to filter the split on, keeping only rows whose value is one
+            of `accepted_values`. The filter runs on the Arrow table (see `pool_filter`), before any
+            rows are converted to Python objects. Requires a `split`. Defaults to None.
+        accepted_values (list, optional): The values of `filter_column` to keep. Defaults to None.
 
     Returns:
         list or Dataset: The downloaded dataset as a list of items,
@@ -111,6 +117,11 @@ def huggingface_download(
 
     if split:
         dset = dset[split]
+    if filter_column:
+        assert split, "Filtering requires a single `split`."
+        dset = pool_filter(dset, filter_column, accepted_values)
+    if not as_list:
+        return dset
 
     try:
         dset = dset.to_list()
@@ -137,14 +148,49 @@ def convert_to_utf8(file_path):
 
 
 
-def process_zipped_file(zip_file):
-    dset = []
-    with zipfile.ZipFile(zip_file, 'r') as z:
-        for json_file in z.namelist():
-            if json_file.endswith(".json"):
-                data = json.load(z.open(json_file))
-                dset.append(data)
-    return dset
+def iter_zipped_json(zip_file, num_workers=None):
+    """Yields the JSON text of every `.json` member of a zip, in order, on one line each.
+
+    Batches of members are read and decompressed ahead on `num_workers` threads (zlib releases the GIL),
+    at most two batches per thread, so memory stays bounded however slowly the members are consumed.
+    """
+    num_workers = num_workers or multiprocessing.cpu_count()
+    with zipfile.ZipFile(zip_file, "r") as z, ThreadPoolExecutor(num_workers) as executor:
+        names = [name for name in z.namelist() if name.endswith(".json")]
+        batches = (names[i:i + ZIP_MEMBERS_PER_TASK] for i in range(0, len(names), ZIP_MEMBERS_PER_TASK))
+
+        def read_batch(batch):
+            # A leading BOM is not JSON, once joined with other members. JSON strings cannot contain
+            # raw line breaks, so they are whitespace between tokens.
+            return [
+                z.read(name).removeprefix(codecs.BOM_UTF8).replace(b"\r", b" ").replace(b"\n", b" ")
+                for name in batch
+            ]
+
+        pending = deque(executor.submit(read_batch, batch) for batch in it.islice(batches, 2 * num_workers))
+        while pending:
+            members = pending.popleft().result()
+            for batch in it.islice(batches, 1):
+                pending.append(executor.submit(read_batch, batch))
+            yield from members
+
+
+def process_zipped_file(zip_file, cache_dir=constants.DOWNLOAD_CACHE_DIR, sha256=None):
+    """Yields the record in every `.json` member of a zip, in order, as they are read.
+
+    The first run also caches the members' JSON as jsonlines, so later runs read the records one
+    line at a time, without decompressing the zip. The cache is keyed by the zip's `sha256` if
+    given (e.g. as known by the download cache), else by its path, size and modification time.
+    """
+    if sha256 is not None:
+        key = f"zip-jsonl:{sha256}"
+    else:
+        stat = os.stat(zip_file)
+        key = f"zip-jsonl:{os.path.abspath(zip_file)}:{stat.st_size}:{stat.st_mtime_ns}"
+    lines = download_cache.cached_lines(key, lambda: iter_zipped_json(zip_file), cache_dir=cache_dir)
+    # Parsing a batch of lines as one JSON array is faster than parsing each line on its own.
+    while batch := list(it.islice(lines, ZIP_MEMBERS_PER_TASK)):
+        yield from json.loads(b"[" + b",".join(batch) + b"]")
 
 
 ###########################################################################
@@ -153,38 +199,38 @@ def process_zipped_file(zip_file):
 
 
 def download_flan_collection_sni(accepted_filter_ids):
-    dset = huggingface_download(
-        "DataProvenanceInitiative/niv2_submix_original", split="train"
+    return huggingface_download(
+        "DataProvenanceInitiative/niv2_submix_original", split="train", as_list=False,
+        filter_column="task_name", accepted_values=accepted_filter_ids,
     )
-    return pool_filter(dset, "task_name", accepted_filter_ids)
 
 
 def download_flan_collection_cot(accepted_filter_ids):
-    dset = huggingface_download(
-        "DataProvenanceInitiative/cot_submix_original", split="train"
+    return huggingface_download(
+        "DataProvenanceInitiative/cot_submix_original", split="train", as_list=False,
+        filter_column="task_name", accepted_values=accepted_filter_ids,
     )
-    return pool_filter(dset, "task_name", accepted_filter_ids)
 
 
 def download_flan_collection_dialog(accepted_filter_ids):
-    dset = huggingface_download(
-        "DataProvenanceInitiative/dialog_submix_original", split="train"
+    return huggingface_download(
+        "DataProvenanceInitiative/dialog_submix_original", split="train", as_list=False,
+        filter_column="task_name", accepted_values=accepted_filter_ids,
     )
-    return pool_filter(dset, "task_name", accepted_filter_ids)
 
 
 def download_flan_collection_flan2021(accepted_filter_ids):
-    dset = huggingface_download(
-        "DataProvenanceInitiative/flan2021_submix_original", split="train"
+    return huggingface_download(
+        "DataProvenanceInitiative/flan2021_submix_original", split="train", as_list=False,
+        filter_column="task_name", accepted_values=accepted_filter_ids,
     )
-    return pool_filter(dset, "task_name", accepted_filter_ids)
 
 
 def download_flan_collection_p3(accepted_filter_ids):
-    dset = huggingface_download(
-        "DataProvenanceInitiative/t0_submix_original", split="train"
+    return huggingface_download(
+        "DataProvenanceInitiative/t0_submix_original", split="train", as_list=False,
+        filter_column="task_name", accepted_values=accepted_filter_ids,
     )
-    return pool_filter(dset, "task_name", accepted_filter_ids)
 
 
 def download_xp3x(accepted_filter_ids, sample_threshold=100):
@@ -226,33 +272,33 @@ def download_xp3x_sample(accepted_filter_ids):
     langs = list(set([task.split("/")[0] for task in accepted_filter_ids]))
 
     for t in tasks:
-        raw_dset = huggingface_download("Muennighoff/xP3x-sample", t, split="train")
-        raw_dset = pool_filter(raw_dset, "language", langs)
+        raw_dset = huggingface_download(
+            "Muennighoff/xP3x-sample", t, split="train", filter_column="language", accepted_values=langs)
         dset.extend(raw_dset)
 
     return dset
 
 
 def download_commitpackft(accepted_filter_ids):
-    dset = []
     for lang in accepted_filter_ids:
-        raw_dset = huggingface_download("bigcode/commitpackft", lang, split="train")
-        dset.extend(raw_dset)
-    return dset
+        yield from huggingface_download("bigcode/commitpackft", lang, split="train", as_list=False)
 
 
 def download_dolly_15k(accepted_filter_ids):
-    dset = huggingface_download("databricks/databricks-dolly-15k", split="train")
-    return pool_filter(dset, "category", accepted_filter_ids)
+    return huggingface_download(
+        "databricks/databricks-dolly-15k", split="train", filter_column="category", accepted_values=accepted_filter_ids,
+    )
 
 
 def download_thai_gen_ai_dolly(accepted_filter_ids):
-    dset = huggingface_download("Thaweewat/databricks-dolly-15k-th", split="train")
-    return pool_filter(dset, "category", accepted_filter_ids)
+    return huggingface_download(
+        "Thaweewat/databricks-dolly-15k-th", split="train", filter_column="category", accepted_values=accepted_filter_ids,
+    )
 
 
 def download_laion_oig(accepted_filter_ids):
     dsets = []
+    # Each filter ID is its own file, so only the accepted subsets are downloaded.
     for dset_name in accepted_filter_ids:
         dset = huggingface_download(
             "laion/oig", data_files=f"{dset_name}.jsonl", split="train"
@@ -264,8 +310,9 @@ def download_laion_oig(accepted_filter_ids):
 
 
 def download_capybara(accepted_filter_ids):
-    dset = huggingface_download("LDJnr/Capybara", split="train")
-    return pool_filter(dset, "source", accepted_filter_ids)
+    return huggingface_download(
+        "LDJnr/Capybara", split="train", filter_column="source", accepted_values=accepted_filter_ids,
+    )
 
 
 def download_self_instruct(accepted_filter_ids):
@@ -303,18 +350,21 @@ def download_thai_gen_ai_alpaca(accepted_filter_ids):
 
 
 def download_stanford_human_preferences(accepted_filter_ids):
-    dset = huggingface_download("stanfordnlp/SHP", split="train")
-    return pool_filter(dset, "domain", accepted_filter_ids)
+    return huggingface_download(
+        "stanfordnlp/SHP", split="train", filter_column="domain", accepted_values=accepted_filter_ids,
+    )
 
 
 def download_open_assistant(accepted_filter_ids):
-    dset = huggingface_download("OpenAssistant/oasst1", split="train")
-    return pool_filter(dset, "lang", accepted_filter_ids)
+    return huggingface_download(
+        "OpenAssistant/oasst1", split="train", filter_column="lang", accepted_values=accepted_filter_ids,
+    )
 
 
 def download_open_assistant_v2(accepted_filter_ids):
-    dset = huggingface_download("OpenAssistant/oasst2", split="train")
-    return pool_filter(dset, "lang", accepted_filter_ids)
+    return huggingface_download(
+        "OpenAssistant/oasst2", split="train", filter_column="lang", accepted_values=accepted_filter_ids,
+    )
 
 
 def download_open_assistant_octopack(accepted_filter_ids):
@@ -323,8 +373,9 @@ def download_open_assistant_octopack(accepted_filter_ids):
 
 def download_longform(accepted_filter_ids):
     # Intentionally omitting BigBench.
-    dset = huggingface_download("akoksal/LongForm", split="train")
-    return pool_filter(dset, "source", accepted_filter_ids)
+    return huggingface_download(
+        "akoksal/LongForm", split="train", filter_column="source", accepted_values=accepted_filter_ids,
+    )
 
 
 def download_gpteacher(accepted_filter_ids):
@@ -393,13 +444,15 @@ def download_alpaca(accepted_filter_ids):
 
 
 def download_deita_10k(accepted_filter_ids):
-    dset = huggingface_download("hkust-nlp/deita-10k-v0", split="train")
-    return pool_filter(dset, "source", accepted_filter_ids)
+    return huggingface_download(
+        "hkust-nlp/deita-10k-v0", split="train", filter_column="source", accepted_values=accepted_filter_ids,
+    )
 
 
 def download_metamathqa(accepted_filter_ids):
-    dset = huggingface_download("meta-math/MetaMathQA", split="train")
-    return pool_filter(dset, "type", accepted_filter_ids)
+    return huggingface_download(
+        "meta-math/MetaMathQA", split="train", filter_column="type", accepted_values=accepted_filter_ids,
+    )
 
 
 def download_pure_dove(accepted_filter_ids):
@@ -439,13 +492,13 @@ def download_llama2_med_tuned_instructions(accepted_filter_ids):
 
 def download_sharegpt_vicuna(accepted_filter_ids):
     sharegpt_dir = "anon8231489123/ShareGPT_Vicuna_unfiltered"
-    sv_dset_p1 = hf_hub_download(
+    sv_dset_p1 = download_cache.hf_hub_download(
         repo_id=sharegpt_dir,
         filename="sg_90k_part1_html_cleaned.json",
         subfolder="HTML_cleaned_raw_dataset",
         repo_type="dataset",
     )
-    sv_dset_p2 = hf_hub_download(
+    sv_dset_p2 = download_cache.hf_hub_download(
         repo_id=sharegpt_dir,
         filename="sg_90k_part1_html_cleaned.json",
         subfolder="HTML_cleaned_raw_dataset",
@@ -461,7 +514,7 @@ def download_code_alpaca(accepted_filter_ids):
 
 
 def download_hc3_en(accepted_filter_ids):
-    dset_fpath = hf_hub_download(
+    dset_fpath = download_cache.hf_hub_download(
         repo_id="Hello-SimpleAI/HC3", filename="all.jsonl", repo_type="dataset"
     )
     dset = pd.read_json(dset_fpath, lines=True).to_dict("records")
@@ -469,131 +522,37 @@ def download_hc3_en(accepted_filter_ids):
 
 
 def download_hc3_zh(accepted_filter_ids):
-    dset_fpath = hf_hub_download(
+    dset_fpath = download_cache.hf_hub_download(
         repo_id="Hello-SimpleAI/HC3-Chinese", filename="all.jsonl", repo_type="dataset"
     )
     dset = pd.read_json(dset_fpath, lines=True).to_dict("records")
     return pool_filter(dset, "source", accepted_filter_ids)
 
 
-def download_camel_science(accepted_filter_ids):
-    dset = []
-    if "physics" in accepted_filter_ids:
-        physics_zip = hf_hub_download(
-            repo_id="camel-ai/physics", filename="physics.zip", repo_type="dataset"
-        )
-        physics_dset = process_zipped_file(physics_zip)
-        dset += annotate_source(physics_dset, "physics")
-    if "chemistry" in accepted_filter_ids:
-        chemistry_zip = hf_hub_download(
-            repo_id="camel-ai/chemistry", filename="chemistry.zip", repo_type="dataset"
-        )
-        chemistry_dset = process_zipped_file(chemistry_zip)
-        dset += annotate_source(chemistry_dset, "chemistry")
-    if "biology" in accepted_filter_ids:
-        biology_zip = hf_hub_download(
-            repo_id="camel-ai/biology", filename="biology.zip", repo_type="dataset"
-        )
-        biology_dset = process_zipped_file(biology_zip)
-        dset += annotate_source(biology_dset, "biology")
-    if "math" in accepted_filter_ids:
-        math_zip = hf_hub_download(
-            repo_id="camel-ai/math",
-            filename="math.zip",
-            repo_type="dataset"
-        )
-        math_dset = process_zipped_file(math_zip)
-        dset += annotate_source(math_dset, "math")
-    if "code" in accepted_filter_ids:
-        code_zip = hf_hub_download(
-            repo_id="camel-ai/code",
-            filename="code_chat.zip",
-            repo_type="dataset"
-        )
-        code_dset = process_zipped_file(code_zip)
-        dset += annotate_source(code_dset, "code")
-    if "ai-society-translated-ar" in accepted_filter_ids:
-        language_ar_zip = hf_hub_download(
-            repo_id="camel-ai/ai_society_translated",
-            filename="ai_society_chat_ar.zip",
-            repo_type="dataset",
-        )
-        language_ar_dset = process_zipped_file(language_ar_zip)
-        dset += annotate_source(language_ar_dset, "ai-society-translated-ar")
-    if "ai-society-translated-zh" in accepted_filter_ids:
-        language_zh_zip = hf_hub_download(
-            repo_id="camel-ai/ai_society_translated",
-            filename="ai_society_chat_zh.zip",
-            repo_type="dataset",
-        )
-        language_zh_dset = process_zipped_file(language_zh_zip)
-        dset += annotate_source(language_zh_dset, "ai-society-translated-zh")
-    if "ai-society-translated-ko" in accepted_filter_ids:
-        language_ko_zip = hf_hub_download(
-            repo_id="camel-ai/ai_society_translated",
-            filename="ai_society_chat_ko.zip",
-            repo_type="dataset",
-        )
-        language_ko_dset = process_zipped_file(language_ko_zip)
-        dset += annotate_source(language_ko_dset, "ai-society-translated-ko")
-    if "ai-society-translated-ja" in accepted_filter_ids:
-        language_ja_zip = hf_hub_download(
-            repo_id="camel-ai/ai_society_translated",
-            filename="ai_society_chat_ja.zip",
-            repo_type="dataset",
-        )
-        language_ja_dset = process_zipped_file(language_ja_zip)
-        dset += annotate_source(language_ja_dset, "ai-society-translated-ja")
-    if "ai-society-translated-hi" in accepted_filter_ids:
-        language_hi_zip = hf_hub_download(
-            repo_id="camel-ai/ai_society_translated",
-            filename="ai_society_chat_hi.zip",
-            repo_type="dataset",
-        )
-        language_hi_dset = process_zipped_file(language_hi_zip)
-        dset += annotate_source(language_hi_dset, "ai-society-translated-hi")
-    if "ai-society-translated-ru" in accepted_filter_ids:
-        language_ru_zip = hf_hub_download(
-            repo_id="camel-ai/ai_society_translated",
-            filename="ai_society_chat_ru.zip",
-            repo_type="dataset",
-        )
-        language_ru_dset = process_zipped_file(language_ru_zip)
-        dset += annotate_source(language_ru_dset, "ai-society-translated-ru")
-    if "ai-society-translated-es" in accepted_filter_ids:
-        language_es_zip = hf_hub_download(
-            repo_id="camel-ai/ai_society_translated",
-            filename="ai_society_chat_es.zip",
-            repo_type="dataset",
-        )
-        language_es_dset = process_zipped_file(language_es_zip)
-        dset += annotate_source(language_es_dset, "ai-society-translated-es")
-    if "ai-society-translated-fr" in accepted_filter_ids:
-        language_fr_zip = hf_hub_download(
-            repo_id="camel-ai/ai_society_translated",
-            filename="ai_society_chat_fr.zip",
-            repo_type="dataset",
-        )
-        language_fr_dset = process_zipped_file(language_fr_zip)
-        dset += annotate_source(language_fr_dset, "ai-society-translated-fr")
-    if "ai-society-translated-de" in accepted_filter_ids:
-        language_de_zip = hf_hub_download(
-            repo_id="camel-ai/ai_society_translated",
-            filename="ai_society_chat_de.zip",
-            repo_type="dataset",
-        )
-        language_de_dset = process_zipped_file(language_de_zip)
-        dset += annotate_source(language_de_dset, "ai-society-translated-de")
-    if "ai-society-translated-it" in accepted_filter_ids:
-        language_it_zip = hf_hub_download(
-            repo_id="camel-ai/ai_society_translated",
-            filename="ai_society_chat_it.zip",
-            repo_type="dataset",
-        )
-        language_it_dset = process_zipped_file(language_it_zip)
-        dset += annotate_source(language_it_dset, "ai-society-translated-it")
+# Camel-AI filter ID --> (Hugging Face dataset, zip of its conversations).
+CAMEL_SCIENCE_ZIPS = {
+    "physics": ("camel-ai/physics", "physics.zip"),
+    "chemistry": ("camel-ai/chemistry", "chemistry.zip"),
+    "biology": ("camel-ai/biology", "biology.zip"),
+    "math": ("camel-ai/math", "math.zip"),
+    "code": ("camel-ai/code", "code_chat.zip"),
+    **{
+        f"ai-society-translated-{lang}": ("camel-ai/ai_society_translated", f"ai_society_chat_{lang}.zip")
+        for lang in ["ar", "zh", "ko", "ja", "hi", "ru", "es", "fr", "de", "it"]
+    },
+}
 
-    return dset
+
+def download_camel_science(accepted_filter_ids):
+    # Streams the records of each zip as they are read, downloading each zip when its turn comes.
+    for filter_id, (repo_id, filename) in CAMEL_SCIENCE_ZIPS.items():
+        if filter_id in accepted_filter_ids:
+            zip_path = download_cache.hf_hub_download(repo_id=repo_id, filename=filename, repo_type="dataset")
+            # Cached blobs are named by their sha256, so the zip needn't be hashed again.
+            for row in process_zipped_file(zip_path, sha256=os.path.basename(zip_path)):
+                # annotate each example with source
+                row["_source"] = filter_id
+                yield row
 
 
 def download_cot_collection(accepted_filter_ids):
@@ -603,7 +562,7 @@ def download_cot_collection(accepted_filter_ids):
             raw_dset = huggingface_download("kaist-ai/CoT-Collection", split="train")
             dset.extend(annotate_source(raw_dset, "en"))
         else:
-            fpath = hf_hub_download(
+            fpath = download_cache.hf_hub_download(
                 repo_id="kaist-ai/CoT-Collection_multilingual",
                 filename=f"CoT_collection_{lang}.json",
                 subfolder="data",
@@ -616,8 +575,9 @@ def download_cot_collection(accepted_filter_ids):
 
 
 def download_gpt4all(accepted_filter_ids):
-    dset = huggingface_download("nomic-ai/gpt4all-j-prompt-generations", split="train")
-    return pool_filter(dset, "source", accepted_filter_ids)
+    return huggingface_download(
+        "nomic-ai/gpt4all-j-prompt-generations", split="train", filter_column="source", accepted_values=accepted_filter_ids,
+    )
 
 
 def download_evol_instruct_v2(accepted_filter_ids):
@@ -631,13 +591,15 @@ def download_gpt4_alpaca(accepted_filter_ids):
 
 
 def download_tasksource_instruct(accepted_filter_ids):
-    dset = huggingface_download("tasksource/tasksource-instruct-v0", split="train")
-    return pool_filter(dset, "task", accepted_filter_ids)
+    return huggingface_download(
+        "tasksource/tasksource-instruct-v0", split="train", filter_column="task", accepted_values=accepted_filter_ids,
+    )
 
 
 def download_tasksource_symbol_tuning(accepted_filter_ids):
-    dset = huggingface_download("tasksource/icl-symbol-tuning-instruct", split="train")
-    return pool_filter(dset, "task", accepted_filter_ids)
+    return huggingface_download(
+        "tasksource/icl-symbol-tuning-instruct", split="train", filter_column="task", accepted_values=accepted_filter_ids,
+    )
 
 
 def download_stack_exchange_instruction(accepted_filter_ids):
@@ -662,7 +624,7 @@ def download_thai_gen_ai_gpteacher(accepted_filter_ids):
 
 
 def download_lmsys_chat_1m(accepted_filter_ids):
-    return huggingface_download('lmsys/lmsys-chat-1m', split='train')
+    return huggingface_download('lmsys/lmsys-chat-1m', split='train', as_list=False)
 
 def download_tiny_stories(accepted_filter_ids):
     return huggingface_download("roneneldan/TinyStoriesInstruct", split="train")
@@ -674,8 +636,9 @@ def download_joke_explanation(accepted_filter_ids):
 
 
 def download_ultraFeedback_argilla(accepted_filter_ids):
-    dset = huggingface_download('argilla/ultrafeedback-binarized-preferences', split='train')
-    return pool_filter(dset, "source", accepted_filter_ids)
+    return huggingface_download(
+        'argilla/ultrafeedback-binarized-preferences', split='train', filter_column="source", accepted_values=accepted_filter_ids,
+    )
 
   
 def download_longalign_10k(accepted_filter_ids):
@@ -683,10 +646,10 @@ def download_longalign_10k(accepted_filter_ids):
 
 
 def download_book_summaries(accepted_filter_ids):
-    dset = huggingface_download(
-        "emozilla/booksum-summary-analysis_gptneox-8192", split="train"
+    return huggingface_download(
+        "emozilla/booksum-summary-analysis_gptneox-8192", split="train",
+        filter_column="type", accepted_values=accepted_filter_ids,
     )
-    return pool_filter(dset, "type", accepted_filter_ids)
 
 
 def download_pii_masking_200k(accepted_filter_ids):
@@ -694,8 +657,9 @@ def download_pii_masking_200k(accepted_filter_ids):
 
 
 def download_no_robots(accepted_filter_ids):
-    dset = huggingface_download("HuggingFaceH4/no_robots", split="train")
-    return pool_filter(dset, "category", accepted_filter_ids)
+    return huggingface_download(
+        "HuggingFaceH4/no_robots", split="train", filter_column="category", accepted_values=accepted_filter_ids,
+    )
 
 
 def download_help_steer(accepted_filter_ids):
@@ -716,20 +680,23 @@ def download_ultrachat(accepted_filter_ids):
 
 def download_wildchat(accepted_filter_ids):
     """downloads in the wild chat dataset from hugging face"""
-    dset = huggingface_download("allenai/WildChat", split="train")
-    return pool_filter(dset, "model", accepted_filter_ids)
+    return huggingface_download(
+        "allenai/WildChat", split="train", filter_column="model", accepted_values=accepted_filter_ids,
+    )
 
 def download_seacrowd(accepted_filter_ids):
-    dset = huggingface_download("DataProvenanceInitiative/seacrowd", split="train")
-    return pool_filter(dset, "user_parent", accepted_filter_ids)
+    return huggingface_download(
+        "DataProvenanceInitiative/seacrowd", split="train", filter_column="user_parent", accepted_values=accepted_filter_ids,
+    )
 
 
 def download_airoboros(accepted_filter_ids):
     return huggingface_download('jondurbin/airoboros-3.2', split='train')
 
 def download_lima(accepted_filter_ids):
-    dset = huggingface_download("GAIR/lima", split="train")
-    return pool_filter(dset, "source", accepted_filter_ids)
+    return huggingface_download(
+        "GAIR/lima", split="train", filter_column="source", accepted_values=accepted_filter_ids,
+    )
 
 
 def download_open_orca(accepeted_filter_ids):
@@ -739,8 +706,9 @@ def download_open_orca(accepeted_filter_ids):
 
 
 def download_pmc_llama(accepted_filter_ids):
-    dset = huggingface_download("axiong/pmc_llama_instructions", split="train")
-    return pool_filter(dset, "source", accepted_filter_ids)
+    return huggingface_download(
+        "axiong/pmc_llama_instructions", split="train", filter_column="source", accepted_values=accepted_filter_ids,
+    )
 
 
 def download_medical_meadow(accepted_filter_ids):
@@ -876,12 +844,11 @@ def download_tool_llama(accepted_filter_ids):
         "confirm": "yes",
     }
 
-    response = requests.get(url, params=params, verify=False, stream=True)
-    response.raise_for_status()
+    zip_path = download_cache.request(url, params=params, verify=False)
 
     # Docs describe a directory hierarchy in this zip file containing all the
     # tasks, and says their training splits are consolidated in this one file
-    with zipfile.ZipFile(BytesIO(response.content), "r") as z:
+    with zipfile.ZipFile(zip_path, "r") as z:
         with z.open("data/toolllama_G123_dfs_train.json", "r") as f:
             data = json.load(f)
 
@@ -942,7 +909,8 @@ def download_gorilla(accepted_filter_ids):
     tmp = []
     for file in files:
         url = base_url + file
-        txt = requests.get(url).text
+        with open(download_cache.request(url), "r", encoding="utf-8") as f:
+            txt = f.read()
 
         for line in txt.splitlines():
             line = json.loads(line)
@@ -1148,8 +1116,9 @@ def download_chatdoctor(accepted_filter_ids):
 
 
 def download_seabench(accepted_filter_ids):
-    dset = huggingface_download("SeaLLMs/Sea-bench", split="train")
-    return pool_filter(dset, "lang", accepted_filter_ids)
+    return huggingface_download(
+        "SeaLLMs/Sea-bench", split="train", filter_column="lang", accepted_values=accepted_filter_ids,
+    )
 
 
 def download_agentinstruct(accepted_filter_ids):
@@ -1205,13 +1174,15 @@ def download_indic_instruct(accepted_filter_ids):
 
 
 def download_open_platypus(accepted_filter_ids):
-    dset = huggingface_download("garage-bAInd/Open-Platypus", split="train")
-    return pool_filter(dset, "data_source", accepted_filter_ids)
+    return huggingface_download(
+        "garage-bAInd/Open-Platypus", split="train", filter_column="data_source", accepted_values=accepted_filter_ids,
+    )
 
 
 def download_bactrianx(accepted_filter_ids):
     """Download Bactrian-X dataset from HuggingFace"""
     dsets = []
+    # Each filter ID is its own config, so only the accepted languages are downloaded.
     for dset_name in accepted_filter_ids:
         dset = huggingface_download("MBZUAI/Bactrian-X", name=dset_name, split="train")
         # annotate each example with source
@@ -1325,8 +1296,9 @@ def download_expertqa(accepted_filter_ids):
   
 
 def download_openmath_instruct(accepted_filter_ids):
-    dset = huggingface_download("nvidia/OpenMathInstruct-1", split="train")
-    return pool_filter(dset, "dataset", accepted_filter_ids)
+    return huggingface_download(
+        "nvidia/OpenMathInstruct-1", split="train", filter_column="dataset", accepted_values=accepted_filter_ids,
+    )
   
 
 def download_opengpt_healthcare(accepted_filter_ids):
@@ -1384,17 +1356,19 @@ def download_dialogstudio(accepted_filter_ids):
     return dsets
 
 def download_lumos_planning(accepted_filter_ids):
-    dset = huggingface_download('ai2lumos/lumos_unified_plan_iterative', split='train')
-    return pool_filter(dset, "dataset", accepted_filter_ids)
+    return huggingface_download(
+        'ai2lumos/lumos_unified_plan_iterative', split='train', filter_column="dataset", accepted_values=accepted_filter_ids,
+    )
 
 def download_lumos_grounding(accepted_filter_ids):
-    dset = huggingface_download('ai2lumos/lumos_unified_ground_iterative', split='train')
-    return pool_filter(dset, "dataset", accepted_filter_ids)
+    return huggingface_download(
+        'ai2lumos/lumos_unified_ground_iterative', split='train', filter_column="dataset", accepted_values=accepted_filter_ids,
+    )
 
 def download_dynosaur(accepted_filter_ids):
-    dset = huggingface_download('Dynosaur/dynosaur-full', split='train')
-    return pool_filter(dset, "taskname", accepted_filter_ids)
+    return huggingface_download(
+        'Dynosaur/dynosaur-full', split='train', filter_column="taskname", accepted_values=accepted_filter_ids,
+    )
 
 def download_inst_ar(accepted_filter_ids):
-    dset = huggingface_download("ClusterlabAi/InstAr-500k", split="train")
-    return pool_filter(dset, "source", accepted_filter_ids)
\ No newline at end of file
+    return huggingface_download("ClusterlabAi/InstAr-500k", split="train", filter_column="source", accepted_values=accepted_filter_ids)
\ No newline at end of file
@@ -0,0 +1,243 @@
+import argparse
+import json
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from helpers import io
+from helpers.filter_index import FilterIndex
+import data_provenance_card as data_provenance_card
+from download_and_filter import check_args, get_collection_to_uid_and_filter_ids, get_filter_kwargs, get_parser
+
+
+class FilterService:
+    """Keeps the constants, license-mapped catalog and filter index warm in memory,
+    and answers filter queries with the same parameters as `download_and_filter.py`."""
+
+    def __init__(self, summary_dir="data_summaries/", constants_dir="constants/"):
+        self.summary_dir = summary_dir
+        self.constants_dir = constants_dir
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        """(Re)loads the constants and catalog, e.g. after the data summaries change."""
+        all_constants = io.read_all_constants(self.constants_dir, reload=True)
+        catalog = io.load_catalog(self.summary_dir, self.constants_dir)
+        index = FilterIndex(catalog, all_constants)
+        parser = get_parser(all_constants)
+        # Defaults come from the same config files as the command line.
+        defaults = parser.parse_args([])
+        with self._lock:
+            self.all_constants, self.catalog, self.index = all_constants, catalog, index
+            self.parser, self.defaults = parser, defaults
+        return self.status()
+
+    def status(self):
+        catalog = self.catalog
+        return {
+            "status": "ok",
+            "catalog_hash": catalog.attrs.get("catalog_hash"),
+            "num_datasets": len(catalog),
+            "catalog_update": catalog.attrs.get("catalog_update"),
+        }
+
+    def _snapshot(self):
+        """The parser, defaults and filter index of one load, so a query never mixes them with a concurrent `reload`."""
+        with self._lock:
+            return self.parser, self.defaults, self.index
+
+    def parse_query(self, query, parser=None, defaults=None):
+        """Converts a JSON query into command line `args`, validated against the command line choices.
+
+        Keys are the command line option names, with either dashes or underscores,
+        e.g. {"license_use": "commercial", "languages": ["English"], "model-generated": "0"}.
+        Values are converted with each option's `type`, as the command line would. Raises `ValueError`
+        for anything the command line would reject.
+        """
+        if parser is None:
+            parser, defaults, _ = self._snapshot()
+        if not isinstance(query, dict):
+            raise ValueError(f"The query must be a JSON object, not {type(query).__name__}.")
+        args = argparse.Namespace(**vars(defaults))
+        actions = {action.dest: action for action in parser._actions}
+        for key, value in query.items():
+            dest = key.lstrip("-").replace("-", "_")
+            if dest not in actions or dest in ["config", "help", "explain"]:
+                raise ValueError(f"Unknown filter argument: {key}")
+            action = actions[dest]
+            if action.nargs == 0:
+                # Flags, e.g. `--stratify`.
+                if not isinstance(value, bool):
+                    raise ValueError(f"Invalid value for {key}: {value!r}. Expected true or false.")
+                setattr(args, dest, value)
+                continue
+            if action.nargs == "*" and not isinstance(value, list):
+                value = [value]
+            elif action.nargs != "*" and isinstance(value, list):
+                raise ValueError(f"Invalid value for {key}: {value!r}. Expected a single value.")
+            converted = [self._convert(key, action, v) for v in (value if isinstance(value, list) else [value])]
+            setattr(args, dest, converted if isinstance(value, list) else converted[0])
+        check_args(args)
+        return args
+
+    @staticmethod
+    def _convert(key, action, value):
+        """Converts one query value as argparse converts a command line string: with the option's `type`,
+        then checked against its `choices`."""
+        if value is None:
+            return None
+        if isinstance(value, (dict, list, bool)):
+            raise ValueError(f"Invalid value for {key}: {value!r}.")
+        value = str(value)
+        if action.type is not None:
+            try:
+                value = action.type(value)
+            except (TypeError, ValueError, argparse.ArgumentTypeError):
+                raise ValueError(f"Invalid value for {key}: {value!r}.")
+        if action.choices is not None and value not in action.choices:
+            raise ValueError(f"Invalid choice for {key}: {value}. Options are {list(action.choices)}.")
+        return value
+
+    def query(self, query, data_card=True, explain=False):
+        """Returns the datasets that pass the filters in `query`, grouped by collection,
+        and optionally the data provenance card for them, and which filter removed the others."""
+        start = time.perf_counter()
+        parser, defaults, index = self._snapshot()
+        args = self.parse_query(query, parser, defaults)
+        filter_kwargs = get_filter_kwargs(args)
+        if data_card:
+            filtered_data_summary = index.filter(**filter_kwargs)
+            uids = filtered_data_summary["Unique Dataset Identifier"].tolist()
+        else:
+            mask = index.mask(**filter_kwargs)
+            filtered_data_summary = index.df[mask]
+            uids = index.uids[mask].tolist()
+
+        collection_to_keys = get_collection_to_uid_and_filter_ids(filtered_data_summary)
+        result = {
+            "num_datasets": len(uids),
+            "num_collections": len(collection_to_keys),
+            "uids": uids,
+            "collections": collection_to_keys,
+        }
+        if data_card:
+            result["data_card"] = data_provenance_card.create_datacard(
+                filtered_data_summary, args.licenses, args.languages, args.tasks,
+            ) if uids else ""
+        if explain:
+            result["explanation"] = index.explain(**filter_kwargs)
+        result["elapsed_ms"] = round(1000 * (time.perf_counter() - start), 3)
+        return result
+
+
+    def creation_date_counts(self, query, freq="YS", cumulative=False):
+        """Number of datasets that pass the filters in `query`, per `Estimated Creation Date` bucket."""
+        parser, defaults, index = self._snapshot()
+        args = self.parse_query(query, parser, defaults)
+        counts = index.count_by_creation_date(index.mask(**get_filter_kwargs(args)), freq=freq, cumulative=cumulative)
+        return {
+            "buckets": [bucket.strftime("%Y-%m-%d") for bucket in counts.index],
+            "counts": counts.tolist(),
+        }
+
+
+class FilterRequestHandler(BaseHTTPRequestHandler):
+    """HTTP/JSON interface to a `FilterService`:
+
+        GET  /health  --> catalog status
+        POST /filter  --> {"query": {<command line args>}, "data_card": true, "explain": false}
+        POST /creation_dates  --> {"query": {<command line args>}, "freq": "YS", "cumulative": false}
+        POST /reload  --> reloads the catalog from disk
+    """
+    service = None
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self, options):
+        """Reads the request body, a JSON object whose `options` (name --> (type, default)) are checked
+        up front. Raises `ValueError` for a malformed request."""
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not isinstance(request, dict):
+            raise ValueError(f"The request body must be a JSON object, not {type(request).__name__}.")
+        unknown = set(request) - set(options) - {"query"}
+        if unknown:
+            raise ValueError(f"Unknown request fields: {sorted(unknown)}")
+        for name, (option_type, default) in options.items():
+            request.setdefault(name, default)
+            if not isinstance(request[name], option_type):
+                raise ValueError(f"`{name}` must be a {option_type.__name__}, not {type(request[name]).__name__}.")
+        request.setdefault("query", {})
+        return request
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, self.service.status())
+        else:
+            self._send_json(404, {"error": f"Unknown path: {self.path}"})
+
+    def do_POST(self):
+        try:
+            if self.path == "/filter":
+                request = self._read_json({"data_card": (bool, True), "explain": (bool, False)})
+                result = self.service.query(request["query"], data_card=request["data_card"], explain=request["explain"])
+                self._send_json(200, result)
+            elif self.path == "/creation_dates":
+                request = self._read_json({"freq": (str, "YS"), "cumulative": (bool, False)})
+                result = self.service.creation_date_counts(
+                    request["query"], freq=request["freq"], cumulative=request["cumulative"])
+                self._send_json(200, result)
+            elif self.path == "/reload":
+                self._send_json(200, self.service.reload())
+            else:
+                self._send_json(404, {"error": f"Unknown path: {self.path}"})
+        except ValueError as e:
+            # A malformed request: invalid JSON, fields or filter arguments (see `FilterService.parse_query`).
+            self._send_json(400, {"error": str(e)})
+        except Exception as e:
+            # Anything else is a server error, which still gets a response rather than a closed connection.
+            self.log_error("Error handling %s: %s", self.path, traceback.format_exc())
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def serve(host, port, verbose=False):
+    FilterRequestHandler.service = FilterService()
+    server = ThreadingHTTPServer((host, port), FilterRequestHandler)
+    server.verbose = verbose
+    print(f"Serving filter queries on http://{host}:{port} ({FilterRequestHandler.service.status()['num_datasets']} datasets)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    """
+    Example run (from the repository root):
+
+    python src/filter_server.py --port 8765
+
+    curl -s localhost:8765/filter -d '{"query": {"license_use": "commercial", "languages": ["English"]}}'
+
+    See `src/scripts/load_test_filter_server.py` to measure its latency.
+    """
+    parser = argparse.ArgumentParser(description="Serve data provenance filter queries over HTTP/JSON.")
+    parser.add_argument("--host", default="127.0.0.1", help="Host to bind to.")
+    parser.add_argument("--port", default=8765, type=int, help="Port to listen on.")
+    parser.add_argument("--verbose", action="store_true", help="Log every request.")
+    args = parser.parse_args()
+    serve(args.host, args.port, verbose=args.verbose)
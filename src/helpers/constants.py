@@ -15,4 +15,37 @@ DOMAINS_CONSTANTS_FP = "domain_groups.json"
 DOMAIN_TYPES_CONSTANTS_FP = "domain_types.json"
 SOURCE_NAME_MAPPER_FP = "source_name_mapper.json"
 
+# `io.read_all_constants` key --> file in the constants folder.
+ALL_CONSTANTS_FPS = {
+    "LICENSE_CLASSES": LICENSE_CONSTANTS_FP,
+    "CUSTOM_LICENSE_CLASSES": CUSTOM_LICENSE_CONSTANTS_FP,
+    "LICENSE_PARAPHRASES": LICENSE_PARAPHRASES_FP,
+    "LANGUAGE_GROUPS": LANGUAGE_CONSTANTS_FP,
+    "TASK_GROUPS": TASK_CONSTANTS_FP,
+    "MODEL_GROUPS": MODEL_CONSTANTS_FP,
+    "CREATOR_GROUPS": CREATOR_CONSTANTS_FP,
+    "CREATOR_COUNTRY_GROUPS": CREATOR_COUNTRY_CONSTANTS_FP,
+    "FORMATS": FORMATS_CONSTANTS_FP,
+    "TOPICS": TOPIC_CONSTANTS_FP,
+    "DOMAIN_GROUPS": DOMAINS_CONSTANTS_FP,
+    "DOMAIN_TYPES": DOMAIN_TYPES_CONSTANTS_FP,
+    "SOURCE_NAME_MAPPER": SOURCE_NAME_MAPPER_FP,
+}
+
+# Compiled data summary catalog (see `io.load_catalog`).
+CACHE_DIR = ".cache"
+CATALOG_CACHE_DIR = os.path.join(CACHE_DIR, "catalog")
+CATALOG_FP = "catalog.pkl"
+CATALOG_MANIFEST_FP = "catalog_manifest.json"
+CATALOG_VALIDATION_FP = "catalog_validation.json"
+# Bump whenever the way the catalog is built changes, to invalidate stale caches.
+CATALOG_VERSION = 4
+
 LICENSE_USE_TYPES = ['commercial', 'unspecified', 'non-commercial', 'academic-only']
+
+# Content-addressed cache of downloaded files (see `download_cache.DownloadCache`).
+DOWNLOAD_CACHE_DIR = os.path.join(CACHE_DIR, "downloads")
+DOWNLOAD_MANIFEST_FP = "manifest.json"
+
+# Progress of a `download_and_filter.py` run, in its `--savedir` (see `run_manifest.RunManifest`).
+RUN_MANIFEST_FP = "run_manifest.json"
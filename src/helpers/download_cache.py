@@ -0,0 +1,329 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+import typing
+from contextlib import contextmanager
+
+import requests
+from filelock import FileLock
+
+from . import io, constants
+
+
+# Whether downloads must be served from the cache, see `set_offline`.
+_OFFLINE = False
+# Shared `DownloadCache` per cache directory, {absolute cache dir --> cache}.
+_CACHES = {}
+_CACHES_LOCK = threading.Lock()
+# The collection being downloaded on this thread, recorded against the entries it uses.
+_CURRENT = threading.local()
+# Seconds before a cache hit updates an entry's `last_used` again. Entries are evicted least recently
+# used first (see `DownloadCache.gc`), and this precision is enough, while hits rarely rewrite the manifest.
+LAST_USED_RESOLUTION = 60 * 60
+
+
+class CacheMissError(Exception):
+    """Raised in offline mode when a download is not in the cache."""
+
+
+def set_offline(offline: bool = True):
+    """In offline mode, downloads are only served from the cache, and fail fast with a
+    `CacheMissError` otherwise, rather than touching the network."""
+    global _OFFLINE
+    _OFFLINE = offline
+
+
+@contextmanager
+def for_collection(name: str):
+    """Records `name` in the manifest entry of every download made on this thread within the context,
+    so the manifest lists which bytes each collection was built from."""
+    previous = getattr(_CURRENT, "collection", None)
+    _CURRENT.collection = name
+    try:
+        yield
+    finally:
+        _CURRENT.collection = previous
+
+
+class DownloadCache:
+    """A content-addressed store of downloaded files.
+
+    Each file is stored once, as `blobs/<sha256[:2]>/<sha256>`. The manifest maps a source key
+    (a URL, a Hugging Face Hub file, or an extracted zip) to its blob, along with the ETag or revision
+    it was fetched at, its size, when it was last used, and the collections that used it.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        self.manifest_fp = os.path.join(cache_dir, constants.DOWNLOAD_MANIFEST_FP)
+        self._lock = threading.RLock()
+        # Serializes manifest updates across processes sharing `cache_dir`, e.g. two runs at once.
+        # Always taken before `_lock`, so threads of one process can't deadlock on the pair.
+        self._file_lock = FileLock(f"{self.manifest_fp}.lock")
+        # Keys this process added or used since its last save, merged into the manifest on disk by `_save`.
+        self._dirty = set()
+        self.entries = self._read_manifest()
+
+    def blob_path(self, sha256: str) -> str:
+        return os.path.join(self.cache_dir, "blobs", sha256[:2], sha256)
+
+    def get(self, key: str) -> typing.Optional[typing.Dict]:
+        """Returns the manifest entry for `key` if its blob is in the cache, marking it as used."""
+        with self._lock:
+            if key not in self.entries:
+                # Another process may have downloaded it since the manifest was read.
+                self.entries = self._merged_entries()
+            entry = self.entries.get(key)
+            if entry is None or not os.path.exists(self.blob_path(entry["sha256"])):
+                return None
+            changed = self._touch(entry)
+            if changed:
+                self._dirty.add(key)
+        if changed:
+            self._save()
+        return entry
+
+    def put(self, key: str, src_path: str, move: bool = False, link: bool = False, **metadata) -> typing.Dict:
+        """Adds the file at `src_path` to the cache as the blob for `key`, and returns its entry.
+
+        `move` moves the file into the cache, and `link` hard links it (copying it only where the
+        file system cannot link it), e.g. for files already kept in the Hugging Face cache.
+        """
+        sha256 = io.hash_file(src_path)
+        blob_path = self.blob_path(sha256)
+        tmp_path = None
+        if not os.path.exists(blob_path):
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            tmp_path = f"{blob_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            if move:
+                shutil.move(src_path, tmp_path)
+            elif link:
+                try:
+                    # A hard link, rather than a symlink, so the blob outlives the file being deleted.
+                    os.link(os.path.realpath(src_path), tmp_path)
+                except OSError:
+                    shutil.copyfile(src_path, tmp_path)
+            else:
+                shutil.copyfile(src_path, tmp_path)
+        elif move:
+            os.remove(src_path)
+        # The blob appears together with its manifest entry, so `gc` never sees it unreferenced.
+        with self._manifest_lock():
+            if tmp_path is not None:
+                os.replace(tmp_path, blob_path)
+            entry = {"sha256": sha256, "size": os.path.getsize(blob_path), "created": time.time(), "collections": [], **metadata}
+            self.entries[key] = entry
+            self._touch(entry)
+            self._dirty.add(key)
+            self._save()
+            return entry
+
+    def put_bytes(self, key: str, data: bytes, **metadata) -> typing.Dict:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=self.cache_dir, delete=False) as tmp:
+            tmp.write(data)
+        return self.put(key, tmp.name, move=True, **metadata)
+
+    def _touch(self, entry: typing.Dict) -> bool:
+        """Marks `entry` as used (see `LAST_USED_RESOLUTION`), and returns whether it changed."""
+        changed = False
+        now = time.time()
+        if now - entry.get("last_used", 0) >= LAST_USED_RESOLUTION:
+            entry["last_used"] = now
+            changed = True
+        collection = getattr(_CURRENT, "collection", None)
+        if collection and collection not in entry["collections"]:
+            entry["collections"] = sorted(entry["collections"] + [collection])
+            changed = True
+        return changed
+
+    @contextmanager
+    def _manifest_lock(self):
+        """Holds the manifest's file lock, then this instance's lock."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with self._file_lock, self._lock:
+            yield
+
+    def _read_manifest(self) -> typing.Dict:
+        return io.read_json(self.manifest_fp) if os.path.exists(self.manifest_fp) else {}
+
+    def _merged_entries(self) -> typing.Dict:
+        """The manifest on disk, with this process's unsaved changes (`_dirty`) applied on top."""
+        entries = self._read_manifest()
+        for key in self._dirty:
+            if key not in self.entries:
+                continue
+            entry = dict(self.entries[key])
+            theirs = entries.get(key)
+            if theirs is not None and theirs["sha256"] == entry["sha256"]:
+                # Both processes used the same blob: keep the latest use, and every collection.
+                entry["last_used"] = max(entry["last_used"], theirs.get("last_used", 0))
+                entry["collections"] = sorted(set(entry["collections"]) | set(theirs.get("collections", [])))
+            entries[key] = entry
+        return entries
+
+    def _save(self):
+        """Merges this process's changes into the manifest on disk, under the manifest's file lock."""
+        with self._manifest_lock():
+            self.entries = self._merged_entries()
+            self._dirty.clear()
+            self._write_manifest()
+
+    def _write_manifest(self):
+        # A temporary file of this process and thread, swapped in whole, so readers never see a partial manifest.
+        tmp_fp = f"{self.manifest_fp}.{os.getpid()}.{threading.get_ident()}.tmp"
+        io.write_json(self.entries, tmp_fp)
+        os.replace(tmp_fp, self.manifest_fp)
+
+    def gc(self, max_bytes: int) -> typing.Dict[str, int]:
+        """Evicts the least recently used blobs until the cache holds at most `max_bytes`,
+        and removes blobs no manifest entry points to.
+
+        The manifest is re-read under its file lock first, so blobs other processes added are kept.
+
+        Returns:
+            Dict: The number of blobs and bytes removed, and the bytes kept.
+        """
+        with self._manifest_lock():
+            self.entries = self._merged_entries()
+            self._dirty.clear()
+            # sha256 --> most recent use of any entry pointing to it.
+            last_used = {}
+            for entry in self.entries.values():
+                last_used[entry["sha256"]] = max(last_used.get(entry["sha256"], 0), entry["last_used"])
+            blobs = {}
+            blob_dir = os.path.join(self.cache_dir, "blobs")
+            for dirpath, _, filenames in os.walk(blob_dir):
+                for filename in filenames:
+                    # Skip blobs still being written by `put`.
+                    if not filename.endswith(".tmp"):
+                        blobs[filename] = os.path.getsize(os.path.join(dirpath, filename))
+
+            evicted = [sha for sha in blobs if sha not in last_used]
+            kept_bytes = sum(size for sha, size in blobs.items() if sha in last_used)
+            for sha in sorted((sha for sha in blobs if sha in last_used), key=last_used.get):
+                if kept_bytes <= max_bytes:
+                    break
+                evicted.append(sha)
+                kept_bytes -= blobs[sha]
+
+            for sha in evicted:
+                os.remove(self.blob_path(sha))
+            evicted = set(evicted)
+            self.entries = {key: entry for key, entry in self.entries.items() if entry["sha256"] not in evicted}
+            self._write_manifest()
+            return {"blobs_removed": len(evicted), "bytes_removed": sum(blobs[sha] for sha in evicted), "bytes_kept": kept_bytes}
+
+
+def get_download_cache(cache_dir: str = constants.DOWNLOAD_CACHE_DIR) -> DownloadCache:
+    """Returns the `DownloadCache` shared by every caller using `cache_dir`."""
+    key = os.path.abspath(cache_dir)
+    with _CACHES_LOCK:
+        if key not in _CACHES:
+            _CACHES[key] = DownloadCache(cache_dir)
+        return _CACHES[key]
+
+
+def request(url: str, params: typing.Optional[typing.Dict] = None, cache_dir: str = constants.DOWNLOAD_CACHE_DIR, **kwargs) -> str:
+    """Downloads `url` with a GET request (see `requests.get`), through the cache, and returns the local path.
+
+    A cached file is revalidated with its ETag, so an unchanged file is not downloaded again.
+    """
+    cache = get_download_cache(cache_dir)
+    url = requests.Request("GET", url, params=params).prepare().url
+    key = f"url:{url}"
+    entry = cache.get(key)
+    if _OFFLINE:
+        if entry is None:
+            raise CacheMissError(f"{url} is not in the download cache ({cache_dir}), and downloads are offline.")
+        return cache.blob_path(entry["sha256"])
+
+    headers = {"If-None-Match": entry["etag"]} if entry and entry.get("etag") else {}
+    response = requests.get(url, headers=headers, **kwargs)
+    if response.status_code == 304:
+        return cache.blob_path(entry["sha256"])
+    response.raise_for_status()
+    entry = cache.put_bytes(key, response.content, url=url, etag=response.headers.get("ETag"))
+    return cache.blob_path(entry["sha256"])
+
+
+def hf_hub_download(
+    repo_id: str,
+    filename: str,
+    subfolder: typing.Optional[str] = None,
+    repo_type: typing.Optional[str] = None,
+    revision: typing.Optional[str] = None,
+    cache_dir: str = constants.DOWNLOAD_CACHE_DIR,
+) -> str:
+    """`huggingface_hub.hf_hub_download` through the cache, returning the local path.
+
+    A cached file is reused while its ETag on the Hub is unchanged.
+    """
+    # Imported here, so the cache does not require `huggingface_hub` for plain URLs.
+    import huggingface_hub
+
+    cache = get_download_cache(cache_dir)
+    path_in_repo = f"{subfolder}/{filename}" if subfolder else filename
+    key = f"hf:{repo_type or 'model'}:{repo_id}/{path_in_repo}@{revision or 'main'}"
+    entry = cache.get(key)
+    if _OFFLINE:
+        if entry is None:
+            raise CacheMissError(f"{key} is not in the download cache ({cache_dir}), and downloads are offline.")
+        return cache.blob_path(entry["sha256"])
+
+    metadata = huggingface_hub.get_hf_file_metadata(huggingface_hub.hf_hub_url(
+        repo_id, filename, subfolder=subfolder, repo_type=repo_type, revision=revision))
+    if entry and entry.get("etag") == metadata.etag:
+        return cache.blob_path(entry["sha256"])
+    path = huggingface_hub.hf_hub_download(
+        repo_id=repo_id, filename=filename, subfolder=subfolder, repo_type=repo_type, revision=revision)
+    # The Hugging Face cache keeps its own copy, which the blob shares rather than duplicates.
+    entry = cache.put(key, path, link=True, etag=metadata.etag, commit=metadata.commit_hash)
+    return cache.blob_path(entry["sha256"])
+
+
+def cached_json(key: str, compute_fn: typing.Callable[[], typing.Any], cache_dir: str = constants.DOWNLOAD_CACHE_DIR):
+    """Returns the JSON-serializable result of `compute_fn()`, cached under `key`.
+
+    Used for results derived from cached downloads, such as the JSON files extracted from a zip,
+    so `key` should identify the inputs by content. Works offline, as nothing is downloaded.
+    """
+    cache = get_download_cache(cache_dir)
+    entry = cache.get(key)
+    if entry is not None:
+        with open(cache.blob_path(entry["sha256"]), "r", encoding="utf-8") as inf:
+            return json.load(inf)
+    result = compute_fn()
+    cache.put_bytes(key, json.dumps(result, ensure_ascii=False).encode("utf-8"))
+    return result
+
+
+def cached_lines(key: str, compute_fn: typing.Callable[[], typing.Iterable[bytes]], cache_dir: str = constants.DOWNLOAD_CACHE_DIR) -> typing.Iterator[bytes]:
+    """Yields the lines (bytes, without newlines) `compute_fn()` yields, cached under `key`.
+
+    Like `cached_json`, but streamed: the lines are yielded as they are computed, and only cached once
+    all of them were read. Later calls read them back from the cached file one at a time.
+    Works offline, as nothing is downloaded.
+    """
+    cache = get_download_cache(cache_dir)
+    entry = cache.get(key)
+    if entry is not None:
+        with open(cache.blob_path(entry["sha256"]), "rb") as inf:
+            for line in inf:
+                yield line.rstrip(b"\n")
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=cache_dir, delete=False) as tmp:
+        try:
+            for line in compute_fn():
+                tmp.write(line + b"\n")
+                yield line
+        except BaseException:
+            # Including the caller stopping early (`GeneratorExit`): the lines are incomplete.
+            tmp.close()
+            os.remove(tmp.name)
+            raise
+    cache.put(key, tmp.name, move=True)
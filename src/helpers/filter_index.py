@@ -0,0 +1,443 @@
+import time
+import typing
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+
+import numpy as np
+import pandas as pd
+
+# import src.helpers.constants as constants
+from . import io, constants, filters
+
+
+LICENSE_SOURCES = ["DataProvenance", "DataProvenance IgnoreOpenAI", "HuggingFace", "GitHub", "PapersWithCode"]
+# Ordinal for license uses that never pass a license use filter, e.g. "" when a source has no license.
+NO_LICENSE_USE = np.iinfo(np.int8).max
+# Attribution/share alike value for sources without a license, which never fail those filters.
+NO_LICENSE_REQUIREMENT = -1
+
+
+class FilterIndex:
+    """Precomputed boolean row masks over a data summary catalog.
+
+    Every predicate of `filters.apply_filters` becomes a lookup of precomputed masks
+    (e.g. language --> rows with that language, or an int8 license use ordinal per
+    license source), so any filter combination is answered by AND-ing masks together,
+    instead of re-scanning the DataFrame row by row.
+
+    The index is built once per catalog (see `io.load_catalog`) and is read-only,
+    so it can be shared by any number of queries.
+    """
+
+    def __init__(self, df: pd.DataFrame, all_constants: typing.Dict):
+        """
+        df: The license-mapped data summary DataFrame, as returned by `io.load_catalog`.
+        all_constants: The constants, as returned by `io.read_all_constants`.
+        """
+        self.df = df
+        self.all_constants = all_constants
+        self.num_rows = len(df)
+        self.uids = df["Unique Dataset Identifier"].to_numpy()
+        self.all_rows = np.ones(self.num_rows, dtype=bool)
+
+        self.collections = df["Collection"].to_numpy()
+        self.uid_to_row = {uid: i for i, uid in enumerate(self.uids)}
+
+        # Ordinals into `LICENSE_USE_TYPES`, so a license use filter is a single comparison.
+        use_ordinals = {use.lower(): i for i, use in enumerate(constants.LICENSE_USE_TYPES)}
+        self.license_use = {}
+        self.license_attribution = {}
+        self.license_sharealike = {}
+        for source in LICENSE_SOURCES:
+            self.license_use[source] = np.array([
+                use_ordinals.get(use, NO_LICENSE_USE) for use in df[f"License Use ({source})"]
+            ], dtype=np.int8)
+            self.license_attribution[source] = self._requirement_column(df[f"License Attribution ({source})"])
+            self.license_sharealike[source] = self._requirement_column(df[f"License Share Alike ({source})"])
+
+        license_strs = set(all_constants["LICENSE_CLASSES"].keys())
+        self.known_licenses = np.array([
+            license_strs >= set([x["License"] for x in xs]) for xs in df["Licenses"]
+        ], dtype=bool)
+        self.no_model_generated = np.array([len(x) == 0 for x in df["Model Generated"]], dtype=bool)
+        self.num_dialogs = np.array([
+            metrics.get("Num Dialogs", 0) if isinstance(metrics, dict) else 0 for metrics in df["Text Metrics"]
+        ], dtype=np.int64)
+
+        self.language_rows = self._value_masks(df["Languages"])
+        self.task_rows = self._value_masks(df["Task Categories"])
+        self.text_source_rows = self._value_masks(df["Text Sources"])
+        # Group --> rows, filled in lazily, e.g. {("LANGUAGE_GROUPS", "English"): mask}
+        self._group_rows = {}
+
+        if "Estimated Creation Date" not in df.columns:
+            df = filters.add_creation_dates(df)
+        self.creation_dates = pd.DatetimeIndex(df["Estimated Creation Date"])
+        # Rows with a creation date, sorted by it, for range lookups with `searchsorted`.
+        dates = self.creation_dates.to_numpy()
+        self.date_order = np.argsort(dates, kind="stable")[:np.count_nonzero(~np.isnat(dates))]
+        self.sorted_dates = dates[self.date_order]
+
+    def _requirement_column(self, values):
+        return np.array([
+            v if isinstance(v, (int, np.integer)) else NO_LICENSE_REQUIREMENT for v in values
+        ], dtype=np.int8)
+
+    def _value_masks(self, column):
+        """{value --> mask of the rows whose list in `column` contains that value}"""
+        masks = {}
+        for i, values in enumerate(column):
+            for value in values:
+                if value not in masks:
+                    masks[value] = np.zeros(self.num_rows, dtype=bool)
+                masks[value][i] = True
+        return masks
+
+    def _any_value(self, value_rows, values):
+        """Mask of rows containing any of `values`."""
+        masks = [value_rows[v] for v in values if v in value_rows]
+        if not masks:
+            return np.zeros(self.num_rows, dtype=bool)
+        return np.logical_or.reduce(masks)
+
+    def _group_mask(self, constant_key, value_rows, groups):
+        """Mask of rows containing any value that belongs to one of `groups` in `all_constants[constant_key]`."""
+        masks = []
+        for group in groups:
+            key = (constant_key, group)
+            if key not in self._group_rows:
+                self._group_rows[key] = self._any_value(value_rows, self.all_constants[constant_key][group])
+            masks.append(self._group_rows[key])
+        return np.logical_or.reduce(masks)
+
+    def resolve_license_sources(self, selected_license_use, openai_license_override, selected_license_sources):
+        """The license sources a query checks, after applying the OpenAI override."""
+        license_sources = list(selected_license_sources or [])
+        # As in `apply_filters`, the override only swaps the source when a license use filter is selected.
+        if selected_license_use and openai_license_override and "DataProvenance" in license_sources:
+            license_sources.remove("DataProvenance")
+            license_sources.append("DataProvenance IgnoreOpenAI")
+        return license_sources
+
+    def github_override_rows(self, source):
+        """Rows whose `source` license use is unspecified, but a GitHub license is available.
+
+        This intentionally differs from `apply_filters` for "DataProvenance IgnoreOpenAI". Its comments
+        describe the same override as for "DataProvenance", but the code replaces the licenses that are
+        *not* unspecified (`!=`). Its own sanity check then fails with an AssertionError whenever any
+        unspecified license has a GitHub license, so it gives no result to match. Both sources are
+        overridden here as documented.
+        """
+        unspecified = constants.LICENSE_USE_TYPES.index("unspecified")
+        return (self.license_use[source] == unspecified) & (self.license_use["GitHub"] != NO_LICENSE_USE)
+
+    def license_use_columns(self, license_sources, dpi_undefined_license_override):
+        """{license source --> license use ordinals}, with the GitHub license filled in
+        for unspecified Data Provenance licenses if `dpi_undefined_license_override`."""
+        columns = {source: self.license_use[source] for source in license_sources}
+        if dpi_undefined_license_override:
+            for source in ["DataProvenance", "DataProvenance IgnoreOpenAI"]:
+                if source in columns:
+                    columns[source] = np.where(
+                        self.github_override_rows(source), self.license_use["GitHub"], columns[source])
+        return columns
+
+    def creation_date_mask(self, start=None, end=None) -> np.ndarray:
+        """Mask of rows whose `Estimated Creation Date` is within [start, end]. Rows without one never match."""
+        lo, hi = 0, len(self.sorted_dates)
+        if start is not None:
+            lo = np.searchsorted(self.sorted_dates, pd.Timestamp(start).to_datetime64(), side="left")
+        if end is not None:
+            hi = np.searchsorted(self.sorted_dates, pd.Timestamp(end).to_datetime64(), side="right")
+        mask = np.zeros(self.num_rows, dtype=bool)
+        mask[self.date_order[lo:hi]] = True
+        return mask
+
+    def count_by_creation_date(self, mask=None, freq="YS", cumulative=False) -> pd.Series:
+        """Number of datasets per `Estimated Creation Date` bucket, e.g. per year.
+
+        mask: Only count these rows, e.g. from `mask(...)`. Defaults to all rows.
+        freq: A pandas frequency for the buckets, e.g. "YS" (years) or "QS" (quarters).
+        cumulative: Count every dataset created up to the end of each bucket instead.
+
+        Returns a Series indexed by the start of each bucket, from the earliest to the latest
+        creation date in the catalog. Datasets without a creation date are not counted.
+        """
+        if not len(self.sorted_dates):
+            return pd.Series(dtype=np.int64, name="Num Datasets")
+        sorted_dates = self.sorted_dates if mask is None else self.sorted_dates[mask[self.date_order]]
+        # Bucket starts, from the one containing the earliest date to the one containing the latest.
+        first_bucket = pd.date_range(end=self.sorted_dates[0], periods=1, freq=freq)[0]
+        buckets = pd.date_range(first_bucket, self.sorted_dates[-1], freq=freq)
+        # Number of dates before the start of each bucket, and in total.
+        below = np.append(np.searchsorted(sorted_dates, buckets.to_numpy(), side="left"), len(sorted_dates))
+        counts = below[1:] if cumulative else np.diff(below)
+        return pd.Series(counts, index=buckets, name="Num Datasets")
+
+    def predicate_masks(
+        self,
+        selected_collection=None,
+        selected_datasets=None,
+        selected_licenses=None,
+        selected_license_use=None,
+        openai_license_override=False,
+        selected_license_attribution=None,
+        selected_license_sharealike=None,
+        selected_languages=None,
+        selected_task_categories=None,
+        selected_domains=None,
+        no_synthetic_data=False,
+        text_source_allow_list=None,
+        selected_start_time=None,
+        selected_end_time=None,
+        selected_license_sources=None,
+        dpi_undefined_license_override=False,
+        cache=None,
+        timings=None,
+    ) -> typing.List[typing.Tuple[str, np.ndarray]]:
+        """Returns [(predicate name, mask)] for every selected filter, in `apply_filters` order.
+
+        Arguments are the same as `filters.apply_filters`. If a `cache` dict is given, masks
+        are looked up in and added to it, keyed by the predicate and the arguments it uses,
+        so queries sharing a predicate compute its mask once (see `batch`). If a `timings`
+        dict is given, the seconds spent computing each predicate's mask are recorded in it.
+        """
+        predicates = []
+        license_sources = self.resolve_license_sources(
+            selected_license_use, openai_license_override, selected_license_sources)
+
+        def add(name, key, compute_mask):
+            start = time.perf_counter()
+            if cache is None:
+                predicates.append((name, compute_mask()))
+            else:
+                key = (name,) + key
+                if key not in cache:
+                    cache[key] = compute_mask()
+                predicates.append((name, cache[key]))
+            if timings is not None:
+                timings[name] = time.perf_counter() - start
+
+        if selected_collection:
+            add("collection", (selected_collection,), lambda: self.collections == selected_collection)
+
+        if selected_datasets:
+            def datasets_mask():
+                mask = np.zeros(self.num_rows, dtype=bool)
+                mask[[self.uid_to_row[uid] for uid in selected_datasets if uid in self.uid_to_row]] = True
+                return mask
+            add("datasets", (tuple(selected_datasets),), datasets_mask)
+
+        if selected_licenses:
+            # Like `apply_filters`, this keeps datasets whose licenses are all recognized.
+            add("licenses", (), lambda: self.known_licenses)
+
+        if selected_license_use:
+            def license_use_mask():
+                valid_license_use_idx = constants.LICENSE_USE_TYPES.index(selected_license_use)
+                use_columns = self.license_use_columns(license_sources, dpi_undefined_license_override)
+                masks = [use_columns[source] <= valid_license_use_idx for source in license_sources]
+                return np.logical_or.reduce(masks) if masks else ~self.all_rows
+            add("license_use", (selected_license_use, tuple(license_sources), bool(dpi_undefined_license_override)), license_use_mask)
+
+        if selected_license_attribution:
+            def attribution_mask():
+                max_attribution = int(selected_license_attribution)
+                masks = [self.license_attribution[source] <= max_attribution for source in license_sources]
+                return reduce(np.logical_and, masks, self.all_rows)
+            add("license_attribution", (selected_license_attribution, tuple(license_sources)), attribution_mask)
+
+        if selected_license_sharealike:
+            def sharealike_mask():
+                max_sharealike = int(selected_license_sharealike)
+                masks = [self.license_sharealike[source] <= max_sharealike for source in license_sources]
+                return reduce(np.logical_and, masks, self.all_rows)
+            add("license_sharealike", (selected_license_sharealike, tuple(license_sources)), sharealike_mask)
+
+        if selected_languages:
+            add("languages", tuple(selected_languages),
+                lambda: self._group_mask("LANGUAGE_GROUPS", self.language_rows, selected_languages))
+
+        if selected_task_categories:
+            add("task_categories", tuple(selected_task_categories),
+                lambda: self._group_mask("TASK_GROUPS", self.task_rows, selected_task_categories))
+
+        if selected_domains:
+            add("domains", tuple(selected_domains),
+                lambda: self._group_mask("DOMAIN_GROUPS", self.text_source_rows, selected_domains))
+
+        if no_synthetic_data:
+            add("no_synthetic_data", (), lambda: self.no_model_generated)
+
+        if text_source_allow_list:
+            def text_sources_mask():
+                allowed = set(io.read_txt(text_source_allow_list))
+                disallowed = [source for source in self.text_source_rows if source not in allowed]
+                return ~self._any_value(self.text_source_rows, disallowed)
+            add("text_sources", (text_source_allow_list,), text_sources_mask)
+
+        if selected_start_time:
+            add("start_time", (str(selected_start_time),), lambda: self.creation_date_mask(start=selected_start_time))
+
+        if selected_end_time:
+            add("end_time", (str(selected_end_time),), lambda: self.creation_date_mask(end=selected_end_time))
+
+        return predicates
+
+    def mask(self, **filter_kwargs) -> np.ndarray:
+        """Boolean mask of the catalog rows that pass every selected filter."""
+        masks = [mask for _, mask in self.predicate_masks(**filter_kwargs)]
+        return reduce(np.logical_and, masks, self.all_rows)
+
+    def filter_uids(self, **filter_kwargs) -> typing.List[str]:
+        """The Unique Dataset Identifiers that pass every selected filter."""
+        return self.uids[self.mask(**filter_kwargs)].tolist()
+
+    def filter(self, **filter_kwargs) -> pd.DataFrame:
+        """Drop-in equivalent of `filters.apply_filters`, returning the filtered DataFrame.
+
+        As in `apply_filters`, the `License Use` columns reflect the GitHub license override,
+        and an `Estimated Creation Date` column is added when filtering on time.
+        """
+        mask = self.mask(**filter_kwargs)
+        filtered_df = self.df[mask].copy()
+        if filtered_df.empty:
+            return filtered_df
+
+        license_sources = self.resolve_license_sources(
+            filter_kwargs.get("selected_license_use"),
+            filter_kwargs.get("openai_license_override"),
+            filter_kwargs.get("selected_license_sources"),
+        )
+        if filter_kwargs.get("selected_license_use") and filter_kwargs.get("dpi_undefined_license_override"):
+            github_use = filtered_df["License Use (GitHub)"].to_numpy()
+            for source in ["DataProvenance", "DataProvenance IgnoreOpenAI"]:
+                if source in license_sources:
+                    filtered_df[f"License Use ({source})"] = np.where(
+                        self.github_override_rows(source)[mask],
+                        github_use,
+                        filtered_df[f"License Use ({source})"].to_numpy(),
+                    )
+
+        if "Estimated Creation Date" not in filtered_df.columns and (
+            filter_kwargs.get("selected_start_time") or filter_kwargs.get("selected_end_time")
+        ):
+            filtered_df["Estimated Creation Date"] = self.creation_dates[mask]
+        return filtered_df
+
+    def explain(self, **filter_kwargs) -> typing.Dict:
+        """Traces which filters remove which datasets, as a JSON-serializable dict.
+
+        Predicates are applied in `apply_filters` order. For each, it records how many datasets
+        pass it on its own, how many remain after it, how many it removed and how long it took.
+        Every removed dataset is attributed to the first predicate that removed it.
+        """
+        start = time.perf_counter()
+        timings = {}
+        predicates = self.predicate_masks(timings=timings, **filter_kwargs)
+        mask = self.all_rows
+        stages = []
+        eliminated_by = {}
+        for name, predicate_mask in predicates:
+            stage_start = time.perf_counter()
+            removed = mask & ~predicate_mask
+            mask = mask & predicate_mask
+            elapsed = timings[name] + time.perf_counter() - stage_start
+            eliminated_by.update(dict.fromkeys(self.uids[removed].tolist(), name))
+            stages.append({
+                "predicate": name,
+                "passing": int(predicate_mask.sum()),
+                "remaining": int(mask.sum()),
+                "removed": int(removed.sum()),
+                "elapsed_ms": round(1000 * elapsed, 3),
+            })
+        return {
+            "num_datasets_before": self.num_rows,
+            "num_datasets": int(mask.sum()),
+            "num_collections": len(set(self.collections[mask])),
+            "stages": stages,
+            "eliminated_by": eliminated_by,
+            "elapsed_ms": round(1000 * (time.perf_counter() - start), 3),
+        }
+
+    def shared_mask(self, cache, **filter_kwargs) -> np.ndarray:
+        """Same as `mask`, but shares work with earlier queries through `cache`.
+
+        Both the predicate masks, and the conjunction of each prefix of them (in `apply_filters`
+        order), are cached, so queries that only differ in their last predicates reuse the rest.
+        """
+        mask, key = self.all_rows, ("and",)
+        for _, predicate_mask in self.predicate_masks(cache=cache, **filter_kwargs):
+            # Cached masks stay alive in `cache`, so their ids identify them.
+            key = key + (id(predicate_mask),)
+            if key not in cache:
+                cache[key] = mask & predicate_mask
+            mask = cache[key]
+        return mask
+
+    def batch_masks(self, specs: typing.List[typing.Dict]) -> np.ndarray:
+        """Membership matrix of shape (len(specs), num datasets) for a list of filter specs.
+
+        Each spec is a dict of `filters.apply_filters` keyword arguments.
+        """
+        cache = {}
+        membership = np.zeros((len(specs), self.num_rows), dtype=bool)
+        for i, spec in enumerate(specs):
+            membership[i] = self.shared_mask(cache, **spec)
+        return membership
+
+    def batch(
+        self,
+        specs: typing.List[typing.Dict],
+        num_workers: int = 1,
+    ) -> typing.Tuple[np.ndarray, pd.DataFrame]:
+        """Evaluates many filter specs together, e.g. to sweep filter configurations.
+
+        specs: A list of dicts of `filters.apply_filters` keyword arguments.
+        num_workers: If more than 1, the specs are split across this many processes.
+
+        Returns:
+            membership: (len(specs), num datasets) boolean matrix, whose columns follow `self.uids`.
+            counts: DataFrame with a row per spec, of the number of datasets, collections and
+                dialogs (from `Text Metrics`) that pass its filters.
+        """
+        if num_workers > 1 and len(specs) > 1:
+            chunks = [chunk.tolist() for chunk in np.array_split(np.array(specs, dtype=object), num_workers) if len(chunk)]
+            with ProcessPoolExecutor(num_workers, initializer=_init_batch_worker, initargs=(self,)) as executor:
+                packed = list(executor.map(_packed_batch_masks, chunks))
+            membership = np.concatenate([
+                np.unpackbits(chunk, axis=1, count=self.num_rows).astype(bool) for chunk in packed
+            ])
+        else:
+            membership = self.batch_masks(specs)
+
+        return membership, self.membership_counts(membership)
+
+    def membership_counts(self, membership: np.ndarray, block_size: int = 4096) -> pd.DataFrame:
+        """Number of datasets, collections and dialogs in each row of a membership matrix."""
+        collection_codes, collection_names = pd.factorize(self.collections)
+        collection_rows = np.zeros((self.num_rows, len(collection_names)), dtype=np.float32)
+        collection_rows[np.arange(self.num_rows), collection_codes] = 1
+        num_collections, num_dialogs = [], []
+        # In blocks, as the products need a numeric copy of the membership matrix.
+        for start in range(0, len(membership), block_size):
+            block = membership[start:start + block_size]
+            num_collections.append(((block.astype(np.float32) @ collection_rows) > 0).sum(axis=1))
+            num_dialogs.append(block.astype(np.int64) @ self.num_dialogs)
+        return pd.DataFrame({
+            "Num Datasets": membership.sum(axis=1),
+            "Num Collections": np.concatenate(num_collections) if num_collections else np.zeros(0, dtype=int),
+            "Num Dialogs": np.concatenate(num_dialogs) if num_dialogs else np.zeros(0, dtype=np.int64),
+        })
+
+
+# The FilterIndex of a `FilterIndex.batch` worker process.
+_BATCH_WORKER_INDEX = None
+
+def _init_batch_worker(index):
+    global _BATCH_WORKER_INDEX
+    _BATCH_WORKER_INDEX = index
+
+def _packed_batch_masks(specs):
+    # Bit-packed, to send 8x less back to the parent process.
+    return np.packbits(_BATCH_WORKER_INDEX.batch_masks(specs), axis=1)
@@ -4,7 +4,7 @@ import pandas as pd
 
 
 # import src.helpers.constants as constants
-from . import io, constants
+from . import io, constants, validation
 
 
 def classify_license(license_name, license_url, all_constants):
@@ -42,6 +42,103 @@ def resolve_multiple_licenses(license_criterias):
     return resolved_use_case, resolved_attribution, resolved_share_alikes
 
 
+class LicenseResolver:
+    """Classifies and resolves licenses once per distinct combination of licenses.
+
+    Each distinct (license name, license url) is classified once, and each distinct set
+    of them is resolved once, into an integer-coded (use, attribution, share alike)
+    triple, where `use` indexes into `constants.LICENSE_USE_TYPES`. Resolution only depends
+    on which licenses are present, so datasets (and aggregators) that share the same
+    licenses share the same cache entry.
+
+    Use `get_license_resolver` to share one resolver across calls with the same constants.
+    """
+
+    def __init__(self, all_constants):
+        self.all_constants = all_constants
+        # (license name, license url) --> classification
+        self._classified = {}
+        # frozenset of (license name, license url) --> (use, attribution, share alike), or None if empty
+        self._resolved = {}
+
+    def classify(self, license_name, license_url):
+        key = (license_name, license_url)
+        if key not in self._classified:
+            self._classified[key] = classify_license(license_name, license_url, self.all_constants)
+        return self._classified[key]
+
+    def resolve_codes(self, license_infos):
+        """Integer-coded `resolve_multiple_licenses` of [(license name, license url)]."""
+        key = frozenset(license_infos)
+        if key not in self._resolved:
+            if key:
+                use, attribution, share_alike = resolve_multiple_licenses(
+                    [self.classify(license_name, license_url) for (license_name, license_url) in key])
+                self._resolved[key] = (constants.LICENSE_USE_TYPES.index(use), attribution, share_alike)
+            else:
+                self._resolved[key] = None
+        return self._resolved[key]
+
+    def resolve(self, license_infos):
+        """Same as classifying every license, then `resolve_multiple_licenses`."""
+        codes = self.resolve_codes(license_infos)
+        if codes is None:
+            # Return empty if no licenses from this aggregator
+            return ["", "", ""]
+        use, attribution, share_alike = codes
+        return constants.LICENSE_USE_TYPES[use], attribution, share_alike
+
+
+# The most recently used LicenseResolver. Only one is kept, so reloading the constants (e.g. on every
+# `/reload` of the filter server) releases the previous resolver and the constants it references.
+_LICENSE_RESOLVER = None
+
+def get_license_resolver(all_constants):
+    """Returns the `LicenseResolver` for these license constants, shared across calls.
+
+    The constants are compared by identity with the cached resolver's, which it still references,
+    so new constants always get a new resolver.
+    """
+    global _LICENSE_RESOLVER
+    resolver = _LICENSE_RESOLVER
+    if resolver is None or any(
+        resolver.all_constants[key] is not all_constants[key] for key in ["LICENSE_CLASSES", "CUSTOM_LICENSE_CLASSES"]
+    ):
+        resolver = _LICENSE_RESOLVER = LicenseResolver(all_constants)
+    return resolver
+
+
+def add_license_classes_to_summaries(data_summary, resolved_classes, aggregator):
+    # update dataframe with columns for use, attribution, share_alike
+    for row in data_summary:
+        row[f'License Use ({aggregator})'] = resolved_classes[row['Unique Dataset Identifier']][0]
+        row[f'License Attribution ({aggregator})'] = resolved_classes[row['Unique Dataset Identifier']][1]
+        row[f'License Share Alike ({aggregator})'] = resolved_classes[row['Unique Dataset Identifier']][2]
+    return data_summary
+
+
+# Dates in the `Inferred Metadata`, in order of precedence when they tie.
+CREATION_DATE_SOURCES = ["S2 Date", "HF Date", "GitHub Date"]
+
+def add_creation_dates(df):
+    """Adds the `Estimated Creation Date` of each dataset, the earliest of its Semantic Scholar,
+    Hugging Face and GitHub dates, and the `Estimated Creation Date Source` that date came from.
+
+    Datasets without any valid date get NaT and an empty source.
+    """
+    metadata = [x if isinstance(x, dict) else {} for x in df["Inferred Metadata"]]
+    source_dates = pd.DataFrame({
+        source: pd.to_datetime([x.get(source, "") or None for x in metadata], format='%Y-%m-%d', errors='coerce')
+        for source in CREATION_DATE_SOURCES
+    }, index=df.index)
+    has_date = source_dates.notna().any(axis=1)
+    df = df.copy()
+    df["Estimated Creation Date"] = source_dates.min(axis=1)
+    df["Estimated Creation Date Source"] = ""
+    df.loc[has_date, "Estimated Creation Date Source"] = source_dates[has_date].idxmin(axis=1)
+    return df
+
+
 def map_license_criteria(data_summary, all_constants):
 
     # Unpack licenses for each dataset. {uid --> (license_name, license_url)}
@@ -86,30 +183,16 @@ def map_license_criteria(data_summary, all_constants):
     # print(set([v for vs in pwc_uid_to_license_infos.values() for (v, _) in vs]) - set(valid_licenses))
     # print(set([v for vs in github_uid_to_license_infos.values() for (v, _) in vs]) - set(valid_licenses))
 
-    def classify_and_resolve_licenses(license_infos, all_constants):
-        classified_licenses = []
-        for (license_name, license_url) in license_infos:
-            classifications = classify_license(license_name, license_url, all_constants)
-            classified_licenses.append(classifications)
-        resolved_criteria = resolve_multiple_licenses(classified_licenses)
-        return resolved_criteria
-
-    # classify and resolve licenses for each dataset and each aggregator
+    # classify and resolve licenses for each dataset and each aggregator,
+    # once per distinct combination of licenses.
+    resolver = get_license_resolver(all_constants)
     ours_resolved, ours_openai_resolved, hf_resolved, gh_resolved, pwc_resolved = {}, {}, {}, {}, {}
     for uid in our_uid_to_license_infos.keys():
-        ours_resolved[uid] = classify_and_resolve_licenses(our_uid_to_license_infos[uid], all_constants)
-        ours_openai_resolved[uid] = classify_and_resolve_licenses(our_uid_to_license_infos_no_openai[uid], all_constants)
-        hf_resolved[uid] = classify_and_resolve_licenses(hf_uid_to_license_infos[uid], all_constants)
-        gh_resolved[uid] = classify_and_resolve_licenses(github_uid_to_license_infos[uid], all_constants)
-        pwc_resolved[uid] = classify_and_resolve_licenses(pwc_uid_to_license_infos[uid], all_constants)
-
-    def add_license_classes_to_summaries(data_summary, resolved_classes, aggregator):
-        # update dataframe with columns for use, attribution, share_alike
-        for row in data_summary:
-            row[f'License Use ({aggregator})'] = resolved_classes[row['Unique Dataset Identifier']][0]
-            row[f'License Attribution ({aggregator})'] = resolved_classes[row['Unique Dataset Identifier']][1]
-            row[f'License Share Alike ({aggregator})'] = resolved_classes[row['Unique Dataset Identifier']][2]
-        return data_summary
+        ours_resolved[uid] = resolver.resolve(our_uid_to_license_infos[uid])
+        ours_openai_resolved[uid] = resolver.resolve(our_uid_to_license_infos_no_openai[uid])
+        hf_resolved[uid] = resolver.resolve(hf_uid_to_license_infos[uid])
+        gh_resolved[uid] = resolver.resolve(github_uid_to_license_infos[uid])
+        pwc_resolved[uid] = resolver.resolve(pwc_uid_to_license_infos[uid])
 
     data_summary = add_license_classes_to_summaries(data_summary, ours_resolved, "DataProvenance")
     data_summary = add_license_classes_to_summaries(data_summary, ours_openai_resolved, "DataProvenance IgnoreOpenAI")
@@ -120,6 +203,17 @@ def map_license_criteria(data_summary, all_constants):
     return data_summary
 
 
+def explain_filters(df, all_constants, **filter_kwargs):
+    """Traces how `apply_filters` with these arguments narrows down `df`, predicate by predicate.
+
+    Returns the per-predicate counts and timings, and the predicate that removed each dataset,
+    as a JSON-serializable dict (see `FilterIndex.explain`).
+    """
+    # Imported here, as `filter_index` itself depends on `filters`.
+    from .filter_index import FilterIndex
+    return FilterIndex(df, all_constants).explain(**filter_kwargs)
+
+
 def apply_filters(
     df,
     all_constants,
@@ -142,32 +236,8 @@ def apply_filters(
 ):
     filtered_df = df
 
-    # Some sanity checks:
-    all_langs = set([v for vs in all_constants["LANGUAGE_GROUPS"].values() for v in vs])
-    option_langs = set(
-        [lang for langs in filtered_df["Languages"].tolist() for lang in langs]
-    )
-    assert all_langs >= option_langs, f"Missing Languages: {option_langs - all_langs}"
-
-    all_tcats = set([v for vs in all_constants["TASK_GROUPS"].values() for v in vs])
-    option_tcats = set(
-        [tc for tcs in filtered_df["Task Categories"].tolist() for tc in tcs]
-    )
-    assert (
-            all_tcats >= option_tcats
-    ), f"Missing Task Categories: {option_tcats - all_tcats}"
-
-    all_sources = set([v for vs in all_constants["DOMAIN_GROUPS"].values() for v in vs])
-    option_sources = set(
-        [src for sources in filtered_df["Text Sources"].tolist() for src in sources]
-    )
-    # assert all_sources >= option_sources, f"Missing Text Sources: {option_sources - all_sources}" # :TODO: we need to check this here!
-
-    all_models = set([v.lower() for vs in all_constants["MODEL_GROUPS"].values() for v in vs])
-    option_models = set(
-        [model.lower() for models in filtered_df["Model Generated"].tolist() for model in models]
-    )
-    assert all_models >= option_models, f"Missing Models: {option_models - all_models}"
+    # Sanity checks, which only run once per compiled catalog:
+    validation.assert_valid_catalog(filtered_df, all_constants)
 
     # Load text sources allow list if available
     if text_source_allow_list:
@@ -312,16 +382,8 @@ def apply_filters(
         ]
 
     if not filtered_df.empty and (selected_start_time or selected_end_time):
-
-        def get_min_date(metadata):
-            date_columns = ["S2 Date", "HF Date", "GitHub Date"]
-            dates = [metadata.get(col, "") for col in date_columns]
-            valid_dates = [pd.to_datetime(date, format='%Y-%m-%d', errors='coerce') for date in dates if date]
-            if valid_dates:
-                return min(valid_dates)
-            return pd.NaT
-
-        filtered_df['Estimated Creation Date'] = filtered_df['Inferred Metadata'].apply(get_min_date)
+        if "Estimated Creation Date" not in filtered_df.columns:
+            filtered_df = add_creation_dates(filtered_df)
         if selected_start_time:
             filtered_df = filtered_df[filtered_df['Estimated Creation Date'] >= pd.to_datetime(selected_start_time)]
         if selected_end_time:
@@ -1,15 +1,23 @@
 import os
 import sys
 import gzip
+import hashlib
 import shlex
 import subprocess
 import yaml
 import json
 import jsonlines
+import pickle
 from ast import literal_eval
+from io import BytesIO
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import typing
 from collections import defaultdict
+from collections.abc import Mapping
 from semanticscholar import SemanticScholar
 
 # import src.helpers.constants as constants
@@ -36,11 +44,17 @@ def write_txt(path: str, data: str):
     with open(path, "w", encoding="utf8") as outf:
         outf.write(data)
 
-def write_json(data, outpath, compress: bool=False):
+def write_json(data, outpath, compress: bool=False, atomic: bool=False):
+    """Writes `data` as JSON. With `atomic`, it is written to a temporary file first, then swapped in,
+    so concurrent readers see either the previous file or the whole new one."""
     dirname = os.path.dirname(outpath)
     if dirname:
         os.makedirs(dirname, exist_ok=True)
-    if compress:
+    if atomic:
+        tmp_path = f"{outpath}.{os.getpid()}.{threading.get_ident()}.tmp"
+        write_json(data, tmp_path, compress=compress)
+        os.replace(tmp_path, outpath)
+    elif compress:
         with gzip.open(outpath, 'wt', encoding='UTF-8') as zipfile:
             zipfile.write(json.dumps(data, ensure_ascii=False, indent=4))
     else:
@@ -79,6 +93,151 @@ def write_jsonl(
     else: # Must be dataframe:
         data.to_json(outpath, orient="records", lines=True, compression="gzip" if compress else "infer")
 
+def write_jsonl_chunks(
+    chunks: typing.Iterable[typing.List[typing.Dict]],
+    outpath: str,
+    compress: bool=False,
+    offset: int=0,
+    on_chunk: typing.Optional[typing.Callable[[int, int], None]]=None,
+) -> int:
+    """Writes each chunk of rows to a jsonlines file as soon as it is produced, so only
+    one chunk is held in memory at a time. Returns the number of rows written.
+
+    If `compress`, each chunk is written as its own gzip member. Concatenated gzip
+    members are a valid gzip file, which `read_jsonl` reads the same as `write_jsonl` output.
+
+    If `offset`, the existing file is truncated to `offset` bytes (the end of a previously
+    written chunk) and appended to, rather than overwritten. If given, `on_chunk` is called
+    with the number of rows in each chunk and the file's size once the chunk is on disk.
+    """
+    dirname = os.path.dirname(outpath)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    num_rows = 0
+    with open(outpath, "r+b" if offset else "wb") as fp:
+        if offset:
+            fp.truncate(offset)
+            fp.seek(offset)
+        for chunk in chunks:
+            buffer = BytesIO()
+            jsonlines.Writer(buffer).write_all(chunk)
+            data = buffer.getvalue()
+            fp.write(gzip.compress(data) if compress else data)
+            num_rows += len(chunk)
+            if on_chunk is not None:
+                fp.flush()
+                os.fsync(fp.fileno())
+                on_chunk(len(chunk), fp.tell())
+    return num_rows
+
+# Compression --> extension of the shards `write_jsonl_shards` writes with it.
+SHARD_EXTENSIONS = {"gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+
+
+def _compress(data: bytes, compression: str) -> bytes:
+    if compression == "zstd":
+        # Imported here, as zstd compression is optional.
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("zstd compression requires the `zstandard` package: `pip install zstandard`.")
+        return zstandard.ZstdCompressor().compress(data)
+    return gzip.compress(data)
+
+
+def _write_shard(data: bytes, path: str, compression: str) -> typing.Dict:
+    compressed = _compress(data, compression)
+    with open(path, "wb") as fp:
+        fp.write(compressed)
+    return {"bytes": len(compressed), "sha256": hashlib.sha256(compressed).hexdigest()}
+
+
+def shard_index_path(savedir: str, name: str) -> str:
+    """The index file `write_jsonl_shards` writes for `name` in `savedir`."""
+    return os.path.join(savedir, f"{name}.index.json")
+
+
+def write_jsonl_shards(
+    chunks: typing.Iterable[typing.List[typing.Dict]],
+    savedir: str,
+    name: str,
+    max_rows: typing.Optional[int]=None,
+    max_bytes: typing.Optional[int]=None,
+    compression: str="gzip",
+    num_workers: typing.Optional[int]=None,
+    uid_fn: typing.Optional[typing.Callable[[typing.Dict], str]]=None,
+) -> typing.Dict:
+    """Writes chunks of rows as compressed jsonlines shards `{name}-00000.jsonl.gz`, ... in `savedir`,
+    starting a new shard once one reaches `max_rows` rows or `max_bytes` uncompressed bytes.
+
+    Shards are compressed (with `gzip` or `zstd`) and written on `num_workers` threads, while the
+    next shard is serialized: both compressors release the GIL, so this runs in parallel without
+    copying rows to other processes. At most `num_workers` shards wait to be compressed at once.
+
+    Writes and returns an index (see `shard_index_path`) listing each shard's path, row range
+    [start, end), compressed size, sha256, and, if `uid_fn` is given, rows per `uid_fn(row)`.
+    """
+    _compress(b"", compression)  # Fail before doing any work if the compression is unavailable.
+    os.makedirs(savedir, exist_ok=True)
+    num_workers = num_workers or os.cpu_count()
+    shards, pending = [], []
+    state = {"buffer": BytesIO(), "rows": 0, "start": 0, "uid_counts": defaultdict(int)}
+
+    def flush():
+        shard = {
+            "path": f"{name}-{len(shards):05d}{SHARD_EXTENSIONS[compression]}",
+            "rows": [state["start"], state["start"] + state["rows"]],
+            "uncompressed_bytes": state["buffer"].tell(),
+            "uid_counts": dict(state["uid_counts"]),
+        }
+        shards.append(shard)
+        pending.append((shard, executor.submit(
+            _write_shard, state["buffer"].getvalue(), os.path.join(savedir, shard["path"]), compression)))
+        while len(pending) > num_workers:
+            done_shard, future = pending.pop(0)
+            done_shard.update(future.result())
+        state.update({"buffer": BytesIO(), "rows": 0, "start": shard["rows"][1], "uid_counts": defaultdict(int)})
+
+    with ThreadPoolExecutor(num_workers) as executor:
+        for chunk in chunks:
+            for row in chunk:
+                jsonlines.Writer(state["buffer"]).write(row)
+                state["rows"] += 1
+                if uid_fn is not None:
+                    state["uid_counts"][uid_fn(row)] += 1
+                if (max_rows and state["rows"] >= max_rows) or (max_bytes and state["buffer"].tell() >= max_bytes):
+                    flush()
+        if state["rows"]:
+            flush()
+        for shard, future in pending:
+            shard.update(future.result())
+
+    index = {
+        "name": name,
+        "compression": compression,
+        "num_rows": state["start"],
+        "bytes": sum(shard["bytes"] for shard in shards),
+        "shards": shards,
+    }
+    write_json(index, shard_index_path(savedir, name))
+    return index
+
+
+def read_jsonl_shards(index_fp: str) -> typing.List[typing.Dict]:
+    """Reads every row of the shards listed in a `write_jsonl_shards` index, in order."""
+    index = read_json(index_fp)
+    rows = []
+    for shard in index["shards"]:
+        shard_fp = os.path.join(os.path.dirname(index_fp), shard["path"])
+        if index["compression"] == "zstd":
+            import zstandard
+            with open(shard_fp, "rb") as fp, zstandard.ZstdDecompressor().stream_reader(fp) as reader:
+                rows.extend(jsonlines.Reader(reader))
+        else:
+            rows.extend(read_jsonl(shard_fp))
+    return rows
+
+
 def read_jsonl(inpath: str) -> typing.List[typing.Dict]:
     if inpath[-2:] in ["gz", "gzip"]:
         with gzip.open(inpath, 'rb') as fp:
@@ -89,6 +248,114 @@ def read_jsonl(inpath: str) -> typing.List[typing.Dict]:
             j_reader = jsonlines.Reader(fp)
             return [l for l in j_reader]
 
+# Arrow schemas of the Parquet outputs (see `write_parquet_chunks`), by row format. `dataset` and `from`
+# have few distinct values, so they are dictionary-encoded, in the file and in the tables read back.
+_DICTIONARY_STRING = pa.dictionary(pa.int32(), pa.string())
+PARQUET_SCHEMAS = {
+    # One row per dialog. Messages whose parent is the dataset (the roots) have a null `parent`.
+    "messages": pa.schema([
+        ("dataset", _DICTIONARY_STRING),
+        ("messages", pa.list_(pa.struct([
+            ("from", _DICTIONARY_STRING),
+            ("text", pa.string()),
+            ("parent", pa.int32()),
+            ("score", pa.float64()),
+        ]))),
+    ]),
+    "supervised": pa.schema([
+        ("inputs", pa.string()),
+        ("targets", pa.string()),
+        ("dataset", _DICTIONARY_STRING),
+    ]),
+}
+# Rows per Parquet row group. Readers skip whole row groups whose `dataset` statistics exclude their filter.
+PARQUET_ROW_GROUP_SIZE = 10000
+
+
+def _dialogs_to_table(dialogs: typing.List[typing.List[typing.Dict]]) -> pa.Table:
+    datasets, messages = [], []
+    for dialog in dialogs:
+        dataset = dialog[0]["parent"]
+        datasets.append(dataset)
+        dialog_messages = []
+        for message in dialog:
+            parent = message["parent"]
+            if not isinstance(parent, int):
+                assert parent == dataset, \
+                    f"Every root message of a dialog must have the same `parent` dataset, but found {parent} and {dataset}."
+                parent = None
+            dialog_messages.append(
+                {"from": message["from"], "text": message["text"], "parent": parent, "score": message.get("score")})
+        messages.append(dialog_messages)
+    return pa.Table.from_pydict({"dataset": datasets, "messages": messages}, schema=PARQUET_SCHEMAS["messages"])
+
+
+def write_parquet_chunks(
+    chunks: typing.Iterable[typing.List],
+    outpath: str,
+    row_format: str="messages",
+    row_group_size: int=PARQUET_ROW_GROUP_SIZE,
+) -> int:
+    """Writes each chunk of rows to a zstd-compressed Parquet file as soon as it is produced, with the
+    `PARQUET_SCHEMAS[row_format]` schema, where rows are `messages` dialogs or `supervised` pairs.
+    Returns the number of rows written.
+
+    Read the file back with `read_parquet`.
+    """
+    dirname = os.path.dirname(outpath)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    schema = PARQUET_SCHEMAS[row_format]
+    num_rows = 0
+    with pq.ParquetWriter(outpath, schema, compression="zstd") as writer:
+        for chunk in chunks:
+            if row_format == "messages":
+                table = _dialogs_to_table(chunk)
+            else:
+                table = pa.Table.from_pylist(chunk, schema=schema)
+            writer.write_table(table, row_group_size=row_group_size)
+            num_rows += len(chunk)
+    return num_rows
+
+
+def read_parquet(
+    inpath: str,
+    columns: typing.Optional[typing.List[str]]=None,
+    datasets: typing.Optional[typing.Iterable[str]]=None,
+) -> pa.Table:
+    """Reads a `write_parquet_chunks` file as an Arrow table.
+
+    Only the given `columns` are read, and only the rows from the given `datasets` (UIDs): row groups
+    without any of them are skipped. Use `parquet_to_rows` for the rows `read_jsonl` would return.
+    """
+    filters = [("dataset", "in", list(datasets))] if datasets is not None else None
+    return pq.read_table(inpath, columns=columns, filters=filters)
+
+
+def parquet_to_rows(table: pa.Table) -> typing.List:
+    """Converts a table from `read_parquet` (with every column) back into the rows of the jsonlines output."""
+    if "messages" not in table.column_names:
+        return table.to_pylist()
+    dialogs = []
+    # Converting the message fields column by column is much faster than converting each row's structs.
+    for batch in table.to_batches():
+        messages = batch.column("messages")
+        fields = messages.flatten()
+        froms, texts = fields.field("from").to_pylist(), fields.field("text").to_pylist()
+        parents, scores = fields.field("parent").to_pylist(), fields.field("score").to_pylist()
+        i = 0
+        for dataset, num_messages in zip(batch.column("dataset").to_pylist(), messages.value_lengths().to_pylist()):
+            dialog = []
+            for j in range(i, i + num_messages):
+                message = {"from": froms[j], "text": texts[j], "parent": dataset if parents[j] is None else parents[j]}
+                if scores[j] is not None:
+                    message["score"] = scores[j]
+                dialog.append(message)
+            dialogs.append(dialog)
+            i += num_messages
+    return dialogs
+
+
 def read_yaml(inpath: str):
     with open(inpath, 'r') as inf:
         return yaml.safe_load(inf)
@@ -99,46 +366,357 @@ def read_yaml(inpath: str):
 #############################################################################
 
 
+def list_data_summary_files(summary_dir: str) -> typing.List[str]:
+    """Returns the collection summary files in `summary_dir`, in a stable order."""
+    return sorted([
+        collection_fp for collection_fp in listdir_nohidden(summary_dir)
+        if "_template.json" not in collection_fp and "_template_spec.yaml" not in collection_fp
+    ])
+
+# Absolute summary file --> (mtime_ns, size, its dataset summaries pickled), see `read_collection_summary`.
+_COLLECTION_SUMMARIES = {}
+
+def read_collection_summary(collection_fp: str) -> typing.List[typing.Dict]:
+    """Returns the dataset summaries in a single collection's summary file.
+
+    Each file's summaries are cached in memory, and only parsed again once the file's modification
+    time or size changes, so after editing one collection only that file is read again, by
+    `read_data_summary_json` as by `load_catalog`. The cache is pickled, which loads faster than
+    the JSON, and returns new objects the caller can modify.
+    """
+    key = os.path.abspath(collection_fp)
+    stat = os.stat(collection_fp)
+    cached = _COLLECTION_SUMMARIES.get(key)
+    if cached is None or cached[:2] != (stat.st_mtime_ns, stat.st_size):
+        summaries = list(read_json(collection_fp).values())
+        _COLLECTION_SUMMARIES[key] = (stat.st_mtime_ns, stat.st_size, pickle.dumps(summaries, pickle.HIGHEST_PROTOCOL))
+        return summaries
+    return pickle.loads(cached[2])
+
 def read_data_summary_json(summary_dir: str):
+    """Returns the dataset summaries of every collection in `summary_dir`, re-reading only the
+    collection files that changed since the last call (see `read_collection_summary`)."""
     collection_summaries = []
-    for collection_fp in listdir_nohidden(summary_dir):
-        if "_template.json" in collection_fp or "_template_spec.yaml" in collection_fp:
-            continue
-        collection_summaries.extend(list(read_json(collection_fp).values()))
+    for collection_fp in list_data_summary_files(summary_dir):
+        collection_summaries.extend(read_collection_summary(collection_fp))
     return collection_summaries
     # return pd.DataFrame(collection_summaries).fillna("")
 
-def read_all_constants(constants_dir):
-    license_classes = read_json(os.path.join(constants_dir, constants.LICENSE_CONSTANTS_FP))
-    custom_license_classes = read_json(os.path.join(constants_dir, constants.CUSTOM_LICENSE_CONSTANTS_FP))
-    license_paraphrases = read_json(os.path.join(constants_dir, constants.LICENSE_PARAPHRASES_FP))
-    language_groups = read_json(os.path.join(constants_dir, constants.LANGUAGE_CONSTANTS_FP))
-    task_groups = read_json(os.path.join(constants_dir, constants.TASK_CONSTANTS_FP))
-    model_groups = read_json(os.path.join(constants_dir, constants.MODEL_CONSTANTS_FP))
-    creator_groups = read_json(os.path.join(constants_dir, constants.CREATOR_CONSTANTS_FP))
-    creator_countries = read_json(os.path.join(constants_dir, constants.CREATOR_COUNTRY_CONSTANTS_FP))
-    all_formats = read_json(os.path.join(constants_dir, constants.FORMATS_CONSTANTS_FP))
-    topic_groups = read_json(os.path.join(constants_dir, constants.TOPIC_CONSTANTS_FP))
-    domain_groups = read_json(os.path.join(constants_dir, constants.DOMAINS_CONSTANTS_FP))
-    domain_types = read_json(os.path.join(constants_dir, constants.DOMAIN_TYPES_CONSTANTS_FP))
-    source_namemapper = read_json(os.path.join(constants_dir, constants.SOURCE_NAME_MAPPER_FP))
-
-    return {
-        "LICENSE_CLASSES": license_classes,
-        "CUSTOM_LICENSE_CLASSES": custom_license_classes,
-        "LICENSE_PARAPHRASES": license_paraphrases,
-        "LANGUAGE_GROUPS": language_groups,
-        "TASK_GROUPS": task_groups,
-        "MODEL_GROUPS": model_groups,
-        "CREATOR_GROUPS": creator_groups,
-        "CREATOR_COUNTRY_GROUPS": creator_countries,
-        "FORMATS": all_formats,
-        "TOPICS": topic_groups,
-        "DOMAIN_GROUPS": domain_groups,
-        "DOMAIN_TYPES": domain_types,
-        "SOURCE_NAME_MAPPER": source_namemapper,
+class ConstantsRegistry(Mapping):
+    """The constants folder, as a read-only {key --> constants} mapping (see `constants.ALL_CONSTANTS_FPS`).
+
+    Each constants file is only read the first time its key is accessed, so callers that
+    only need e.g. the license classes never read the other files. `inverse(key)` gives the
+    {value --> group} map of a constants file, built once and shared by every caller.
+    """
+
+    def __init__(self, constants_dir: str):
+        if not os.path.isdir(constants_dir):
+            raise FileNotFoundError(f"No constants folder at {constants_dir!r}.")
+        self.constants_dir = constants_dir
+        self._loaded = {}
+        self._inverses = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key):
+        if key not in self._loaded:
+            if key not in constants.ALL_CONSTANTS_FPS:
+                raise KeyError(key)
+            with self._lock:
+                if key not in self._loaded:
+                    self._loaded[key] = read_json(os.path.join(self.constants_dir, constants.ALL_CONSTANTS_FPS[key]))
+        return self._loaded[key]
+
+    def __iter__(self):
+        return iter(constants.ALL_CONSTANTS_FPS)
+
+    def __len__(self):
+        return len(constants.ALL_CONSTANTS_FPS)
+
+    def __getstate__(self):
+        # Locks can't be pickled, e.g. to send the constants to another process.
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"ConstantsRegistry({self.constants_dir!r}, loaded={list(self._loaded)})"
+
+    def inverse(self, key: str) -> typing.Dict[str, str]:
+        """{value --> group} for a {group --> [values]} constants file, e.g. "English" --> "English" group."""
+        if key not in self._inverses:
+            groups = self[key]
+            with self._lock:
+                self._inverses[key] = {v: k for k, vs in groups.items() for v in vs}
+        return self._inverses[key]
+
+
+# Absolute constants folder --> its ConstantsRegistry
+_CONSTANTS_REGISTRIES = {}
+
+def read_all_constants(constants_dir, reload: bool = False) -> ConstantsRegistry:
+    """Returns the constants in `constants_dir`, loaded lazily and shared across calls.
+
+    The registry is process-global: every caller gets the same dicts and lists, so they
+    must not be mutated (copy them first). Set `reload` to re-read the constants files,
+    e.g. after they were edited. Raises FileNotFoundError if `constants_dir` is not a folder.
+    """
+    key = os.path.abspath(constants_dir)
+    if reload or key not in _CONSTANTS_REGISTRIES:
+        _CONSTANTS_REGISTRIES[key] = ConstantsRegistry(constants_dir)
+    return _CONSTANTS_REGISTRIES[key]
+
+def invert_constants(all_constants: typing.Mapping, key: str) -> typing.Dict[str, str]:
+    """{value --> group} for `all_constants[key]`, reusing the registry's inverse when available."""
+    if isinstance(all_constants, ConstantsRegistry):
+        return all_constants.inverse(key)
+    return {v: k for k, vs in all_constants[key].items() for v in vs}
+
+
+#############################################################################
+############### Compiled Data Summary Catalog
+#############################################################################
+
+
+def hash_file(path: str) -> str:
+    """Returns the sha256 hex digest of a file's contents."""
+    sha = hashlib.sha256()
+    with open(path, "rb") as inf:
+        for block in iter(lambda: inf.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+def fingerprint_files(
+    paths: typing.List[str],
+    previous: typing.Optional[typing.Dict[str, typing.Dict]] = None,
+) -> typing.Dict[str, typing.Dict]:
+    """Returns {path --> {"mtime_ns", "size", "sha256"}} for every path.
+
+    Content hashes from `previous` are reused for files whose modification time
+    and size are unchanged, so an unchanged tree is fingerprinted without reading it.
+    """
+    previous = previous or {}
+    fingerprints = {}
+    for path in paths:
+        stat = os.stat(path)
+        old = previous.get(path, {})
+        if old.get("mtime_ns") == stat.st_mtime_ns and old.get("size") == stat.st_size:
+            sha = old["sha256"]
+        else:
+            sha = hash_file(path)
+        fingerprints[path] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": sha}
+    return fingerprints
+
+def catalog_source_files(summary_dir: str, constants_dir: str) -> typing.List[str]:
+    """All the files a catalog is compiled from: the collection summaries and the constants."""
+    constant_fps = sorted([fp for fp in listdir_nohidden(constants_dir) if fp.endswith(".json")])
+    return list_data_summary_files(summary_dir) + constant_fps
+
+def hash_catalog_sources(fingerprints: typing.Dict[str, typing.Dict]) -> str:
+    """Combines the per-file fingerprints into a single catalog hash."""
+    sha = hashlib.sha256(f"v{constants.CATALOG_VERSION}".encode("utf-8"))
+    for path in sorted(fingerprints):
+        sha.update(f"{os.path.basename(path)}:{fingerprints[path]['sha256']}".encode("utf-8"))
+    return sha.hexdigest()
+
+def build_catalog(
+    summary_files: typing.List[str],
+    all_constants: typing.Dict,
+) -> typing.Tuple[pd.DataFrame, typing.List[typing.List]]:
+    """Reads every collection summary file and maps its license criteria, as a DataFrame,
+    with the `Estimated Creation Date` of each dataset (see `filters.add_creation_dates`).
+
+    Returns the catalog, and [[summary file, number of rows]] in catalog order.
+    """
+    # Imported here, as `filters` itself depends on `io`.
+    from . import filters
+    data_summary, blocks = [], []
+    for path in summary_files:
+        collection_summary = read_collection_summary(path)
+        data_summary.extend(collection_summary)
+        blocks.append([path, len(collection_summary)])
+    data_summary = filters.map_license_criteria(data_summary, all_constants)
+    return filters.add_creation_dates(pd.DataFrame(data_summary).fillna("")), blocks
+
+def _changed_keys(old: typing.Dict, new: typing.Dict) -> typing.Set[str]:
+    return {k for k in set(old) | set(new) if old.get(k) != new.get(k)}
+
+def _rows_touching_licenses(catalog: pd.DataFrame, license_names: typing.Set[str], custom_license_urls: typing.Set[str]):
+    """Boolean mask of the catalog rows whose license criteria depend on any of these licenses."""
+    touched = []
+    for licenses, *inferred_licenses in zip(
+        catalog["Licenses"], catalog["GitHub License"], catalog["HF Yaml License"],
+        catalog["HF Config License"], catalog["PwC License"],
+    ):
+        names = {x["License"] for x in licenses}
+        urls = {x["License URL"] for x in licenses if x["License"] == "Custom"}
+        if names <= {"OpenAI"}:
+            # `map_license_criteria` resolves these as Unspecified, when ignoring OpenAI terms.
+            names.add("Unspecified")
+        names.update([x for x in inferred_licenses if x])
+        touched.append(bool(names & license_names or urls & custom_license_urls))
+    return pd.Series(touched, index=catalog.index, dtype=bool)
+
+def update_catalog(
+    catalog: pd.DataFrame,
+    manifest: typing.Dict,
+    fingerprints: typing.Dict[str, typing.Dict],
+    summary_files: typing.List[str],
+    all_constants: typing.Dict,
+) -> typing.Tuple[pd.DataFrame, typing.List[typing.List], typing.Dict]:
+    """Patches a previously compiled catalog to match the current source files.
+
+    Only collections whose summary file was added or changed are re-read and license
+    mapped. If the license constants changed, only the rows that use one of the
+    changed licenses are license mapped again. Other constants do not affect the catalog.
+
+    Returns the updated catalog, its [[summary file, number of rows]] blocks, and a
+    report of what was rebuilt.
+    """
+    from . import filters
+    old_files = manifest["files"]
+    report = {
+        "full_rebuild": False,
+        "collections_rebuilt": [],
+        "collections_removed": [],
+        "constants_changed": [
+            path for path in fingerprints
+            if path not in summary_files and old_files.get(path, {}).get("sha256") != fingerprints[path]["sha256"]
+        ],
+        "rows_relicensed": 0,
     }
 
+    # Split the catalog back into one block of rows per collection summary file.
+    # Creation dates are derived columns, so they are re-added once at the end.
+    catalog = catalog.drop(columns=["Estimated Creation Date", "Estimated Creation Date Source"])
+    blocks, start = {}, 0
+    for path, num_rows in manifest["blocks"]:
+        blocks[path] = catalog.iloc[start:start + num_rows]
+        start += num_rows
+    report["collections_removed"] = [path for path in blocks if path not in summary_files]
+
+    for path in summary_files:
+        if path not in blocks or old_files.get(path, {}).get("sha256") != fingerprints[path]["sha256"]:
+            blocks[path] = pd.DataFrame(filters.map_license_criteria(read_collection_summary(path), all_constants))
+            report["collections_rebuilt"].append(path)
+    catalog = pd.concat([blocks[path] for path in summary_files], ignore_index=True, sort=False).fillna("")
+
+    # Re-map the license criteria of rows that use a license whose classes changed.
+    old_license_constants = manifest["license_constants"]
+    changed_licenses = _changed_keys(old_license_constants["LICENSE_CLASSES"], all_constants["LICENSE_CLASSES"])
+    changed_urls = _changed_keys(old_license_constants["CUSTOM_LICENSE_CLASSES"], all_constants["CUSTOM_LICENSE_CLASSES"])
+    if changed_licenses or changed_urls:
+        touched = _rows_touching_licenses(catalog, changed_licenses, changed_urls)
+        touched_uids = set(catalog.loc[touched, "Unique Dataset Identifier"])
+        raw_rows = [
+            row for path in summary_files if path not in report["collections_rebuilt"]
+            for row in read_collection_summary(path) if row["Unique Dataset Identifier"] in touched_uids
+        ]
+        if raw_rows:
+            raw_columns = set().union(*[row.keys() for row in raw_rows])
+            remapped = pd.DataFrame(filters.map_license_criteria(raw_rows, all_constants)).fillna("")
+            rows = catalog.index[catalog["Unique Dataset Identifier"].isin(remapped["Unique Dataset Identifier"])]
+            remapped.index = rows
+            for col in remapped.columns:
+                if col not in raw_columns:
+                    catalog[col] = catalog[col].astype(object)
+                    catalog.loc[rows, col] = remapped[col]
+        report["rows_relicensed"] = len(raw_rows)
+
+    # Restore the dtypes a full rebuild would infer, e.g. once a column holds only ints again.
+    blocks = [[path, len(blocks[path])] for path in summary_files]
+    return filters.add_creation_dates(catalog.infer_objects()), blocks, report
+
+def load_catalog(
+    summary_dir: str = "data_summaries/",
+    constants_dir: str = "constants/",
+    cache_dir: str = constants.CATALOG_CACHE_DIR,
+    rebuild: bool = False,
+    verbose: bool = False,
+) -> pd.DataFrame:
+    """Loads the license-mapped data summaries DataFrame from a compiled catalog.
+
+    The catalog is a pickled DataFrame in `cache_dir`, with a manifest recording the
+    content hash of every file in `summary_dir` and `constants_dir` it was built from.
+    When any of those files change, the catalog is patched incrementally (see
+    `update_catalog`), or fully rebuilt if `rebuild` is set. It is always equivalent to:
+
+        filters.add_creation_dates(pd.DataFrame(
+            filters.map_license_criteria(read_data_summary_json(summary_dir), all_constants)).fillna(""))
+
+    The catalog hash is stored in `df.attrs["catalog_hash"]`, and a report of what
+    was rebuilt by this call in `df.attrs["catalog_update"]` (empty if nothing was).
+    Each compiled catalog is checked against the constants once (see `validation.get_catalog_validation`),
+    and whether it passed is stored in `df.attrs["catalog_valid"]`.
+    """
+    catalog_fp = os.path.join(cache_dir, constants.CATALOG_FP)
+    manifest_fp = os.path.join(cache_dir, constants.CATALOG_MANIFEST_FP)
+    manifest = read_json(manifest_fp) if os.path.exists(manifest_fp) else {}
+    if manifest.get("version") != constants.CATALOG_VERSION:
+        manifest = {}
+
+    # Files are keyed by absolute path, so e.g. "data_summaries/" and "./data_summaries" share the catalog.
+    summary_files = [os.path.abspath(path) for path in list_data_summary_files(summary_dir)]
+    fingerprints = fingerprint_files(
+        [os.path.abspath(path) for path in catalog_source_files(summary_dir, constants_dir)],
+        previous=manifest.get("files"))
+    catalog_hash = hash_catalog_sources(fingerprints)
+
+    report = {}
+    if not rebuild and manifest.get("hash") == catalog_hash and os.path.exists(catalog_fp):
+        catalog = pd.read_pickle(catalog_fp)
+    else:
+        all_constants = read_all_constants(constants_dir, reload=True)
+        if rebuild or not manifest or not os.path.exists(catalog_fp):
+            if verbose:
+                print(f"Compiling data summary catalog into {catalog_fp}...")
+            catalog, blocks = build_catalog(summary_files, all_constants)
+            report = {
+                "full_rebuild": True,
+                "collections_rebuilt": summary_files,
+                "collections_removed": [],
+                "constants_changed": [path for path in fingerprints if path not in summary_files],
+                "rows_relicensed": len(catalog),
+            }
+        else:
+            catalog, blocks, report = update_catalog(
+                pd.read_pickle(catalog_fp), manifest, fingerprints, summary_files, all_constants)
+            if verbose:
+                print(
+                    f"Updated data summary catalog: rebuilt {len(report['collections_rebuilt'])} collections, "
+                    f"removed {len(report['collections_removed'])}, re-mapped licenses for {report['rows_relicensed']} rows.")
+
+        os.makedirs(cache_dir, exist_ok=True)
+        # Write to a temporary file first so concurrent readers never see a partial catalog.
+        tmp_fp = f"{catalog_fp}.{os.getpid()}.tmp"
+        catalog.to_pickle(tmp_fp)
+        os.replace(tmp_fp, catalog_fp)
+        write_json({
+            "version": constants.CATALOG_VERSION,
+            "hash": catalog_hash,
+            "files": fingerprints,
+            "blocks": blocks,
+            "license_constants": {
+                "LICENSE_CLASSES": all_constants["LICENSE_CLASSES"],
+                "CUSTOM_LICENSE_CLASSES": all_constants["CUSTOM_LICENSE_CLASSES"],
+            },
+        }, manifest_fp, atomic=True)
+
+    catalog.attrs["catalog_update"] = report
+    catalog.attrs["catalog_hash"] = catalog_hash
+
+    # Imported here, as `validation` itself depends on `io`.
+    from . import validation
+    catalog_validation = validation.get_catalog_validation(catalog, constants_dir, cache_dir)
+    catalog.attrs["catalog_valid"] = catalog_validation["valid"]
+    if verbose and not catalog_validation["valid"]:
+        print(f"The data summaries use values missing from {constants_dir}: {catalog_validation['errors']}")
+    return catalog
+
 
 def get_bibtex_from_paper(paper: str):
     sch = SemanticScholar(timeout=50)
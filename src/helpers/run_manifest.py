@@ -0,0 +1,71 @@
+import os
+import threading
+import typing
+
+from . import io, constants
+
+
+class RunManifest:
+    """Records the progress of a `download_and_filter.py` run in its `--savedir`, so a rerun
+    with the same configuration skips completed collections and resumes interrupted ones.
+
+    The manifest maps each collection to:
+        "status": "running", "complete", or why it failed,
+        "config": the filter IDs and options its output depends on,
+        "checkpoint": {"dialogs", "messages", "rows", "offset"} saved so far (see `Downloader.run_and_save`),
+        "rows", "sha256": the row count and checksum of the completed output file.
+    """
+
+    def __init__(self, savedir: str):
+        self.path = os.path.join(savedir, constants.RUN_MANIFEST_FP)
+        self._lock = threading.Lock()
+        self.collections = io.read_json(self.path) if os.path.exists(self.path) else {}
+
+    def is_complete(self, name: str, config: typing.Dict, savepath: str) -> bool:
+        """Whether `name` completed with this `config`, and its output file is unchanged since."""
+        entry = self.collections.get(name, {})
+        return (
+            entry.get("status") == "complete"
+            and entry.get("config") == config
+            and os.path.exists(savepath)
+            and io.hash_file(savepath) == entry.get("sha256")
+        )
+
+    def resume_point(self, name: str, config: typing.Dict, savepath: str) -> typing.Optional[typing.Dict]:
+        """The last checkpoint of an unfinished run of `name` with this `config`, if its output file has it."""
+        entry = self.collections.get(name, {})
+        checkpoint = entry.get("checkpoint")
+        if (
+            entry.get("status") == "complete"
+            or entry.get("config") != config
+            or not checkpoint
+            or not os.path.exists(savepath)
+            or os.path.getsize(savepath) < checkpoint["offset"]
+        ):
+            return None
+        return checkpoint
+
+    def start(self, name: str, config: typing.Dict, resume: typing.Optional[typing.Dict] = None):
+        self._update(name, {"status": "running", "config": config, "checkpoint": resume})
+
+    def checkpoint(self, name: str, checkpoint: typing.Dict):
+        self._update(name, {**self.collections[name], "checkpoint": checkpoint})
+
+    def complete(self, name: str, num_rows: int, savepath: str):
+        self._update(name, {
+            "status": "complete",
+            "config": self.collections[name]["config"],
+            "rows": num_rows,
+            "sha256": io.hash_file(savepath),
+        })
+
+    def fail(self, name: str, status: str):
+        self._update(name, {**self.collections[name], "status": status})
+
+    def _update(self, name: str, entry: typing.Dict):
+        # Collections may run on several threads, see `download_and_filter.schedule_collections`.
+        with self._lock:
+            self.collections[name] = entry
+            tmp_path = f"{self.path}.tmp"
+            io.write_json(self.collections, tmp_path)
+            os.replace(tmp_path, self.path)
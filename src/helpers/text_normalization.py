@@ -0,0 +1,49 @@
+import re
+import typing
+from functools import lru_cache
+
+
+# Bracketed citations (e.g. "[1]" in Wikipedia text) with their surrounding whitespace, within a line.
+# Equivalent to `\s*\[.*?\]\s*`: the lazy `.*?` stops at the first "]", and `.` does not match newlines.
+CITATION_PATTERN = re.compile(r"\s*\[[^\]\n]*\]\s*")
+
+# Characters `normalize_language_name` removes, or replaces with "-".
+_LANGUAGE_NAME_TABLE = str.maketrans({"'": None, "(": None, ")": None, " ": "-"})
+
+
+def remove_citations(text: str) -> str:
+    """Removes bracketed citations, and the whitespace around them, from `text`."""
+    # Most texts have no brackets, and a regex search over the whole text costs far more than `in`.
+    if "[" not in text:
+        return text
+    return CITATION_PATTERN.sub("", text)
+
+
+@lru_cache(maxsize=None)
+def normalize_language_name(name: str) -> str:
+    """Normalizes a programming language name into a dataset key, e.g. "Common Lisp (Emacs)" --> "common-lisp-emacs".
+
+    Collections repeat a few hundred names over millions of rows, so each one is only normalized once.
+    """
+    return name.translate(_LANGUAGE_NAME_TABLE).lower()
+
+
+def split_turns(text: str, markers: typing.Sequence[str], separator: str = "<*>") -> typing.List[str]:
+    """Splits a transcript into turns, each starting with one of the `markers` (e.g. "<human>:"),
+    after any text before the first marker. Any `separator` in the text also splits it.
+
+    Each turn starts with its marker, so `strip_marker` removes it without searching the turn. The markers
+    are marked with `str.replace` and split with one `str.split`, which is several times faster than
+    a single `re.split` over the transcript.
+    """
+    for marker in markers:
+        text = text.replace(marker, separator + marker)
+    return text.split(separator)
+
+
+def strip_marker(turn: str, markers: typing.Sequence[str]) -> str:
+    """Removes the marker a `split_turns` turn starts with, if any."""
+    for marker in markers:
+        if turn.startswith(marker):
+            return turn[len(marker):]
+    return turn
@@ -0,0 +1,132 @@
+import os
+import typing
+from collections import Counter, defaultdict
+
+import pandas as pd
+
+# import src.helpers.constants as constants
+from . import io, constants
+
+
+# Categories whose missing values make `filters.apply_filters` fail, as it could not group them.
+# Values missing from the other categories are reported as warnings.
+ERROR_CATEGORIES = ["Languages", "Task Categories", "Model Generated"]
+
+# In-process validation reports, {catalog hash --> report}
+_VALIDATIONS = {}
+
+
+def allowed_values(all_constants) -> typing.Dict[str, typing.Set[str]]:
+    """{category --> values defined for it in the constants}"""
+    return {
+        "Licenses": set(all_constants["LICENSE_CLASSES"]),
+        "Custom Licenses": set(all_constants["CUSTOM_LICENSE_CLASSES"]),
+        "Languages": set(io.invert_constants(all_constants, "LANGUAGE_GROUPS")),
+        "Task Categories": set(io.invert_constants(all_constants, "TASK_GROUPS")),
+        "Text Sources": set(io.invert_constants(all_constants, "DOMAIN_GROUPS")),
+        # Model names are matched case insensitively, as in `apply_filters`.
+        "Model Generated": {v.lower() for v in io.invert_constants(all_constants, "MODEL_GROUPS")},
+        "Creators": set(io.invert_constants(all_constants, "CREATOR_GROUPS")),
+        "Creator Countries": set(io.invert_constants(all_constants, "CREATOR_COUNTRY_GROUPS")),
+        "Format": set(all_constants["FORMATS"]),
+    }
+
+
+def row_values(row) -> typing.Dict[str, typing.List[str]]:
+    """{category --> the values a data summary row uses from it}"""
+    licenses = row.get("Licenses", [])
+    return {
+        "Licenses": [lic["License"] for lic in licenses if lic["License"] != "Custom"],
+        "Custom Licenses": [lic["License URL"] for lic in licenses if lic["License"] == "Custom"],
+        "Languages": row.get("Languages", []),
+        "Task Categories": row.get("Task Categories", []),
+        "Text Sources": row.get("Text Sources", []),
+        "Model Generated": [model.lower() for model in row.get("Model Generated", [])],
+        "Creators": row.get("Creators", []),
+        "Creator Countries": row.get("Creators", []),
+        "Format": row.get("Format", []),
+    }
+
+
+def find_missing_values(rows, all_constants) -> typing.Dict[str, typing.Dict[str, typing.Set[str]]]:
+    """Finds the values data summary rows use, that are not defined in the constants.
+
+    Returns:
+        Dict: {category --> {missing value --> collections it appears in}}, for every category.
+    """
+    allowed = allowed_values(all_constants)
+    missing = {category: defaultdict(set) for category in allowed}
+    for row in rows:
+        for category, values in row_values(row).items():
+            for value in values:
+                if value not in allowed[category]:
+                    missing[category][value].add(row["Collection"])
+    return {category: dict(values) for category, values in missing.items()}
+
+
+def validate_catalog(catalog: pd.DataFrame, all_constants) -> typing.Dict:
+    """Checks a data summary catalog against the constants, and returns a JSON-serializable report.
+
+    Returns:
+        Dict: {
+            "catalog_hash": hash of the catalog's sources, if known,
+            "valid": whether `apply_filters` can filter it, i.e. there are no errors,
+            "errors": {category --> {missing value --> sorted collections}}, for the `ERROR_CATEGORIES`,
+            "warnings": the same for the other categories, and duplicate dataset identifiers,
+        }
+    """
+    columns = ["Unique Dataset Identifier", "Collection", "Licenses", "Languages", "Task Categories",
+               "Text Sources", "Model Generated", "Creators", "Format"]
+    rows = catalog[[col for col in columns if col in catalog.columns]].to_dict("records")
+    missing = {
+        category: {value: sorted(collections) for value, collections in values.items()}
+        for category, values in find_missing_values(rows, all_constants).items()
+    }
+    uid_counts = Counter(row["Unique Dataset Identifier"] for row in rows)
+    errors = {category: missing.pop(category) for category in ERROR_CATEGORIES}
+    warnings = missing
+    warnings["Duplicate Unique Dataset Identifiers"] = {uid: count for uid, count in uid_counts.items() if count > 1}
+    return {
+        "catalog_hash": catalog.attrs.get("catalog_hash"),
+        "valid": not any(errors.values()),
+        "errors": errors,
+        "warnings": warnings,
+    }
+
+
+def get_catalog_validation(
+    catalog: pd.DataFrame,
+    constants_dir: str,
+    cache_dir: str = constants.CATALOG_CACHE_DIR,
+) -> typing.Dict:
+    """Returns the `validate_catalog` report for a catalog from `io.load_catalog`.
+
+    Reports are cached in memory and in `cache_dir`, keyed on the catalog hash, so each
+    compiled catalog is only validated once.
+    """
+    catalog_hash = catalog.attrs.get("catalog_hash")
+    if catalog_hash is None:
+        return validate_catalog(catalog, io.read_all_constants(constants_dir))
+    if catalog_hash in _VALIDATIONS:
+        return _VALIDATIONS[catalog_hash]
+
+    validation_fp = os.path.join(cache_dir, constants.CATALOG_VALIDATION_FP)
+    report = io.read_json(validation_fp) if os.path.exists(validation_fp) else {}
+    if report.get("catalog_hash") != catalog_hash:
+        report = validate_catalog(catalog, io.read_all_constants(constants_dir))
+        io.write_json(report, validation_fp, atomic=True)
+    _VALIDATIONS[catalog_hash] = report
+    return report
+
+
+def assert_valid_catalog(df: pd.DataFrame, all_constants):
+    """Raises an AssertionError if `df` uses values `apply_filters` cannot group.
+
+    DataFrames derived from a catalog that `io.load_catalog` already validated are not checked again.
+    """
+    if df.attrs.get("catalog_valid"):
+        return
+    errors = validate_catalog(df, all_constants)["errors"]
+    assert not errors["Languages"], f"Missing Languages: {set(errors['Languages'])}"
+    assert not errors["Task Categories"], f"Missing Task Categories: {set(errors['Task Categories'])}"
+    assert not errors["Model Generated"], f"Missing Models: {set(errors['Model Generated'])}"
@@ -3,9 +3,14 @@
 # from functools import partial
 # from collections import Counter, defaultdict
 # from helpers import io
+from helpers import text_normalization
 import re
+import string
+import sys
 
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
 
 # ##########################################################################
 # ############## Data Preparer Utils
@@ -26,6 +31,159 @@ def convert_inputs_targets_to_messages(
     ]
 
 
+# Every character `str.strip()` removes, so Arrow strips text exactly as Python does.
+PYTHON_WHITESPACE = "".join(chr(c) for c in range(sys.maxunicode + 1) if chr(c).isspace())
+
+
+def _strip(texts):
+    return pc.utf8_trim(texts, characters=PYTHON_WHITESPACE)
+
+
+class TextSpec:
+    """How an `InputsTargetsSpec` builds a text from each row.
+
+    parts: Format strings over the row's columns, e.g. "{instruction}", "{conversations[0][value]}",
+        or "{sql_context}: {sql_prompt}", joined with `sep`.
+    skip_empty: Leaves out parts that are empty or None, as in `if row["input"]: ...`.
+    strip_parts: Strips each part before joining.
+    strip: Strips the joined text before the `subs`.
+    subs: (pattern, replacement) regular expressions, applied in order with `re.sub`.
+
+    As in `convert_inputs_targets_to_messages`, the final text is always stripped.
+    """
+
+    def __init__(self, parts, sep="", skip_empty=False, strip_parts=False, strip=False, subs=()):
+        self.parts = [_parse_template(part) for part in parts]
+        self.sep = sep
+        self.skip_empty = skip_empty
+        self.strip_parts = strip_parts
+        self.strip = strip
+        self.subs = [(re.compile(pattern), replacement) for pattern, replacement in subs]
+
+    def columns(self):
+        return {path[0] for part in self.parts for _, path in part if path}
+
+    def render(self, table):
+        """Returns the text for every row of an Arrow table, as an Arrow string array."""
+        joined = None
+        for part in self.parts:
+            texts = _render_template(part, table)
+            if self.strip_parts:
+                texts = _strip(texts)
+            if self.skip_empty:
+                texts = pc.fill_null(texts, "")
+            if joined is None:
+                joined = texts
+            elif self.skip_empty:
+                # Only separate parts that are both non-empty.
+                both = pc.and_(pc.not_equal(joined, ""), pc.not_equal(texts, ""))
+                joined = pc.if_else(
+                    both, pc.binary_join_element_wise(joined, texts, self.sep), pc.binary_join_element_wise(joined, texts, ""))
+            else:
+                joined = pc.binary_join_element_wise(joined, texts, self.sep)
+        if joined.null_count:
+            raise ValueError("Missing values, which the Python preparer would fail on.")
+        if self.strip:
+            joined = _strip(joined)
+        if self.subs:
+            # Python regular expressions, as Arrow's (RE2) differ, e.g. `\s` only matches ASCII whitespace.
+            texts = joined.to_pylist()
+            for pattern, replacement in self.subs:
+                texts = [pattern.sub(replacement, text) for text in texts]
+            joined = pa.array(texts, pa.string())
+        return _strip(joined)
+
+
+class InputsTargetsSpec:
+    """A declarative preparer for collections where each row becomes one (inputs, targets) dialog,
+    equivalent to a Python preparer that calls `convert_inputs_targets_to_messages`.
+
+    It is registered as the `prepare_spec` of a collection in `COLLECTION_FN_MAPPER`, and
+    `Downloader` runs it over batches of rows as Arrow tables, instead of calling the
+    `prepare_function` on each row in the worker pool.
+
+    inputs, targets: A `TextSpec`, or a format string over the row's columns.
+    parent: A format string with a single column, e.g. "{category}", or a constant, e.g. "alpaca".
+    """
+
+    def __init__(self, inputs, targets, parent):
+        self.inputs = inputs if isinstance(inputs, TextSpec) else TextSpec([inputs])
+        self.targets = targets if isinstance(targets, TextSpec) else TextSpec([targets])
+        self.parent = _parse_template(parent)
+        assert len(self.parent) == 1, f"The parent must be a single column or a constant, not {parent}."
+
+    def columns(self):
+        """The columns this spec reads."""
+        literal, path = self.parent[0]
+        return self.inputs.columns() | self.targets.columns() | ({path[0]} if path else set())
+
+    def prepare_batch(self, table, keys_to_uid=None):
+        """Prepares every row of an Arrow table into the dialogs `convert_inputs_targets_to_messages` returns.
+
+        If `keys_to_uid` is given, the parents are mapped to dataset UIDs, as `Downloader` normalizes them.
+        Raises an Arrow error, KeyError, TypeError or ValueError for rows it cannot prepare exactly
+        as the Python preparer would, e.g. with missing columns, values of other types, or None values.
+        """
+        inputs = self.inputs.render(table).to_pylist()
+        targets = self.targets.render(table).to_pylist()
+        literal, path = self.parent[0]
+        # A column parent keeps its values' types, as the Python preparers pass them on.
+        parents = _column(table, path).to_pylist() if path else [literal] * table.num_rows
+        if keys_to_uid is not None:
+            # Map each distinct parent once, rather than every message.
+            uids = {}
+            for parent in set(parents):
+                assert isinstance(parent, int) or parent in keys_to_uid, \
+                    f"The `parent` field of the first message in a dialog must be from one of the `Dataset Filter Ids`, specified in the json. It is currently {parent} when the options are {keys_to_uid.keys()}"
+                uids[parent] = keys_to_uid.get(parent, parent)
+            parents = [uids[parent] for parent in parents]
+        return [
+            [
+                {"from": "user", "text": input_text, "parent": dset},
+                {"from": "assistant", "text": target_text, "parent": 0},
+            ]
+            for input_text, target_text, dset in zip(inputs, targets, parents)
+        ]
+
+
+def _parse_template(template):
+    """Parses a format string into (literal text, column path) pieces, where a path is the column
+    name followed by list indices and struct fields, e.g. "{a[0][b]}" --> ["a", 0, "b"]."""
+    pieces = []
+    for literal, field, format_spec, conversion in string.Formatter().parse(template):
+        if field is None:
+            pieces.append((literal, None))
+            continue
+        assert not format_spec and not conversion, f"Unsupported format field in {template}."
+        name, *keys = re.findall(r"[^\[\]]+", field)
+        pieces.append((literal, [name] + [int(key) if key.isdigit() else key for key in keys]))
+    return pieces
+
+
+def _column(table, path):
+    values = table.column(path[0])
+    for key in path[1:]:
+        values = pc.list_element(values, key) if isinstance(key, int) else pc.struct_field(values, [key])
+    return values
+
+
+def _render_template(pieces, table):
+    texts = []
+    for literal, path in pieces:
+        if literal:
+            texts.append(literal)
+        if path:
+            values = _column(table, path)
+            if not (pa.types.is_string(values.type) or pa.types.is_large_string(values.type)):
+                raise TypeError(f"Column {path} is {values.type}, not text.")
+            texts.append(values.cast(pa.string()))
+    if not any(isinstance(text, (pa.Array, pa.ChunkedArray)) for text in texts):
+        return pa.array(["".join(texts)] * table.num_rows, pa.string())
+    if len(texts) == 1:
+        return texts[0]
+    return pc.binary_join_element_wise(*texts, "")
+
+
 # ##########################################################################
 # ############## Data Preparer Functions
 # ##########################################################################
@@ -59,14 +217,7 @@ def prepare_xp3x(row):
 
 
 def prepare_commitpackft(row):
-    lang_normalized = (
-        row["lang"]
-        .replace("'", "")
-        .replace("(", "")
-        .replace(")", "")
-        .replace(" ", "-")
-        .lower()
-    )
+    lang_normalized = text_normalization.normalize_language_name(row["lang"])
     return convert_inputs_targets_to_messages(
         # Could add some strong delimiters to separate the code from the text
         # e.g. ```prog_lang\n<old_contents>\n```\n\n<subject>
@@ -113,10 +264,10 @@ def prepare_cobra_frames(row):
 
 
 def prepare_dolly_15k(row):
-    input_text = re.sub(
-        r"\s*\[.*?\]\s*", "", "\n".join([row["context"], row["instruction"]]).strip()
+    input_text = text_normalization.remove_citations(
+        "\n".join([row["context"], row["instruction"]]).strip()
     )
-    target_text = re.sub(r"\s*\[.*?\]\s*", "", row["response"])
+    target_text = text_normalization.remove_citations(row["response"])
     return convert_inputs_targets_to_messages(input_text, target_text, row["category"])
 
 
@@ -130,9 +281,11 @@ def prepare_thai_gen_ai_dolly(row):
     return convert_inputs_targets_to_messages(input_text, target_text, row["category"])
 
 
+# Rosey is there since unified_joke_explanations uses this instead of <bot> marker.
+LAION_OIG_TURN_MARKERS = ("<human>:", "<bot>:", "Rosey:")
+
+
 def prepare_laion_oig(row):
-    # Rosey is there since unified_joke_explanations uses this instead of <bot> marker.
-    turn_markers = ["<human>:", "<bot>:", "Rosey:"]
     turns = row["text"].strip()
     parent = row["_source"]
 
@@ -142,19 +295,12 @@ def prepare_laion_oig(row):
         turns = turns.replace("<human>: ", "\n", 1)
         turns = "<human>: " + turns
 
-    # Append the turn markers with a separator for easy splitting on the turns.
-    SEPARATOR = "<*>"
-    for tm in turn_markers:
-        turns = turns.replace(tm, f"{SEPARATOR}{tm}")
-    turns = turns.split(SEPARATOR)
-
     messages = []
-    for i, turn in enumerate(turns):
+    for i, turn in enumerate(text_normalization.split_turns(turns, LAION_OIG_TURN_MARKERS)):
         if turn.strip():
             speaker = "user" if turn.startswith("<human>") else "assistant"
-            # Remove the turn markers from the turns
-            for tm in turn_markers:
-                turn = turn.replace(tm, "")
+            # Remove the turn marker from the turn
+            turn = text_normalization.strip_marker(turn, LAION_OIG_TURN_MARKERS)
             messages.append(
                 {
                     "from": speaker,
@@ -281,6 +427,8 @@ def prepare_open_assistant(dset):
                 )
                 dialog_idx += 1
         messageid_to_idx[row["message_id"]] = dialog_idx
+    if current_dialog and len(current_dialog) > 1:
+        messages.append(current_dialog)
     return messages
 
 
@@ -855,6 +1003,17 @@ def tinystories_get_example(it):
     return convert_inputs_targets_to_messages(inpt_text, tgt_text, "tiny-stories")
 
 
+def tiny_stories_partitions(dset):
+    """The story of each row (line) of Tiny Stories, for the `partition_key`: each story's lines
+    end with an empty line, as read by `tinystories_get_example`."""
+    story_ids, story_id = [], 0
+    for row in dset:
+        story_ids.append(story_id)
+        if row["text"].strip() == "":
+            story_id += 1
+    return story_ids
+
+
 def prepare_tiny_stories(dset):
     stories = []
     it = iter(dset)
@@ -1175,12 +1334,10 @@ def prepare_indic_instruct(row):
             row["messages"][0]["content"], row["messages"][1]["content"], row["dataset"]
         )
     if row["dataset"] == "dolly":
-        input_text = re.sub(
-            r"\s*\[.*?\]\s*",
-            "",
+        input_text = text_normalization.remove_citations(
             "\n".join([row["context"], row["instruction"]]).strip(),
         )
-        target_text = re.sub(r"\s*\[.*?\]\s*", "", row["response"])
+        target_text = text_normalization.remove_citations(row["response"])
 
         return convert_inputs_targets_to_messages(
             input_text, target_text, row["dataset"]
@@ -1586,4 +1743,83 @@ def prepare_inst_ar(row):
         row["instruction"],
         row["output"],
         row["source"],
-    )
\ No newline at end of file
+    )
+
+
+# ##########################################################################
+# ############## Data Preparer Specs
+# ##########################################################################
+# `InputsTargetsSpec` equivalents of the preparers above, for `COLLECTION_FN_MAPPER`.
+# `test_prepare_specs.py` checks each one returns the same dialogs as its preparer.
+
+# Strips an alpaca-style "instruction" and its optional "input", and puts them on separate lines.
+_INSTRUCTION_AND_INPUT = TextSpec(["{instruction}", "{input}"], sep="\n", skip_empty=True, strip_parts=True)
+_DOLLY_SUBS = [(text_normalization.CITATION_PATTERN.pattern, "")]
+
+OPEN_PLATYPUS_SPEC = InputsTargetsSpec(
+    TextSpec(["{input}", "{instruction}"], sep=" ", skip_empty=True), "{output}", "{data_source}")
+FLAN_COLLECTION_SPEC = InputsTargetsSpec("{inputs}", "{targets}", "{task_name}")
+DOLLY_15K_SPEC = InputsTargetsSpec(
+    TextSpec(["{context}", "{instruction}"], sep="\n", strip=True, subs=_DOLLY_SUBS),
+    TextSpec(["{response}"], subs=_DOLLY_SUBS),
+    "{category}",
+)
+SELF_INSTRUCT_SPEC = InputsTargetsSpec("{prompt}", "{completion}", "self_instruct")
+LONGFORM_SPEC = InputsTargetsSpec("{input}", "{output}", "{source}")
+GPTEACHER_SPEC = InputsTargetsSpec(
+    TextSpec(["{instruction}", "{input}"], sep="\n", skip_empty=True), "{response}", "{_source}")
+ALPACA_SPEC = InputsTargetsSpec(TextSpec(["{instruction}", "{input}"], sep=" "), "{output}", "alpaca")
+EVERYTHING_LM_SPEC = InputsTargetsSpec(TextSpec(["{instruction}", "{input}"], sep=" "), "{output}", "everything_lm")
+LLAMA2_MED_TUNED_INSTRUCTIONS_SPEC = InputsTargetsSpec(
+    TextSpec(["{instruction}", "{input}"], sep="\n"), "{output}", "llama2_med_tuned_instructions")
+EVOL_INSTRUCT_SPEC = InputsTargetsSpec(
+    "{conversations[0][value]}", "{conversations[1][value]}", "evol_instruct")
+EVOL_INSTRUCT_V2_SPEC = InputsTargetsSpec(
+    "{conversations[0][value]}", "{conversations[1][value]}", "evol_instruct_v2")
+METAMATHQA_SPEC = InputsTargetsSpec("{query}", "{response}", "{type}")
+ULTRAFEEDBACK_ARGILLA_SPEC = InputsTargetsSpec("{instruction}", "{chosen_response}", "{source}")
+FEEDBACK_COLLECTION_SPEC = InputsTargetsSpec("{instruction}", "{output}", "feedback_collection")
+PREFERENCE_COLLECTION_SPEC = InputsTargetsSpec("{instruction}", "{output}", "preference_collection")
+SYNTHETIC_GSM8K_REFLECTION_SPEC = InputsTargetsSpec("{question}", "{answer}", "synthetic_gsm8k_reflection")
+CODE_ALPACA_SPEC = InputsTargetsSpec(_INSTRUCTION_AND_INPUT, "{output}", "code_alpaca")
+GLAIVE_CODE_ASSISTANT_SPEC = InputsTargetsSpec("{question}", "{answer}", "glaive_code_assistant")
+GLAIVE_CODE_ASSISTANT_V2_SPEC = InputsTargetsSpec("{question}", "{answer}", "glaive-code-assistant-v2")
+GLAIVE_CODE_ASSISTANT_V3_SPEC = InputsTargetsSpec("{question}", "{answer}", "glaive-code-assistant-v3")
+COT_COLLECTION_SPEC = InputsTargetsSpec("{source}", "{rationale}", "{_source}")
+GPT4_ALPACA_SPEC = InputsTargetsSpec(_INSTRUCTION_AND_INPUT, "{output}", "gpt4alpaca")
+THAI_GEN_AI_ALPACA_SPEC = InputsTargetsSpec(_INSTRUCTION_AND_INPUT, "{output}", "thai_gen_ai_alpaca")
+THAI_GEN_AI_GPTEACHER_SPEC = InputsTargetsSpec(_INSTRUCTION_AND_INPUT, "{output}", "thai_gen_ai_gpteacher")
+THAI_GEN_AI_DOLLY_SPEC = InputsTargetsSpec(
+    TextSpec(["{context}", "{instruction}"], sep="\n", skip_empty=True), "{response}", "{category}")
+TASKSOURCE_INSTRUCT_SPEC = InputsTargetsSpec("{inputs}", "{targets}", "{task}")
+STACK_EXCHANGE_INSTRUCTION_SPEC = InputsTargetsSpec("{question}", "{response}", "stack-exchange-instruction")
+STARCODER_SELF_INSTRUCT_SPEC = InputsTargetsSpec("{instruction}", "{output}", "starcoder-self-instruct")
+JOKE_EXPLANATION_SPEC = InputsTargetsSpec("{joke}\n\nExplain this joke.", "{explaination}", "joke-explanation")
+BOOK_SUMMARIES_SPEC = InputsTargetsSpec(
+    TextSpec(["{input}", "Summarize the above text:"], sep="\n\n\n", strip_parts=True), "{output}", "summary")
+SEACROWD_SPEC = InputsTargetsSpec("{question}", "{answer}", "{user_parent}")
+TOOL_LLAMA_SPEC = InputsTargetsSpec("{context}{instruction}", "{response}", "toolbench")
+MATHINSTRUCT_SPEC = InputsTargetsSpec("{instruction}", "{output}", "{_source}")
+GORILLA_SPEC = InputsTargetsSpec("{instruction}", "{response}", "gorilla-apibench")
+PMC_LLAMA_SPEC = InputsTargetsSpec("{instruction}{input}", "{output}", "{source}")
+MEDICAL_MEADOW_SPEC = InputsTargetsSpec("{instruction}{input}", "{output}", "{_source}")
+MEDINSTRUCT_SPEC = InputsTargetsSpec("{instruction}{input}", "{output}", "medinstruct")
+CHATDOCTOR_SPEC = InputsTargetsSpec("{input}", "{output}", "{_source}")
+CIDAR_SPEC = InputsTargetsSpec("{instruction}", "{output}", "cidar")
+PII_MASKING_200K_SPEC = InputsTargetsSpec(
+    "{source_text}\n\nGiven the previous paragraph, please mask any personally identifiable information "
+    "using masks, such as [FIRSTNAME_1], [AGE_2], [GENDER_1], or [COUNTRY_2],..",
+    "{target_text}",
+    "pii-masking-200k",
+)
+NO_ROBOTS_SPEC = InputsTargetsSpec("{messages[0][content]}", "{messages[1][content]}", "{category}")
+HELP_STEER_SPEC = InputsTargetsSpec("{prompt}", "{response}", "HelpSteer")
+ORCA_MATH_SPEC = InputsTargetsSpec("{question}", "{answer}", "orca-math")
+AYA_DATASET_SPEC = InputsTargetsSpec("{inputs}", "{targets}", "{language_code}")
+MEGAWIKA_SPEC = InputsTargetsSpec("{input}", "{output}", "{source}")
+GRETEL_TEXT_TO_SQL_SPEC = InputsTargetsSpec(
+    "Here is how the SQL table was created:\n\n{sql_context}\n\n{sql_prompt}", "{sql}", "gretel_text_to_sql")
+EXPERTQA_SPEC = InputsTargetsSpec("{question}", "{answer}", "expert_qa")
+OPENMATH_INSTRUCT_SPEC = InputsTargetsSpec("{question}", "{generated_solution}", "{dataset}")
+REASONING_SPEC = InputsTargetsSpec("{instruction}", TextSpec(["{reasoning}", "{output}"], sep="\n"), "reasoning-0.01")
+INST_AR_SPEC = InputsTargetsSpec("{instruction}", "{output}", "{source}")
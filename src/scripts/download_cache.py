@@ -0,0 +1,53 @@
+"""
+# usage (within repo root):
+python src/scripts/download_cache.py ls
+python src/scripts/download_cache.py gc --max-size 20GB
+
+Lists, or garbage collects, the content-addressed download cache (see `helpers/download_cache.py`).
+`gc` evicts the least recently used files until the cache fits in `--max-size`.
+"""
+
+import argparse
+import sys
+from datetime import datetime
+
+sys.path.append("src/")
+from helpers import constants, download_cache
+
+
+SIZE_UNITS = {"B": 1, "KB": 10**3, "MB": 10**6, "GB": 10**9, "TB": 10**12}
+
+
+def parse_size(size):
+    """Parses sizes like `500MB` or `20GB` (or a number of bytes)."""
+    size = size.strip().upper()
+    for unit in sorted(SIZE_UNITS, key=len, reverse=True):
+        if size.endswith(unit):
+            return int(float(size[:-len(unit)]) * SIZE_UNITS[unit])
+    return int(size)
+
+
+def list_entries(cache):
+    entries = sorted(cache.entries.items(), key=lambda item: item[1]["last_used"], reverse=True)
+    for key, entry in entries:
+        last_used = datetime.fromtimestamp(entry["last_used"]).strftime("%Y-%m-%d %H:%M")
+        print(f"{entry['size'] / 1e6:>10.1f} MB  {last_used}  {entry['sha256'][:12]}  {key}  {', '.join(entry['collections'])}")
+    total = sum({entry["sha256"]: entry["size"] for entry in cache.entries.values()}.values())
+    print(f"{len(entries)} entries, {total / 1e9:.2f} GB in {cache.cache_dir}")
+
+
+def main(args):
+    cache = download_cache.get_download_cache(args.cache_dir)
+    if args.command == "ls":
+        list_entries(cache)
+    elif args.command == "gc":
+        report = cache.gc(parse_size(args.max_size))
+        print(f"Removed {report['blobs_removed']} files ({report['bytes_removed'] / 1e9:.2f} GB), kept {report['bytes_kept'] / 1e9:.2f} GB.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the download cache.")
+    parser.add_argument("command", choices=["ls", "gc"], help="`ls` lists cached files, `gc` evicts the least recently used.")
+    parser.add_argument("--cache-dir", default=constants.DOWNLOAD_CACHE_DIR, help="The download cache directory.")
+    parser.add_argument("--max-size", default="20GB", help="For `gc`, the size to shrink the cache to, e.g. `500MB` or `20GB`.")
+    main(parser.parse_args())
@@ -0,0 +1,89 @@
+"""
+# usage (within repo root), with `python src/filter_server.py` running:
+python src/scripts/load_test_filter_server.py --concurrency 8 --duration 30
+
+Sends random filter queries to the filter server from `--concurrency` client threads
+and reports throughput and latency percentiles.
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import urllib.request
+
+import numpy as np
+
+sys.path.append("src/")
+from helpers import io
+
+
+def random_query(rng, all_constants):
+    """A random query over the filters the data selection UI exposes."""
+    query = {
+        "license_use": rng.choice(["commercial", "unspecified", "non-commercial", "academic-only"]),
+        "license_sources": rng.sample(["DataProvenance", "HuggingFace", "GitHub"], rng.randint(1, 3)),
+        "license_attribution": rng.choice(["0", "1"]),
+        "license_sharealike": rng.choice(["0", "1"]),
+        "openai-license-override": rng.choice(["0", "1"]),
+        "model-generated": rng.choice(["0", "1"]),
+        "languages": rng.sample(sorted(all_constants["LANGUAGE_GROUPS"]), rng.randint(0, 2)),
+        "tasks": rng.sample(sorted(all_constants["TASK_GROUPS"]), rng.randint(0, 2)),
+        "domains": rng.sample(sorted(all_constants["DOMAIN_GROUPS"]), rng.randint(0, 1)),
+    }
+    if rng.random() < 0.3:
+        query["start-time"] = f"{rng.randint(2015, 2022)}-01-01"
+    return query
+
+
+def run_client(url, all_constants, data_card, deadline, seed, latencies, errors):
+    rng = random.Random(seed)
+    while time.perf_counter() < deadline:
+        body = json.dumps({"query": random_query(rng, all_constants), "data_card": data_card}).encode("utf-8")
+        request = urllib.request.Request(f"{url}/filter", data=body, headers={"Content-Type": "application/json"})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+            latencies.append(time.perf_counter() - start)
+        except Exception as e:
+            errors.append(str(e))
+
+
+def main(args):
+    all_constants = io.read_all_constants("constants/")
+    latencies, errors = [], []
+    deadline = time.perf_counter() + args.duration
+    clients = [
+        threading.Thread(
+            target=run_client,
+            args=(args.url, all_constants, not args.no_data_card, deadline, args.seed + i, latencies, errors),
+        )
+        for i in range(args.concurrency)
+    ]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+
+    if not latencies:
+        print(f"No successful requests. Errors: {errors[:5]}")
+        return
+    latencies_ms = 1000 * np.array(latencies)
+    print(f"Requests: {len(latencies)} ok, {len(errors)} failed, over {args.duration}s with {args.concurrency} clients")
+    print(f"Throughput: {len(latencies) / args.duration:.1f} req/s")
+    for p in [50, 90, 99]:
+        print(f"p{p}: {np.percentile(latencies_ms, p):.2f} ms")
+    print(f"max: {latencies_ms.max():.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the filter server.")
+    parser.add_argument("--url", default="http://127.0.0.1:8765", help="Filter server URL.")
+    parser.add_argument("--concurrency", default=8, type=int, help="Number of concurrent clients.")
+    parser.add_argument("--duration", default=30, type=float, help="Seconds to run for.")
+    parser.add_argument("--no-data-card", action="store_true", help="Only request UIDs and collections, not the data card.")
+    parser.add_argument("--seed", default=0, type=int, help="Random seed for the queries.")
+    main(parser.parse_args())
@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+from helpers import io
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SUMMARY_DIR = os.path.join(REPO_DIR, "data_summaries")
+CONSTANTS_DIR = os.path.join(REPO_DIR, "constants")
+
+
+class TestIncrementalCatalog(unittest.TestCase):
+    """Checks that patching the catalog after edits gives the same catalog as a full rebuild."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.summary_dir = os.path.join(self.tmpdir.name, "data_summaries")
+        self.constants_dir = os.path.join(self.tmpdir.name, "constants")
+        self.cache_dir = os.path.join(self.tmpdir.name, "cache")
+        shutil.copytree(SUMMARY_DIR, self.summary_dir)
+        shutil.copytree(CONSTANTS_DIR, self.constants_dir)
+        io.load_catalog(self.summary_dir, self.constants_dir, cache_dir=self.cache_dir)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def load(self, **kwargs):
+        return io.load_catalog(self.summary_dir, self.constants_dir, cache_dir=self.cache_dir, **kwargs)
+
+    def assert_matches_full_rebuild(self, catalog):
+        expected = io.load_catalog(
+            self.summary_dir, self.constants_dir, cache_dir=os.path.join(self.tmpdir.name, "full"), rebuild=True)
+        pd.testing.assert_frame_equal(expected, catalog)
+
+    def test_unchanged(self):
+        catalog = self.load()
+        self.assertEqual(catalog.attrs["catalog_update"], {})
+
+    def test_edit_collection(self):
+        collection_fp = os.path.join(self.summary_dir, "Dolly 15k.json")
+        summary = io.read_json(collection_fp)
+        uid = next(iter(summary))
+        summary[uid]["Licenses"] = [{"License": "MIT", "License URL": ""}]
+        summary[uid]["Inferred Metadata"] = {}
+        io.write_json(summary, collection_fp)
+
+        catalog = self.load()
+        self.assertEqual(catalog.attrs["catalog_update"]["collections_rebuilt"], [collection_fp])
+        self.assertEqual(catalog.set_index("Unique Dataset Identifier").loc[uid, "License Use (DataProvenance)"], "commercial")
+        self.assert_matches_full_rebuild(catalog)
+
+    def test_add_and_remove_collection(self):
+        os.rename(
+            os.path.join(self.summary_dir, "Dolly 15k.json"),
+            os.path.join(self.summary_dir, "AAA Dolly 15k.json"))
+        os.remove(os.path.join(self.summary_dir, "Flan Collection (P3).json"))
+
+        catalog = self.load()
+        self.assertEqual(len(catalog.attrs["catalog_update"]["collections_removed"]), 2)
+        self.assert_matches_full_rebuild(catalog)
+
+    def test_edit_license_classes(self):
+        license_classes_fp = os.path.join(self.constants_dir, "license_classes.json")
+        license_classes = io.read_json(license_classes_fp)
+        license_classes["MIT License"] = ["NC", "1", "1"]
+        io.write_json(license_classes, license_classes_fp)
+
+        catalog = self.load()
+        report = catalog.attrs["catalog_update"]
+        self.assertEqual(report["collections_rebuilt"], [])
+        self.assertGreater(report["rows_relicensed"], 0)
+        self.assertLess(report["rows_relicensed"], len(catalog))
+        self.assert_matches_full_rebuild(catalog)
+
+
+if __name__ == "__main__":
+    unittest.main()
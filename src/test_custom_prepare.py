@@ -0,0 +1,93 @@
+import random
+import unittest
+
+from datasets import Dataset
+
+import preparers
+from downloader import Downloader, partition_order
+
+
+def open_assistant_rows(rng, num_trees):
+    """Message trees of Open Assistant, each listed from its root, with replies to random earlier messages."""
+    rows = []
+    for tree in range(num_trees):
+        for i in range(rng.randint(1, 8)):
+            rows.append({
+                "message_tree_id": f"tree-{tree}", "message_id": f"tree-{tree}-{i}",
+                "parent_id": f"tree-{tree}-{rng.randrange(i)}" if i else None,
+                "role": "prompter" if i % 2 == 0 else "assistant",
+                "text": f' "message" {i} ', "lang": rng.choice(["en", "es"]),
+            })
+    return rows
+
+
+def tiny_stories_rows(rng, num_stories):
+    rows = []
+    for story in range(num_stories):
+        rows.append({"text": f"Features: Dialogue {story}"})
+        rows.append({"text": "Story: "})
+        rows.extend({"text": f"Line {i} of story {story}."} for i in range(rng.randint(0, 4)))
+        rows.append({"text": ""})
+    return rows
+
+
+class TestCustomPrepare(unittest.TestCase):
+    """Checks collections prepared by partition prepare the same dialogs as the whole dataset at once."""
+
+    UID_KEY_MAPPER = {"oasst-en": ["en"], "oasst-es": ["es"]}
+
+    def downloader(self, rows, partition_key):
+        return Downloader(
+            "Open Assistant", lambda _: rows, preparers.prepare_open_assistant, self.UID_KEY_MAPPER,
+            custom_prepare=True, partition_key=partition_key)
+
+    def test_partitions_match_whole_dataset(self):
+        rows = open_assistant_rows(random.Random(0), 300)
+        expected = self.downloader(rows, None).download_and_prepare([])
+        self.assertEqual(len(expected), len({row["message_tree_id"] for row in rows if row["parent_id"]}))
+        for dset in [rows, Dataset.from_list(rows)]:
+            for debug in [True, False]:
+                downloader = self.downloader(dset, "message_tree_id")
+                self.assertEqual(expected, downloader.download_and_prepare([], debug=debug))
+                chunks = downloader.iter_prepared_chunks([], 50, debug=debug, skip=10)
+                self.assertEqual(expected[10:], [dialog for chunk in chunks for dialog in chunk])
+
+    def test_interleaved_partitions(self):
+        rng = random.Random(1)
+        rows = open_assistant_rows(rng, 100)
+        # Interleave the trees, keeping the order of each tree's messages.
+        trees = {}
+        for row in rows:
+            trees.setdefault(row["message_tree_id"], []).append(row)
+        remaining = [list(reversed(tree_rows)) for tree_rows in trees.values()]
+        interleaved = []
+        while remaining:
+            tree_rows = rng.choice(remaining)
+            interleaved.append(tree_rows.pop())
+            if not tree_rows:
+                remaining.remove(tree_rows)
+
+        # Grouped again in order of each tree's first message.
+        first_rows = {}
+        for i, row in enumerate(interleaved):
+            first_rows.setdefault(row["message_tree_id"], i)
+        regrouped = sorted(interleaved, key=lambda row: first_rows[row["message_tree_id"]])
+        order, sizes = partition_order([row["message_tree_id"] for row in interleaved])
+        self.assertEqual(regrouped, [interleaved[i] for i in order])
+        self.assertEqual([len(trees[tree]) for tree in first_rows], list(sizes))
+        self.assertEqual(
+            self.downloader(regrouped, None).download_and_prepare([]),
+            self.downloader(interleaved, "message_tree_id").download_and_prepare([]))
+
+    def test_tiny_stories(self):
+        rows = tiny_stories_rows(random.Random(3), 200) + [{"text": ""}, {"text": "Story: unterminated"}]
+        downloader = Downloader(
+            "Tiny Stories", lambda _: rows, preparers.prepare_tiny_stories, {"tiny-stories": ["tiny-stories"]},
+            custom_prepare=True, partition_key=preparers.tiny_stories_partitions)
+        expected = preparers.prepare_tiny_stories(rows)
+        self.assertEqual(len(expected), 202)
+        self.assertEqual(expected, downloader.download_and_prepare([]))
+
+
+if __name__ == "__main__":
+    unittest.main()
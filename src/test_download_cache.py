@@ -0,0 +1,44 @@
+import os
+import tempfile
+import unittest
+
+from helpers.download_cache import DownloadCache
+
+
+class TestSharedDownloadCache(unittest.TestCase):
+    """Checks two `DownloadCache`s on the same directory, as two runs at once have, keep each other's entries."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.cache_dir = os.path.join(self.tmpdir.name, "cache")
+
+    def test_puts_are_merged(self):
+        a, b = DownloadCache(self.cache_dir), DownloadCache(self.cache_dir)
+        a.put_bytes("url:A", b"aaa")
+        b.put_bytes("url:B", b"bbb")
+        a.put_bytes("url:C", b"ccc")
+        self.assertEqual({"url:A", "url:B", "url:C"}, set(DownloadCache(self.cache_dir).entries))
+        # Each sees the other's downloads, without re-reading the manifest itself.
+        self.assertEqual(b"bbb", open(a.blob_path(a.get("url:B")["sha256"]), "rb").read())
+        self.assertEqual(b"ccc", open(b.blob_path(b.get("url:C")["sha256"]), "rb").read())
+        self.assertFalse([f for f in os.listdir(self.cache_dir) if f.endswith(".tmp")])
+
+    def test_gc_keeps_blobs_of_other_instances(self):
+        a, b = DownloadCache(self.cache_dir), DownloadCache(self.cache_dir)
+        entry_a = a.put_bytes("url:A", b"aaa")
+        entry_b = b.put_bytes("url:B", b"bbb")
+        report = b.gc(max_bytes=10)
+        self.assertEqual(0, report["blobs_removed"])
+        self.assertTrue(os.path.exists(a.blob_path(entry_a["sha256"])))
+        self.assertTrue(os.path.exists(b.blob_path(entry_b["sha256"])))
+        self.assertIsNotNone(a.get("url:A"))
+
+        # Over budget, the least recently used blob is evicted, whichever instance added it.
+        report = a.gc(max_bytes=3)
+        self.assertEqual(1, report["blobs_removed"])
+        self.assertEqual(1, len(DownloadCache(self.cache_dir).entries))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+import codecs
+import os
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+
+from datasets import Dataset
+
+import downloaders
+
+
+# Downloaders that filter their Hugging Face split on a column --> that column.
+FILTERED_DOWNLOADERS = {
+    downloaders.download_flan_collection_sni: "task_name",
+    downloaders.download_flan_collection_cot: "task_name",
+    downloaders.download_flan_collection_dialog: "task_name",
+    downloaders.download_flan_collection_flan2021: "task_name",
+    downloaders.download_flan_collection_p3: "task_name",
+    downloaders.download_dolly_15k: "category",
+    downloaders.download_thai_gen_ai_dolly: "category",
+    downloaders.download_capybara: "source",
+    downloaders.download_stanford_human_preferences: "domain",
+    downloaders.download_open_assistant: "lang",
+    downloaders.download_open_assistant_v2: "lang",
+    downloaders.download_longform: "source",
+    downloaders.download_deita_10k: "source",
+    downloaders.download_metamathqa: "type",
+    downloaders.download_gpt4all: "source",
+    downloaders.download_tasksource_instruct: "task",
+    downloaders.download_tasksource_symbol_tuning: "task",
+    downloaders.download_ultraFeedback_argilla: "source",
+    downloaders.download_book_summaries: "type",
+    downloaders.download_no_robots: "category",
+    downloaders.download_wildchat: "model",
+    downloaders.download_seacrowd: "user_parent",
+    downloaders.download_lima: "source",
+    downloaders.download_pmc_llama: "source",
+    downloaders.download_seabench: "lang",
+    downloaders.download_open_platypus: "data_source",
+    downloaders.download_openmath_instruct: "dataset",
+    downloaders.download_lumos_planning: "dataset",
+    downloaders.download_lumos_grounding: "dataset",
+    downloaders.download_dynosaur: "taskname",
+    downloaders.download_inst_ar: "source",
+}
+COLUMNS = sorted(set(FILTERED_DOWNLOADERS.values()) | {"language"})
+VALUES = ["kept", "dropped", "also-kept"]
+ACCEPTED = ["kept", "also-kept"]
+
+
+def hub_rows():
+    """Rows with every filtered column, and each value in turn in every column."""
+    return [
+        {"i": i, **{column: VALUES[i % len(VALUES)] for column in COLUMNS},
+         "question": {"dataset": VALUES[i % len(VALUES)]}, "id": f"{VALUES[i % len(VALUES)]}.{i}"}
+        for i in range(12)
+    ]
+
+
+def fake_huggingface_download(
+    data_address, name=None, data_dir=None, data_files=None, split=None, as_list=True,
+    filter_column=None, accepted_values=None,
+):
+    """`huggingface_download` without the Hub, filtering the same way on a Dataset of `hub_rows`."""
+    dset = Dataset.from_list(hub_rows())
+    if filter_column:
+        dset = downloaders.pool_filter(dset, filter_column, accepted_values)
+    return dset if not as_list else dset.to_list()
+
+
+class TestDownloaders(unittest.TestCase):
+    """Checks downloaders return the same rows as filtering every downloaded row, with a stubbed Hub."""
+
+    def setUp(self):
+        patcher = mock.patch.object(downloaders, "huggingface_download", side_effect=fake_huggingface_download)
+        self.hub = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def expected_ids(self, column):
+        return [row["i"] for row in hub_rows() if row[column] in ACCEPTED]
+
+    def test_filtered_downloaders(self):
+        for download_fn, column in FILTERED_DOWNLOADERS.items():
+            with self.subTest(download_fn.__name__):
+                dset = download_fn(ACCEPTED)
+                self.assertIsNotNone(dset)
+                self.assertEqual(self.expected_ids(column), [row["i"] for row in dset])
+
+    def test_derived_filter_columns(self):
+        webgpt = downloaders.download_openai_webgpt(ACCEPTED)
+        self.assertEqual(self.expected_ids("dataset"), [row["i"] for row in webgpt])
+        self.assertTrue(all(row["dataset"] == row["question"]["dataset"] for row in webgpt))
+        open_orca = downloaders.download_open_orca(ACCEPTED)
+        self.assertEqual(self.expected_ids("source"), [row["i"] for row in open_orca])
+        self.assertTrue(all(row["id"].startswith(row["source"] + ".") for row in open_orca))
+
+    def test_xp3x_sample(self):
+        dset = downloaders.download_xp3x_sample(["kept/task-a", "also-kept/task-b"])
+        self.assertEqual(2 * self.expected_ids("language"), [row["i"] for row in dset])
+
+    def test_subsets(self):
+        # Every subset is downloaded, and its rows annotated with it.
+        for download_fn in [downloaders.download_laion_oig, downloaders.download_bactrianx]:
+            with self.subTest(download_fn.__name__):
+                dset = download_fn(["first", "second"])
+                self.assertEqual(2 * len(hub_rows()), len(dset))
+                self.assertEqual(
+                    ["first"] * len(hub_rows()) + ["second"] * len(hub_rows()), [row["_source"] for row in dset])
+
+    def test_pool_filter_types(self):
+        rows = [{"i": i, "number": i % 3, "name": str(i % 3)} for i in range(9)]
+        for candidates in [rows, Dataset.from_list(rows)]:
+            with self.subTest(type(candidates).__name__):
+                keep = lambda column, accepted: [row["i"] for row in downloaders.pool_filter(candidates, column, accepted)]
+                self.assertEqual([], keep("name", []))
+                self.assertEqual([], keep("name", set()))
+                # Values only match the same type, e.g. "1" never matches 1.
+                self.assertEqual([], keep("number", ["1"]))
+                self.assertEqual([], keep("name", [1]))
+                self.assertEqual([1, 4, 7], keep("number", [1, "2"]))
+                self.assertEqual([2, 5, 8], keep("name", ["2", 1]))
+
+    def test_zipped_json_with_bom(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            zip_fp = os.path.join(tmpdir, "records.zip")
+            with zipfile.ZipFile(zip_fp, "w") as z:
+                z.writestr("0.json", codecs.BOM_UTF8 + b'{"i": 0}')
+                z.writestr("1.json", b'{\r\n  "i": 1\r\n}')
+            for _ in range(2):  # Reading the zip, then the cached lines.
+                rows = downloaders.process_zipped_file(zip_fp, cache_dir=os.path.join(tmpdir, "cache"))
+                self.assertEqual([{"i": 0}, {"i": 1}], list(rows))
+
+    def test_unfiltered_downloaders(self):
+        for download_fn in [
+            downloaders.download_commitpackft, downloaders.download_lmsys_chat_1m, downloaders.download_conifer,
+        ]:
+            with self.subTest(download_fn.__name__):
+                dset = list(download_fn(["python"]))
+                self.assertEqual(list(range(len(hub_rows()))), [row["i"] for row in dset])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+import os
+import random
+import tempfile
+import unittest
+import warnings
+
+import pandas as pd
+
+from helpers import io, filters
+from helpers.filter_index import FilterIndex
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SUMMARY_DIR = os.path.join(REPO_DIR, "data_summaries")
+CONSTANTS_DIR = os.path.join(REPO_DIR, "constants")
+
+
+class TestFilterIndexEquivalence(unittest.TestCase):
+    """Property-based check that `FilterIndex` matches `filters.apply_filters` on random filter combinations."""
+
+    NUM_CASES = 200
+
+    @classmethod
+    def setUpClass(cls):
+        # `apply_filters` assigns into DataFrame slices for the GitHub license override.
+        warnings.simplefilter("ignore", pd.errors.SettingWithCopyWarning)
+        cls.all_constants = io.read_all_constants(CONSTANTS_DIR)
+        cls.catalog = io.load_catalog(SUMMARY_DIR, CONSTANTS_DIR, rebuild=True, cache_dir=tempfile.mkdtemp())
+        cls.index = FilterIndex(cls.catalog, cls.all_constants)
+        cls.tmpdir = tempfile.TemporaryDirectory()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmpdir.cleanup()
+
+    def random_filters(self, rng, case_id):
+        """Samples a random set of `apply_filters` arguments."""
+        def maybe(value, p=0.5):
+            return value if rng.random() < p else None
+
+        def subset(options, max_size):
+            return rng.sample(sorted(options), rng.randint(0, max_size))
+
+        def date():
+            return f"{rng.randint(2000, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+
+        text_source_allow_list = None
+        if rng.random() < 0.2:
+            all_sources = {s for sources in self.catalog["Text Sources"] for s in sources}
+            text_source_allow_list = os.path.join(self.tmpdir.name, f"sources_{case_id}.txt")
+            io.write_txt(text_source_allow_list, "\n".join(subset(all_sources, len(all_sources))))
+
+        return {
+            "selected_collection": maybe(rng.choice(sorted(set(self.catalog["Collection"]))), 0.2),
+            "selected_datasets": maybe(rng.sample(list(self.catalog["Unique Dataset Identifier"]), 300), 0.2),
+            "selected_licenses": maybe(["MIT"], 0.2),
+            "selected_license_use": maybe(rng.choice(["commercial", "unspecified", "non-commercial", "academic-only"]), 0.8),
+            "openai_license_override": rng.randint(0, 1),
+            "selected_license_attribution": maybe(rng.choice(["0", "1"])),
+            "selected_license_sharealike": maybe(rng.choice(["0", "1"])),
+            "selected_languages": subset(self.all_constants["LANGUAGE_GROUPS"].keys(), 2),
+            "selected_task_categories": subset(self.all_constants["TASK_GROUPS"].keys(), 2),
+            "selected_domains": subset(self.all_constants["DOMAIN_GROUPS"].keys(), 2),
+            "no_synthetic_data": rng.random() < 0.3,
+            "text_source_allow_list": text_source_allow_list,
+            "selected_start_time": maybe(date(), 0.2),
+            "selected_end_time": maybe(date(), 0.2),
+            "selected_license_sources": subset(["DataProvenance", "HuggingFace", "GitHub"], 3) or ["DataProvenance"],
+            "dpi_undefined_license_override": rng.randint(0, 1),
+        }
+
+    def test_matches_apply_filters(self):
+        rng = random.Random(0)
+        num_compared = 0
+        for case_id in range(self.NUM_CASES):
+            kwargs = self.random_filters(rng, case_id)
+            try:
+                # `apply_filters` mutates both the DataFrame and the license sources list.
+                expected = filters.apply_filters(
+                    self.catalog.copy(), self.all_constants,
+                    **dict(kwargs, selected_license_sources=list(kwargs["selected_license_sources"])))
+            except (AssertionError, AttributeError):
+                # Some combinations fail inside `apply_filters` itself (e.g. its GitHub
+                # override sanity checks), so there is nothing to compare against.
+                continue
+            num_compared += 1
+
+            actual = self.index.filter(**kwargs)
+            self.assertEqual(
+                expected["Unique Dataset Identifier"].tolist(),
+                actual["Unique Dataset Identifier"].tolist(),
+                f"Filtered datasets differ for {kwargs}")
+            self.assertEqual(expected["Unique Dataset Identifier"].tolist(), self.index.filter_uids(**kwargs))
+            if not expected.empty:
+                pd.testing.assert_frame_equal(expected, actual)
+
+        self.assertGreater(num_compared, self.NUM_CASES // 2)
+
+    def test_batch_matches_mask(self):
+        rng = random.Random(1)
+        specs = [self.random_filters(rng, f"batch_{i}") for i in range(50)]
+        # Repeat specs, so some predicate masks and prefixes are shared.
+        specs += specs[:10]
+        membership, counts = self.index.batch(specs)
+        for i, spec in enumerate(specs):
+            mask = self.index.mask(**spec)
+            self.assertTrue((membership[i] == mask).all())
+            self.assertEqual(counts["Num Datasets"][i], mask.sum())
+            self.assertEqual(counts["Num Collections"][i], len(set(self.index.collections[mask])))
+            self.assertEqual(counts["Num Dialogs"][i], self.index.num_dialogs[mask].sum())
+
+        parallel_membership, parallel_counts = self.index.batch(specs, num_workers=2)
+        self.assertTrue((parallel_membership == membership).all())
+        pd.testing.assert_frame_equal(parallel_counts, counts)
+
+    def test_ignore_openai_github_override(self):
+        # `apply_filters` raises for this query (see `FilterIndex.github_override_rows`), so the
+        # expected datasets come from the catalog's license columns.
+        kwargs = {
+            "selected_license_use": "commercial", "openai_license_override": 1,
+            "selected_license_sources": ["DataProvenance"], "dpi_undefined_license_override": 1,
+        }
+        license_use = self.catalog["License Use (DataProvenance IgnoreOpenAI)"]
+        github_use = self.catalog["License Use (GitHub)"]
+        overridden = (license_use == "unspecified") & (github_use != "")
+        self.assertTrue(overridden.any())
+        expected = self.catalog[license_use.where(~overridden, github_use) == "commercial"]
+        self.assertEqual(expected["Unique Dataset Identifier"].tolist(), self.index.filter_uids(**kwargs))
+
+        with self.assertRaises(AssertionError):
+            filters.apply_filters(self.catalog.copy(), self.all_constants, **dict(
+                kwargs, selected_license_sources=list(kwargs["selected_license_sources"]),
+                selected_collection=None, selected_datasets=None, selected_licenses=[],
+                selected_license_attribution="1", selected_license_sharealike="1", selected_languages=[],
+                selected_task_categories=[], selected_domains=[], no_synthetic_data=False,
+                text_source_allow_list=None, selected_start_time=None, selected_end_time=None))
+
+    def test_does_not_mutate_catalog(self):
+        before = self.catalog.copy()
+        self.index.filter(
+            selected_license_use="commercial",
+            selected_license_sources=["DataProvenance"],
+            dpi_undefined_license_override=1,
+            selected_start_time="2020-01-01",
+        )
+        pd.testing.assert_frame_equal(before, self.catalog)
+
+
+if __name__ == "__main__":
+    unittest.main()
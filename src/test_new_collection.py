@@ -10,7 +10,7 @@ from collection_mapper import COLLECTION_FN_MAPPER
 from downloader import Downloader
 # from downloaders import pool_filter
 from download_and_filter import get_collection_to_uid_and_filter_ids
-from helpers import io, constants
+from helpers import io, constants, validation
 
 
 ATTRIBUTE_MAPPER = {
@@ -49,19 +49,20 @@ def test_collection_summary(
 ):
     """Tests the collection's data summary entries are valid."""
     CONSTANTS = io.read_all_constants("constants/")
+    ALLOWED_VALUES = validation.allowed_values(CONSTANTS)
 
     # All acceptable licenses
-    all_licenses = set(list(CONSTANTS["LICENSE_CLASSES"].keys()) + ["Custom"])
+    all_licenses = ALLOWED_VALUES["Licenses"] | {"Custom"}
     # All acceptable languages
-    all_langs = set([v for vs in CONSTANTS["LANGUAGE_GROUPS"].values() for v in vs])
+    all_langs = ALLOWED_VALUES["Languages"]
     # All acceptable task categories
-    all_tasks = set([v for vs in CONSTANTS["TASK_GROUPS"].values() for v in vs])
-    # All acceptable text generation models
-    all_models = set([v for vs in CONSTANTS["MODEL_GROUPS"].values() for v in vs])
+    all_tasks = ALLOWED_VALUES["Task Categories"]
+    # All acceptable text generation models (case sensitive here, unlike the catalog validation)
+    all_models = set(io.invert_constants(CONSTANTS, "MODEL_GROUPS"))
     # All acceptable creators groups
-    all_creators = set([v for vs in CONSTANTS["CREATOR_GROUPS"].values() for v in vs])
+    all_creators = ALLOWED_VALUES["Creators"]
     # All acceptable formats
-    all_formats = CONSTANTS["FORMATS"]
+    all_formats = ALLOWED_VALUES["Format"]
 
     # The collection must have an abbreviation that starts each dataset's Unique
     # Dataset Identifier (UDI). E.g., for Flan Collection, we use "fc" and a dataset
@@ -0,0 +1,110 @@
+import json
+import random
+import unittest
+
+import pyarrow as pa
+from datasets import Dataset
+
+import preparers
+from collection_mapper import COLLECTION_FN_MAPPER
+from downloader import Downloader
+
+
+# Texts that exercise stripping (including the whitespace only Python strips), empty parts, and the Dolly regex.
+TEXTS = [
+    "plain", "  padded  ", "", " ", "\n\ttabs\n", "\x1cfile separators\x1f", "\xa0no-break　",
+    "a [citation] b", "[1] leading", "trailing [2]", "multi\nline [x\ny] text", "{braces}", "unicode: 日本語  ",
+]
+
+
+def set_path(row, path, value):
+    """Sets `row[path[0]][path[1]]... = value`, creating the lists and dicts on the way."""
+    for key, next_key in zip(path, path[1:]):
+        default = [] if isinstance(next_key, int) else {}
+        if isinstance(key, int):
+            while len(row) <= key:
+                row.append(default if len(row) == key else type(default)())
+            row = row[key]
+        else:
+            row = row.setdefault(key, default)
+    row[path[-1]] = value
+
+
+def spec_paths(spec):
+    text_specs = [spec.inputs, spec.targets]
+    paths = [path for text_spec in text_specs for part in text_spec.parts for _, path in part if path]
+    return paths + [path for _, path in spec.parent if path]
+
+
+def random_rows(spec, rng, num_rows, none_rate=0.0):
+    rows = []
+    for _ in range(num_rows):
+        row = {}
+        for path in spec_paths(spec):
+            set_path(row, path, None if rng.random() < none_rate else rng.choice(TEXTS))
+        rows.append(row)
+    return rows
+
+
+class TestPrepareSpecs(unittest.TestCase):
+    """Checks each `prepare_spec` in `COLLECTION_FN_MAPPER` prepares exactly the same dialogs as its `prepare_function`."""
+
+    NUM_ROWS = 500
+
+    def spec_collections(self):
+        return {name: fns for name, fns in COLLECTION_FN_MAPPER.items() if fns.get("prepare_spec") is not None}
+
+    def assert_same_bytes(self, expected, actual, name):
+        self.assertEqual(
+            [json.dumps(dialog, ensure_ascii=False) for dialog in expected],
+            [json.dumps(dialog, ensure_ascii=False) for dialog in actual],
+            f"{name}: the prepare_spec output differs from the prepare_function")
+
+    def test_specs_match_preparers(self):
+        rng = random.Random(0)
+        self.assertGreater(len(self.spec_collections()), 40)
+        for name, fns in self.spec_collections().items():
+            rows = random_rows(fns["prepare_spec"], rng, self.NUM_ROWS)
+            expected = [fns["prepare_function"](row) for row in rows]
+            # As python rows (from most downloaders) and as a Hugging Face Dataset.
+            self.assert_same_bytes(expected, fns["prepare_spec"].prepare_batch(pa.Table.from_pylist(rows)), name)
+            dataset_batch = Dataset.from_list(rows).with_format("arrow")[:]
+            self.assert_same_bytes(expected, fns["prepare_spec"].prepare_batch(dataset_batch), name)
+
+    def test_specs_with_missing_values(self):
+        # Rows with None values: the spec must either match the preparer, or raise one of the
+        # errors `Downloader` falls back to the preparer on.
+        rng = random.Random(1)
+        for name, fns in self.spec_collections().items():
+            for _ in range(20):
+                rows = random_rows(fns["prepare_spec"], rng, 5, none_rate=0.2)
+                try:
+                    expected = [fns["prepare_function"](row) for row in rows]
+                except (AttributeError, TypeError):
+                    continue
+                try:
+                    actual = fns["prepare_spec"].prepare_batch(pa.Table.from_pylist(rows))
+                except (pa.ArrowException, KeyError, TypeError, ValueError):
+                    continue
+                self.assert_same_bytes(expected, actual, name)
+
+    def test_downloader_falls_back(self):
+        rows = random_rows(preparers.CODE_ALPACA_SPEC, random.Random(2), 100)
+        rows[10]["output"] = 1
+        downloader = Downloader(
+            "Code Alpaca", lambda _: rows, preparers.prepare_code_alpaca, {"code_alpaca": ["code_alpaca"]},
+            prepare_spec=preparers.CODE_ALPACA_SPEC)
+        with self.assertRaises(AttributeError):
+            downloader.download_and_prepare([], debug=True)
+
+        del rows[10]
+        expected = Downloader(
+            "Code Alpaca", lambda _: rows, preparers.prepare_code_alpaca, {"code_alpaca": ["code_alpaca"]},
+        ).download_and_prepare([], debug=True)
+        self.assert_same_bytes(expected, downloader.download_and_prepare([], debug=True), "Code Alpaca")
+        chunks = downloader.iter_prepared_chunks([], 30, debug=True)
+        self.assert_same_bytes(expected, [dialog for chunk in chunks for dialog in chunk], "Code Alpaca")
+
+
+if __name__ == "__main__":
+    unittest.main()